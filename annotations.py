@@ -0,0 +1,703 @@
+"""
+Annotations
+Overlay of polygon, line and point annotations (GeoJSON, e.g. QuPath exports)
+on the slide. Annotations are kept in flat NumPy arrays with a grid index in
+level 0 coordinates, so hundreds of thousands of shapes are drawn by a single
+graphics item that only touches the annotations in view. Millions of detected
+cells are shown as a point cloud, a density heatmap until zoomed in.
+"""
+
+import os
+import re
+import json
+import math
+import codecs
+import colorsys
+
+import numpy as np
+from PyQt5.QtCore import Qt, QRectF
+from PyQt5.QtGui import QColor, QImage, QPen, QPolygonF
+from PyQt5.QtWidgets import QGraphicsItem
+
+FEATURES_START = re.compile(r'"features"\s*:\s*\[')
+
+
+class ReadStopped(Exception):
+    """Raised by the progress check of iter_geojson_features to stop reading"""
+
+
+def iter_geojson_features(path, chunk_size=1 << 20, progress=None):
+    """
+    Yield the features of a GeoJSON file one at a time
+
+    The file is read in chunks and each feature is decoded on its own, so a
+    large FeatureCollection is never held in memory as one object.
+    :param path: GeoJSON file with a FeatureCollection, a list of features or a single feature
+    :param chunk_size: Bytes read at a time
+    :param progress: Function called with the fraction of the file read after each chunk,
+        returning False stops reading
+    :raises ValueError: If the file isn't valid JSON
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    total = max(1, os.path.getsize(path))
+
+    with open(path, 'rb') as file:
+        buffer = ''
+        position = 0
+        done = 0
+        eof = False
+
+        def read_more():
+            nonlocal buffer, position, done, eof
+            chunk = file.read(chunk_size)
+            done += len(chunk)
+            eof = not chunk
+            # Drop what was decoded already
+            buffer = buffer[position:] + text_decoder.decode(chunk, final=eof)
+            position = 0
+            if progress is not None and progress(done / total) is False:
+                raise ReadStopped
+
+        def skip(characters):
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in characters:
+                    position += 1
+                if position < len(buffer) or eof:
+                    return
+                read_more()
+
+        try:
+            read_more()
+            skip(' \t\r\n')
+            if buffer.startswith('[', position):
+                position += 1
+            else:
+                # The feature array of a FeatureCollection, or the file is a single feature
+                while True:
+                    match = FEATURES_START.search(buffer)
+                    if match is not None:
+                        position = match.end()
+                        break
+                    if eof:
+                        feature = json.loads(buffer)
+                        if not isinstance(feature, dict):
+                            raise ValueError(f"{path} is not a GeoJSON feature or feature collection")
+                        if feature.get('type') == 'Feature':
+                            yield feature
+                        return
+                    # Keep the whole buffer, the key may span two chunks
+                    position = 0
+                    read_more()
+
+            while True:
+                skip(' \t\r\n,')
+                if position >= len(buffer):
+                    raise ValueError(f"Unexpected end of {path}")
+                if buffer[position] == ']':
+                    return
+                try:
+                    feature, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise ValueError(f"Invalid feature in {path} at character {position}")
+                    read_more()
+                    continue
+                if not isinstance(feature, dict):
+                    raise ValueError(f"Invalid feature in {path} at character {position}")
+                yield feature
+        except ReadStopped:
+            return
+
+
+def class_color(name):
+    """Default colour of an annotation class without one"""
+    if name is None:
+        return (255, 255, 0)
+    hue = (sum(name.encode('utf-8')) * 0.618033988749895) % 1.0
+    return tuple(int(value * 255) for value in colorsys.hsv_to_rgb(hue, 0.8, 1.0))
+
+
+def argb_values(colors):
+    """Opaque ARGB32 pixel values (uint32 array) of (r, g, b) colours"""
+    return np.array([0xFF000000 | red << 16 | green << 8 | blue for red, green, blue in colors] or [0], np.uint32)
+
+
+def feature_class(properties):
+    """Class name and (r, g, b) colour of a GeoJSON feature, QuPath style properties"""
+    properties = properties or {}
+    classification = properties.get('classification') or {}
+    if isinstance(classification, str):
+        classification = {'name': classification}
+    name = classification.get('name') or properties.get('name')
+    color = classification.get('color') or properties.get('color')
+    if color is None and 'colorRGB' in classification:
+        packed = classification['colorRGB'] & 0xFFFFFF
+        color = ((packed >> 16) & 255, (packed >> 8) & 255, packed & 255)
+    if color is None:
+        color = class_color(name)
+    return name, tuple(int(value) for value in color[:3])
+
+
+class AnnotationStore:
+    """Annotations in flat arrays with a uniform grid index (level 0 pixels)
+
+    Each annotation has one or more rings (outer boundaries and holes of
+    polygons, parts of lines, single vertex points). Vertices of all rings are
+    stored back to back in coords, addressed through offset arrays.
+    """
+
+    POLYGON = 0
+    LINE = 1
+    POINT = 2
+
+    def __init__(self, coords, ring_offsets, annotation_rings, kinds, classes, class_names, class_colors,
+                 cell_size=1024):
+        """
+        Initialize store and build its grid index
+        :param coords: Vertices, float32 array (vertices, 2)
+        :param ring_offsets: First vertex of each ring, with the vertex count appended
+        :param annotation_rings: First ring of each annotation, with the ring count appended
+        :param kinds: POLYGON, LINE or POINT of each annotation
+        :param classes: Index into class_names of each annotation
+        :param class_names: Class names, None for unclassified
+        :param class_colors: (r, g, b) of each class
+        :param cell_size: Grid cell size in level 0 pixels
+        """
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.annotation_rings = annotation_rings
+        self.kinds = kinds
+        self.classes = classes
+        self.class_names = class_names
+        self.class_colors = class_colors
+        self.cell_size = cell_size
+
+        # Bounds (x0, y0, x1, y1) of each annotation from the extent of its vertices
+        count = len(kinds)
+        self.bounds = np.zeros((count, 4), np.float32)
+        if count:
+            first_vertex = ring_offsets[annotation_rings[:-1]]
+            self.bounds[:, :2] = np.minimum.reduceat(coords, first_vertex)
+            self.bounds[:, 2:] = np.maximum.reduceat(coords, first_vertex)
+        self.build_index()
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @classmethod
+    def from_geojson(cls, path, progress=None, cell_size=1024):
+        """
+        Load annotations from a GeoJSON file, streaming its features
+        :param progress: Function called with the fraction of the file read, returning False cancels
+        :return: AnnotationStore, or None if cancelled
+        :raises ValueError: If the file isn't valid GeoJSON
+        """
+        cancelled = False
+
+        def report(fraction):
+            nonlocal cancelled
+            cancelled = progress(fraction) is False
+            return not cancelled
+
+        rings = []
+        ring_counts = []
+        kinds = []
+        classes = []
+        class_index = {}
+        class_colors = []
+
+        def add(kind, parts, name, color):
+            parts = [part for part in parts if len(part)]
+            if not parts:
+                return
+            if name not in class_index:
+                class_index[name] = len(class_colors)
+                class_colors.append(color)
+            rings.extend(parts)
+            ring_counts.append(len(parts))
+            kinds.append(kind)
+            classes.append(class_index[name])
+
+        def vertices(points):
+            if not len(points):
+                return np.zeros((0, 2), np.float32)
+            # Drops the z coordinate if present
+            return np.asarray(points, np.float32)[:, :2]
+
+        def add_geometry(geometry, name, color):
+            kind = geometry.get('type')
+            coordinates = geometry.get('coordinates')
+            if kind == 'Polygon':
+                add(cls.POLYGON, [vertices(ring) for ring in coordinates], name, color)
+            elif kind == 'MultiPolygon':
+                add(cls.POLYGON, [vertices(ring) for polygon in coordinates for ring in polygon], name, color)
+            elif kind == 'LineString':
+                add(cls.LINE, [vertices(coordinates)], name, color)
+            elif kind == 'MultiLineString':
+                add(cls.LINE, [vertices(line) for line in coordinates], name, color)
+            elif kind == 'Point':
+                add(cls.POINT, [vertices([coordinates])], name, color)
+            elif kind == 'MultiPoint':
+                # Separate annotations, so each point is indexed on its own
+                for point in coordinates:
+                    add(cls.POINT, [vertices([point])], name, color)
+            elif kind == 'GeometryCollection':
+                for part in geometry.get('geometries', []):
+                    add_geometry(part, name, color)
+
+        for feature in iter_geojson_features(path, progress=report if progress else None):
+            if not isinstance(feature, dict) or not feature.get('geometry'):
+                continue
+            try:
+                name, color = feature_class(feature.get('properties'))
+                add_geometry(feature['geometry'], name, color)
+            except (AttributeError, TypeError, IndexError) as e:
+                raise ValueError(f"Invalid geometry in {path}: {e}")
+        if cancelled:
+            return None
+
+        ring_offsets = np.zeros(len(rings) + 1, np.int64)
+        np.cumsum([len(ring) for ring in rings], out=ring_offsets[1:])
+        annotation_rings = np.zeros(len(ring_counts) + 1, np.int64)
+        np.cumsum(ring_counts, out=annotation_rings[1:])
+        coords = np.concatenate(rings) if rings else np.zeros((0, 2), np.float32)
+        class_names = [None] * len(class_index)
+        for name, index in class_index.items():
+            class_names[index] = name
+        return cls(coords, ring_offsets, annotation_rings, np.array(kinds, np.uint8),
+                   np.array(classes, np.int32), class_names, class_colors, cell_size)
+
+    def build_index(self):
+        """Sort annotation ids by the grid cells their bounds overlap (CSR layout)"""
+        count = len(self)
+        if not count:
+            self.grid_origin = (0, 0)
+            self.grid_shape = (1, 1)
+            self.cell_starts = np.zeros(2, np.int64)
+            self.cell_ids = np.zeros(0, np.int64)
+            return
+
+        self.grid_origin = (int(math.floor(self.bounds[:, 0].min())), int(math.floor(self.bounds[:, 1].min())))
+        cells = np.empty((count, 4), np.int64)
+        cells[:, 0::2] = (self.bounds[:, 0::2] - self.grid_origin[0]) // self.cell_size
+        cells[:, 1::2] = (self.bounds[:, 1::2] - self.grid_origin[1]) // self.cell_size
+        columns = int(cells[:, 2].max()) + 1
+        rows = int(cells[:, 3].max()) + 1
+        self.grid_shape = (columns, rows)
+
+        # One entry per (annotation, overlapped cell)
+        span_x = cells[:, 2] - cells[:, 0] + 1
+        span_y = cells[:, 3] - cells[:, 1] + 1
+        spans = span_x * span_y
+        ids = np.repeat(np.arange(count), spans)
+        local = np.arange(len(ids)) - np.repeat(np.cumsum(spans) - spans, spans)
+        cell = ((cells[ids, 1] + local // span_x[ids]) * columns
+                + cells[ids, 0] + local % span_x[ids])
+        order = np.argsort(cell, kind='stable')
+        self.cell_ids = ids[order]
+        self.cell_starts = np.searchsorted(cell[order], np.arange(columns * rows + 1))
+
+    def query(self, left, top, right, bottom):
+        """Ids (sorted) of the annotations whose bounds intersect a rectangle in level 0 pixels"""
+        if not len(self):
+            return self.cell_ids
+        columns, rows = self.grid_shape
+        column0 = max(0, int((left - self.grid_origin[0]) // self.cell_size))
+        column1 = min(columns - 1, int((right - self.grid_origin[0]) // self.cell_size))
+        row0 = max(0, int((top - self.grid_origin[1]) // self.cell_size))
+        row1 = min(rows - 1, int((bottom - self.grid_origin[1]) // self.cell_size))
+        if column0 > column1 or row0 > row1:
+            return self.cell_ids[:0]
+
+        # Cells of a row are contiguous in the index
+        parts = [self.cell_ids[self.cell_starts[row * columns + column0]:
+                               self.cell_starts[row * columns + column1 + 1]] for row in range(row0, row1 + 1)]
+        # Annotations in several cells are listed once per cell
+        found = np.zeros(len(self), bool)
+        for part in parts:
+            found[part] = True
+        ids = np.flatnonzero(found)
+        bounds = self.bounds[ids]
+        inside = ((bounds[:, 0] <= right) & (bounds[:, 2] >= left) &
+                  (bounds[:, 1] <= bottom) & (bounds[:, 3] >= top))
+        return ids[inside]
+
+    def ring_vertices(self, ring):
+        return self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+
+
+def simplify(points, tolerance):
+    """Drop consecutive vertices falling into the same cell of a tolerance sized grid
+
+    Keeps the first and last vertex. Much cheaper than Douglas-Peucker and
+    good enough when the tolerance is about a screen pixel.
+    """
+    if len(points) <= 4:
+        return points
+    cells = np.floor(points / tolerance)
+    keep = np.empty(len(points), bool)
+    keep[0] = True
+    keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+    keep[-1] = True
+    return points[keep]
+
+
+def polygon_from_array(points):
+    """QPolygonF of an (n, 2) array, filled through its buffer instead of per point"""
+    polygon = QPolygonF(len(points))
+    if len(points):
+        buffer = polygon.data()
+        buffer.setsize(len(points) * 16)
+        np.frombuffer(buffer, np.float64).reshape(-1, 2)[:] = points
+    return polygon
+
+
+def paint_dots(painter, area, x, y, colors, radius=1):
+    """
+    Draw dots of (2 * radius + 1) device pixels, all in one image
+    :param painter: QPainter with the item transform
+    :param area: Item rectangle to draw in
+    :param x: Item x coordinates of the dots (NumPy array)
+    :param y: Item y coordinates of the dots
+    :param colors: Opaque ARGB32 values (uint32) of the dots
+    """
+    world = painter.worldTransform()
+    device = world.mapRect(area).intersected(QRectF(painter.viewport())).toAlignedRect()
+    if device.isEmpty() or not len(x):
+        return
+
+    # The image has a margin of the dot radius, so dots near its edges need no clipping
+    width = device.width() + 2 * radius
+    height = device.height() + 2 * radius
+    x = (x * world.m11() + world.dx()).astype(np.int64) - device.left() + radius
+    y = (y * world.m22() + world.dy()).astype(np.int64) - device.top() + radius
+    inside = (x >= radius) & (x < width - radius) & (y >= radius) & (y < height - radius)
+    image = QImage(width, height, QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    pointer = image.bits()
+    pointer.setsize(image.sizeInBytes())
+    stride = image.bytesPerLine() // 4
+    pixels = np.frombuffer(pointer, np.uint32)
+    centres = y[inside] * stride + x[inside]
+    colors = colors[inside]
+    for offset_y in range(-radius, radius + 1):
+        for offset_x in range(-radius, radius + 1):
+            pixels[centres + offset_y * stride + offset_x] = colors
+    del pixels
+
+    painter.save()
+    painter.resetTransform()
+    painter.drawImage(device.left() - radius, device.top() - radius, image)
+    painter.restore()
+
+
+class AnnotationLayerItem(QGraphicsItem):
+    """Graphics item drawing the annotations of a store that are in view
+
+    Annotations smaller than a few screen pixels, and points, are drawn as dots
+    into one image, as are the smallest ones beyond MAX_SHAPES in view. The
+    others are drawn as outlines, simplified to the zoom level in powers of two
+    so simplified rings can be cached.
+    """
+
+    MIN_SHAPE_PIXELS = 4
+    MAX_SHAPES = 5000
+    DOT_RADIUS = 1
+
+    def __init__(self, store, bounds, cache_size=100000):
+        """
+        Initialize annotation layer
+        :param store: AnnotationStore
+        :param bounds: Slide rectangle (QRectF in level 0 pixels)
+        :param cache_size: Number of simplified rings to keep
+        """
+        super().__init__()
+        from wsi_viewer import LRUCache
+
+        self.store = store
+        self._bounds = QRectF(bounds)
+        self.polygons = LRUCache(cache_size)  # (ring, lod) -> QPolygonF
+        self.pens = []
+        for red, green, blue in store.class_colors:
+            pen = QPen(QColor(red, green, blue))
+            pen.setCosmetic(True)
+            pen.setWidthF(1.5)
+            self.pens.append(pen)
+        self.dot_colors = argb_values(store.class_colors)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        # Above all tile layers
+        self.setZValue(1)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def paint(self, painter, option, widget=None):
+        store = self.store
+        # Also limited to the painted device area, exposedRect covers the whole item when rendering to images
+        world = painter.worldTransform()
+        visible = world.inverted()[0].mapRect(QRectF(painter.viewport()))
+        exposed = option.exposedRect.intersected(self._bounds).intersected(visible)
+        if exposed.isEmpty() or not len(store):
+            return
+
+        ids = store.query(exposed.left(), exposed.top(), exposed.right(), exposed.bottom())
+        if not len(ids):
+            return
+
+        # Screen pixels per level 0 pixel
+        scale = option.levelOfDetailFromTransform(world)
+        bounds = store.bounds[ids]
+        size = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]) * scale
+        small = (size < self.MIN_SHAPE_PIXELS) | (store.kinds[ids] == store.POINT)
+        if np.count_nonzero(~small) > self.MAX_SHAPES:
+            # Keeps painting fast in crowded views, the largest shapes stay outlines
+            size[small] = -1
+            small[np.argpartition(size, -self.MAX_SHAPES)[:-self.MAX_SHAPES]] = True
+
+        # Centres of the small ones
+        bounds_small = bounds[small]
+        paint_dots(painter, exposed, (bounds_small[:, 0] + bounds_small[:, 2]) * 0.5,
+                   (bounds_small[:, 1] + bounds_small[:, 3]) * 0.5,
+                   self.dot_colors[store.classes[ids[small]]], self.DOT_RADIUS)
+
+        shapes = ids[~small]
+        if not len(shapes):
+            return
+        # Simplify with a tolerance of at most one screen pixel, in powers of two
+        lod = min(30, max(-4, math.floor(math.log2(1.0 / scale))))
+        tolerance = 2.0 ** lod
+        painter.setBrush(Qt.NoBrush)
+        # Group by class to set each pen once
+        shapes = shapes[np.argsort(store.classes[shapes], kind='stable')]
+        current_class = None
+        for annotation in shapes.tolist():
+            annotation_class = store.classes[annotation]
+            if annotation_class != current_class:
+                painter.setPen(self.pens[annotation_class])
+                current_class = annotation_class
+            closed = store.kinds[annotation] == store.POLYGON
+            for ring in range(store.annotation_rings[annotation], store.annotation_rings[annotation + 1]):
+                key = (ring, lod)
+                try:
+                    polygon = self.polygons[key]
+                except KeyError:
+                    polygon = polygon_from_array(simplify(store.ring_vertices(ring), tolerance))
+                    self.polygons[key] = polygon
+                if closed:
+                    painter.drawPolygon(polygon)
+                else:
+                    painter.drawPolyline(polygon)
+
+
+class PointCloud:
+    """Points (e.g. detected cells) sorted by the cells of a grid in level 0 pixels"""
+
+    def __init__(self, points, classes=None, class_names=None, cell_size=512):
+        """
+        Initialize point cloud
+        :param points: Level 0 coordinates, array (points, 2)
+        :param classes: Class index of each point, or None
+        :param class_names: Names of the classes
+        :param cell_size: Grid cell size in level 0 pixels
+        """
+        points = np.asarray(points, np.float32).reshape(-1, 2)
+        classes = np.zeros(len(points), np.int32) if classes is None else np.asarray(classes, np.int32)
+        self.class_names = list(class_names) if class_names is not None else \
+            [str(index) for index in range(int(classes.max()) + 1 if len(classes) else 1)]
+        self.class_colors = [class_color(name) for name in self.class_names]
+        self.cell_size = cell_size
+
+        # CSR layout: points of cell n are points[cell_starts[n]:cell_starts[n + 1]]
+        cells = np.maximum(points, 0).astype(np.int64) // cell_size
+        self.grid_shape = (int(cells[:, 0].max()) + 1, int(cells[:, 1].max()) + 1) if len(points) else (1, 1)
+        cell = cells[:, 1] * self.grid_shape[0] + cells[:, 0]
+        order = np.argsort(cell, kind='stable')
+        self.points = points[order]
+        self.classes = classes[order]
+        self.cell_starts = np.searchsorted(cell[order], np.arange(self.grid_shape[0] * self.grid_shape[1] + 1))
+
+        # Reference density (points per pixel) for the heatmap colours: the 99th
+        # percentile of the occupied cells, so single dense spots don't wash it out
+        counts = np.diff(self.cell_starts)
+        occupied = counts[counts > 0]
+        self.reference_density = max(float(np.percentile(occupied, 99)) if len(occupied) else 1.0, 1.0) \
+            / (cell_size * cell_size)
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load points from .npy (array of x, y and optionally class), .npz (arrays x, y and
+        optionally class), .csv / .tsv (columns x, y and optionally class, a header row
+        is skipped) or GeoJSON (points and centres of other shapes)
+        :raises ValueError: If the file has none of these layouts
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension in ('.geojson', '.json'):
+            store = AnnotationStore.from_geojson(path)
+            centres = (store.bounds[:, :2] + store.bounds[:, 2:]) * 0.5
+            return cls(centres, store.classes, [str(name) for name in store.class_names])
+        if extension == '.npz':
+            with np.load(path) as data:
+                if 'x' not in data or 'y' not in data:
+                    raise ValueError(f"{path} has no x and y arrays")
+                points = np.stack([data['x'], data['y']], axis=1)
+                return cls(points, data['class'] if 'class' in data else None)
+        if extension == '.npy':
+            data = np.load(path)
+        elif extension in ('.csv', '.tsv', '.txt'):
+            delimiter = '\t' if extension == '.tsv' else ','
+            with open(path) as file:
+                first = file.readline().split(delimiter)
+            try:
+                float(first[0])
+                header = 0
+            except ValueError:
+                header = 1
+            data = np.loadtxt(path, delimiter=delimiter, skiprows=header, ndmin=2,
+                              usecols=range(min(3, len(first))))
+        else:
+            raise ValueError(f"Unsupported point file {path}")
+        if data.ndim != 2 or data.shape[1] < 2:
+            raise ValueError(f"{path} has no x and y columns")
+        return cls(data[:, :2], data[:, 2] if data.shape[1] > 2 else None)
+
+    def query(self, left, top, right, bottom):
+        """Indices of the points within a rectangle in level 0 pixels"""
+        columns, rows = self.grid_shape
+        column0 = max(0, int(left // self.cell_size))
+        column1 = min(columns - 1, int(right // self.cell_size))
+        row0 = max(0, int(top // self.cell_size))
+        row1 = min(rows - 1, int(bottom // self.cell_size))
+        if column0 > column1 or row0 > row1 or not len(self):
+            return np.zeros(0, np.int64)
+
+        # Cells of a row are contiguous
+        indices = np.concatenate([np.arange(self.cell_starts[row * columns + column0],
+                                            self.cell_starts[row * columns + column1 + 1])
+                                  for row in range(row0, row1 + 1)])
+        points = self.points[indices]
+        inside = ((points[:, 0] >= left) & (points[:, 0] < right) &
+                  (points[:, 1] >= top) & (points[:, 1] < bottom))
+        return indices[inside]
+
+    def count(self, left, top, right, bottom):
+        """Upper bound of the points within a rectangle, from whole grid cells"""
+        columns, rows = self.grid_shape
+        column0 = max(0, int(left // self.cell_size))
+        column1 = min(columns - 1, int(right // self.cell_size))
+        row0 = max(0, int(top // self.cell_size))
+        row1 = min(rows - 1, int(bottom // self.cell_size))
+        if column0 > column1 or row0 > row1:
+            return 0
+        return int(sum(self.cell_starts[row * columns + column1 + 1] - self.cell_starts[row * columns + column0]
+                       for row in range(row0, row1 + 1)))
+
+    def density(self, left, top, bin_size, columns, rows):
+        """Point counts (rows, columns) of square bins starting at (left, top) in level 0 pixels"""
+        indices = self.query(left, top, left + bin_size * columns, top + bin_size * rows)
+        points = self.points[indices]
+        bin_x = ((points[:, 0] - left) // bin_size).astype(np.int64)
+        bin_y = ((points[:, 1] - top) // bin_size).astype(np.int64)
+        return np.bincount(bin_y * columns + bin_x, minlength=columns * rows).reshape(rows, columns)
+
+
+def heatmap_colors():
+    """Premultiplied ARGB32 values from transparent over yellow to opaque red"""
+    values = np.linspace(0.0, 1.0, 256)
+    alpha = np.clip(0.25 + values * 0.6, 0.0, 0.85)
+    alpha[0] = 0.0
+    red = np.ones(256)
+    green = np.clip(1.0 - values, 0.0, 1.0)
+    blue = np.zeros(256)
+    channels = [np.round(alpha * 255)] + [np.round(channel * alpha * 255) for channel in (red, green, blue)]
+    alpha, red, green, blue = (channel.astype(np.uint32) for channel in channels)
+    return alpha << 24 | red << 16 | green << 8 | blue
+
+
+class PointCloudLayerItem(QGraphicsItem):
+    """Graphics item drawing a point cloud as a density heatmap, or as markers when zoomed in
+
+    The heatmap is aggregated in tiles of TILE_BINS x TILE_BINS bins. Each
+    pyramid level k has bins of 2 ** k level 0 pixels, and is picked so a bin
+    covers a few screen pixels. Tiles are cached per level.
+    """
+
+    TILE_BINS = 256
+    BIN_PIXELS = 4
+    MAX_MARKERS = 50000
+    MARKER_RADIUS = 2
+
+    def __init__(self, cloud, bounds, marker_scale=0.25, cache_size=256):
+        """
+        Initialize point cloud layer
+        :param cloud: PointCloud
+        :param bounds: Slide rectangle (QRectF in level 0 pixels)
+        :param marker_scale: Zoom (screen pixels per level 0 pixel) from which points are drawn as markers
+        :param cache_size: Number of heatmap tiles to keep
+        """
+        super().__init__()
+        from wsi_viewer import LRUCache
+
+        self.cloud = cloud
+        self._bounds = QRectF(bounds)
+        self.marker_scale = marker_scale
+        self.tiles = LRUCache(cache_size)  # (level, column, row) -> QImage
+        self.colors = heatmap_colors()
+        self.marker_colors = argb_values(cloud.class_colors)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        # Above the tile layers, below annotation outlines
+        self.setZValue(0.5)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def paint(self, painter, option, widget=None):
+        cloud = self.cloud
+        world = painter.worldTransform()
+        visible = world.inverted()[0].mapRect(QRectF(painter.viewport()))
+        exposed = option.exposedRect.intersected(self._bounds).intersected(visible)
+        if exposed.isEmpty() or not len(cloud):
+            return
+
+        # Screen pixels per level 0 pixel
+        scale = option.levelOfDetailFromTransform(world)
+        left, top, right, bottom = exposed.left(), exposed.top(), exposed.right(), exposed.bottom()
+        if scale >= self.marker_scale and cloud.count(left, top, right, bottom) <= self.MAX_MARKERS:
+            indices = cloud.query(left, top, right, bottom)
+            points = cloud.points[indices]
+            paint_dots(painter, exposed, points[:, 0], points[:, 1],
+                       self.marker_colors[cloud.classes[indices]], self.MARKER_RADIUS)
+            return
+
+        level = max(0, math.ceil(math.log2(self.BIN_PIXELS / scale)))
+        extent = (2 ** level) * self.TILE_BINS
+        painter.save()
+        painter.setRenderHint(painter.SmoothPixmapTransform, True)
+        for row in range(int(top // extent), int(bottom // extent) + 1):
+            for column in range(int(left // extent), int(right // extent) + 1):
+                painter.drawImage(QRectF(column * extent, row * extent, extent, extent),
+                                  self.heatmap_tile(level, column, row))
+        painter.restore()
+
+    def heatmap_tile(self, level, column, row):
+        """Heatmap image of a tile, aggregated on first use"""
+        key = (level, column, row)
+        try:
+            return self.tiles[key]
+        except KeyError:
+            pass
+        bin_size = 2 ** level
+        extent = bin_size * self.TILE_BINS
+        counts = self.cloud.density(column * extent, row * extent, bin_size, self.TILE_BINS, self.TILE_BINS)
+        # Square root scale of the density relative to the reference density
+        values = np.sqrt(counts / (self.cloud.reference_density * bin_size * bin_size))
+        pixels = np.ascontiguousarray(self.colors[np.minimum(values * 255, 255).astype(np.uint8)])
+        image = QImage(pixels.data, self.TILE_BINS, self.TILE_BINS, self.TILE_BINS * 4,
+                       QImage.Format_ARGB32_Premultiplied).copy()
+        self.tiles[key] = image
+        return image
@@ -0,0 +1,71 @@
+"""
+Decode Workers
+Functions run by the process decode backend of the tile layer. Each worker
+process keeps its own OpenSlide handles and writes decoded pixels straight
+into shared memory allocated by the viewer process.
+"""
+
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_slides = OrderedDict()  # Path -> OpenSlide handle of this worker process
+MAX_OPEN_SLIDES = 8
+
+
+def get_slide(path):
+    """OpenSlide handle for path, opened once per worker process"""
+    import openslide
+
+    slide = _slides.get(path)
+    if slide is None:
+        slide = _slides[path] = openslide.OpenSlide(path)
+        if len(_slides) > MAX_OPEN_SLIDES:
+            _slides.popitem(last=False)[1].close()
+    else:
+        _slides.move_to_end(path)
+    return slide
+
+
+def warm_up():
+    """Import the decoding dependencies, so the first tiles aren't delayed by it"""
+    import openslide
+    import wsi_viewer
+    return True
+
+
+def decode_region(path, location, level, size, buffer_name, tiles=(), warm_format=None):
+    """
+    Read a region into shared memory as RGB32 pixels (B, G, R, 255 in memory)
+    :param path: Slide file
+    :param location: (x, y) in level 0 pixels
+    :param level: Image level
+    :param size: (width, height) in level pixels
+    :param buffer_name: Name of a SharedMemory block of width * height * 4 bytes
+    :param tiles: Tile bounds (x, y, width, height) within the region to compress
+    :param warm_format: Image format for the warm cache tier, or None
+    :return: Compressed tiles in the order of tiles, None entries without warm_format
+    """
+    width, height = size
+    pixels = np.asarray(get_slide(path).read_region(location, level, size))
+
+    # The viewer process owns the block and unlinks it once this returns
+    buffer = shared_memory.SharedMemory(name=buffer_name)
+    try:
+        target = np.ndarray((height, width, 4), np.uint8, buffer.buf)
+        target[..., :3] = pixels[..., 2::-1]
+        target[..., 3] = 255
+        del target
+    finally:
+        buffer.close()
+
+    if not warm_format:
+        return [None] * len(tiles)
+    from wsi_viewer import encode_tile, encode_uniform, uniform_color
+    encoded = []
+    for x, y, w, h in tiles:
+        view = pixels[y:y + h, x:x + w]
+        color = uniform_color(view)
+        encoded.append(encode_tile(view, warm_format) if color is None else encode_uniform(color, w, h))
+    return encoded
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Deep Zoom Tile Server
+Serves slides as Deep Zoom Images (DZI) over HTTP for browser based viewers
+such as OpenSeadragon. Deep Zoom tiles are composed from the viewer's tiles,
+so all clients share one TileManager cache and slide handle per slide.
+"""
+
+import os
+import io
+import html
+import math
+import socket
+import argparse
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+
+class DeepZoomSlide:
+    """Deep Zoom pyramid of one slide, backed by a TileManager"""
+
+    def __init__(self, path, tile_size=254, overlap=1, quality=75, cache_size=500):
+        """
+        Initialize Deep Zoom slide
+        :param path: Slide file
+        :param tile_size: Deep Zoom tile size without overlap
+        :param overlap: Pixels shared with each neighbouring tile
+        :param quality: JPEG quality of the served tiles
+        :param cache_size: Viewer tile cache capacity in tiles
+        """
+        import openslide
+        from wsi_viewer import TileManager, LRUCache
+        from shared_tile_cache import SharedTileCache
+
+        self.path = path
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.quality = quality
+        self.slide = openslide.OpenSlide(path)
+        self.tile_manager = TileManager(cache_size=cache_size, shared_cache=SharedTileCache.from_environment())
+        self.tile_manager.set_slide(self.slide, path)
+
+        stat = os.stat(path)
+        self.mtime = stat.st_mtime
+        self.etag_base = f'{int(stat.st_mtime)}-{stat.st_size}'
+
+        # Deep Zoom levels halve the size from level 0 down to a single pixel
+        width, height = self.slide.dimensions
+        self.level_count = int(math.ceil(math.log2(max(width, height)))) + 1
+        self.level_dimensions = []
+        for level in range(self.level_count):
+            scale = 2 ** (self.level_count - 1 - level)
+            self.level_dimensions.append((max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale))))
+
+        # Encoded tiles, so repeated requests skip resizing and JPEG encoding
+        self.encoded = LRUCache(4096, sizeof=len, max_bytes=64 * 1024 * 1024)
+        self.encoded_lock = threading.Lock()
+
+    def descriptor(self):
+        """DZI XML descriptor"""
+        width, height = self.slide.dimensions
+        return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+                f'Format="jpeg" Overlap="{self.overlap}" TileSize="{self.tile_size}">'
+                f'<Size Width="{width}" Height="{height}"/></Image>')
+
+    def tile(self, level, column, row):
+        """JPEG bytes of a Deep Zoom tile
+        :raises ValueError: If the tile is outside of the pyramid
+        """
+        if not 0 <= level < self.level_count:
+            raise ValueError(f"Invalid level {level}")
+        level_width, level_height = self.level_dimensions[level]
+        columns = math.ceil(level_width / self.tile_size)
+        rows = math.ceil(level_height / self.tile_size)
+        if not (0 <= column < columns and 0 <= row < rows):
+            raise ValueError(f"Invalid tile {column}_{row} at level {level}")
+
+        tile_key = (level, column, row)
+        with self.encoded_lock:
+            if tile_key in self.encoded:
+                return self.encoded[tile_key]
+
+        # Tile bounds in Deep Zoom level pixels, including the overlap
+        left = column * self.tile_size - (self.overlap if column > 0 else 0)
+        top = row * self.tile_size - (self.overlap if row > 0 else 0)
+        right = min(level_width, (column + 1) * self.tile_size + self.overlap)
+        bottom = min(level_height, (row + 1) * self.tile_size + self.overlap)
+
+        # Read from the slide level with at least the Deep Zoom resolution
+        scale = 2 ** (self.level_count - 1 - level)
+        slide_level = self.slide.get_best_level_for_downsample(scale)
+        factor = scale / self.slide.level_downsamples[slide_level]
+        slide_width, slide_height = self.slide.level_dimensions[slide_level]
+        x0, y0 = int(left * factor), int(top * factor)
+        x1 = min(slide_width, max(x0 + 1, int(math.ceil(right * factor))))
+        y1 = min(slide_height, max(y0 + 1, int(math.ceil(bottom * factor))))
+
+        pixels = self.compose(slide_level, x0, y0, x1, y1)
+        image = Image.fromarray(pixels)
+        if image.size != (right - left, bottom - top):
+            image = image.resize((right - left, bottom - top), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=self.quality)
+        data = buffer.getvalue()
+        with self.encoded_lock:
+            self.encoded[tile_key] = data
+        return data
+
+    def compose(self, slide_level, x0, y0, x1, y1):
+        """Stitch a region (slide level pixels) from the viewer's tiles"""
+        return self.tile_manager.read_pixels(slide_level, x0, y0, x1 - x0, y1 - y0)
+
+    def close(self):
+        self.tile_manager.close()
+        self.slide.close()
+
+
+class DeepZoomRequestHandler(BaseHTTPRequestHandler):
+    """Serves /, /<name>.dzi and /<name>_files/<level>/<column>_<row>.jpeg"""
+
+    server_version = 'WSIViewerDZI/1.0'
+    protocol_version = 'HTTP/1.1'
+    max_age = 24 * 60 * 60
+    # Idle keep-alive connections are closed after this many seconds, each holds a pool thread
+    timeout = 5
+
+    def do_GET(self):
+        path = urllib.parse.unquote(urllib.parse.urlparse(self.path).path).lstrip('/')
+        try:
+            if path in ('', 'index.html'):
+                self.send_index()
+            elif path.endswith('.dzi') and path[:-4] in self.server.slides:
+                slide = self.server.slides[path[:-4]]
+                self.send_cached(slide, path, slide.descriptor().encode('utf-8'), 'application/xml')
+            elif '_files/' in path:
+                name, tile_path = path.rsplit('_files/', 1)
+                slide = self.server.slides.get(name)
+                level, tile_name = tile_path.split('/')
+                column, row = tile_name[:-len('.jpeg')].split('_')
+                if slide is None or not tile_name.endswith('.jpeg'):
+                    raise ValueError(f"Unknown tile {path}")
+                if self.not_modified(slide, path):
+                    return
+                data = slide.tile(int(level), int(column), int(row))
+                self.send_cached(slide, path, data, 'image/jpeg')
+            else:
+                self.send_error(404)
+        except ValueError:
+            self.send_error(404)
+        except Exception as e:
+            print(f"Error serving {path}: {e}")
+            self.send_error(500)
+
+    def etag(self, slide, path):
+        return f'"{slide.etag_base}-{path}"'
+
+    def not_modified(self, slide, path):
+        """Answer 304 when the client's copy is current"""
+        match = self.headers.get('If-None-Match')
+        if match is not None:
+            current = match == self.etag(slide, path)
+        else:
+            try:
+                since = parsedate_to_datetime(self.headers.get('If-Modified-Since'))
+                current = int(slide.mtime) <= since.timestamp()
+            except (TypeError, ValueError):
+                current = False
+        if current:
+            self.send_response(304)
+            self.send_caching_headers(slide, path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        return current
+
+    def send_caching_headers(self, slide, path):
+        self.send_header('ETag', self.etag(slide, path))
+        self.send_header('Last-Modified', formatdate(slide.mtime, usegmt=True))
+        self.send_header('Cache-Control', f'public, max-age={self.max_age}')
+
+    def send_cached(self, slide, path, data, content_type):
+        if self.not_modified(slide, path):
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_caching_headers(slide, path)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_index(self):
+        links = ''.join(f'<li><a href="{urllib.parse.quote(name)}.dzi">{html.escape(name)}</a></li>'
+                        for name in sorted(self.server.slides))
+        data = f'<html><body><h1>Slides</h1><ul>{links}</ul></body></html>'.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class DeepZoomServer(HTTPServer):
+    """HTTP server handling requests on a fixed size thread pool"""
+
+    daemon_threads = True
+
+    def __init__(self, address, slides, workers=8, verbose=False):
+        """
+        Initialize server
+        :param address: (host, port) to listen on
+        :param slides: Dictionary of URL name -> DeepZoomSlide
+        :param workers: Number of request handler threads
+        """
+        super().__init__(address, DeepZoomRequestHandler)
+        self.slides = slides
+        self.verbose = verbose
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.connections = set()  # Sockets of the connections being handled
+        self.connections_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        with self.connections_lock:
+            self.connections.add(request)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self.connections_lock:
+                self.connections.discard(request)
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Wake handlers waiting on idle keep-alive connections, so only requests in progress are waited for
+        with self.connections_lock:
+            for request in self.connections:
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for slide in self.slides.values():
+            slide.close()
+
+
+def slide_names(paths):
+    """URL names for slide files, made unique where file names collide"""
+    names = {}
+    for path in paths:
+        base = os.path.splitext(os.path.basename(path))[0]
+        name = base
+        index = 2
+        while name in names:
+            name = f'{base}-{index}'
+            index += 1
+        names[name] = path
+    return names
+
+
+def serve(paths, host='127.0.0.1', port=8000, workers=8, tile_size=254, quality=75, verbose=False):
+    """Serve slides until interrupted"""
+    slides = {name: DeepZoomSlide(path, tile_size=tile_size, quality=quality)
+              for name, path in slide_names(paths).items()}
+    server = DeepZoomServer((host, port), slides, workers=workers, verbose=verbose)
+    print(f"Serving {len(slides)} slide(s) on http://{host}:{server.server_port}/")
+    for name in sorted(slides):
+        print(f"  http://{host}:{server.server_port}/{urllib.parse.quote(name)}.dzi")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve slides as Deep Zoom Images over HTTP')
+    parser.add_argument('slides', nargs='+', help='Slide files to serve')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on, 0.0.0.0 for the LAN')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=8, help='Request handler threads')
+    parser.add_argument('--tile-size', type=int, default=254, help='Deep Zoom tile size')
+    parser.add_argument('--quality', type=int, default=75, help='JPEG quality')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args(argv)
+    serve(args.slides, host=args.host, port=args.port, workers=args.workers,
+          tile_size=args.tile_size, quality=args.quality, verbose=args.verbose)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Image Writer
+Encoders writing an image to a file strip by strip, top to bottom, so large
+images are saved with bounded memory and saving can report progress and stop
+between strips. PNG, TIFF (deflate) and BMP are encoded as the strips arrive;
+other formats such as JPEG are collected and encoded by Pillow when closed,
+so they are limited to BUFFERED_MAX_BYTES of pixels (see check_image_size).
+
+    writer = open_image_writer('out.png', 'PNG', width, height, {'Level': '2'})
+    for strip in strips:  # uint8 arrays (rows, width, 3)
+        writer.write(strip)
+    writer.close()
+"""
+
+import os
+import zlib
+import struct
+
+import numpy as np
+from PIL import Image
+
+
+# Largest image kept in memory for formats encoded whole
+BUFFERED_MAX_BYTES = 256 * 1024 * 1024
+# Largest side the formats encoded whole can store
+MAX_SIDES = {'JPEG': 65535, 'JPG': 65535, 'WEBP': 16383}
+
+
+def check_image_size(format, width, height):
+    """
+    Check an image can be written in a format before reading it
+    :raises ValueError: If the format can't store the size, or would hold more than BUFFERED_MAX_BYTES
+    """
+    format = format.upper()
+    if format in WRITERS:
+        return
+    max_side = MAX_SIDES.get(format)
+    if max_side is not None and max(width, height) > max_side:
+        raise ValueError(f"{format} images are limited to {max_side} x {max_side} pixels, "
+                         f"use PNG or TIFF for {width} x {height}")
+    if width * height * 3 > BUFFERED_MAX_BYTES:
+        raise ValueError(f"{format} images are encoded in memory, limited to "
+                         f"{BUFFERED_MAX_BYTES // (1024 * 1024)} MB of pixels, use PNG or TIFF for {width} x {height}")
+
+
+class StripWriter:
+    """Base class, writes RGB rows to a file"""
+    incremental = True  # Encodes in write(), close() only finishes the file
+
+    def __init__(self, path, width, height):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.file = open(path, 'wb')
+
+    def write(self, rows):
+        """Append rows, a uint8 array (count, width, 3)"""
+        if rows.shape[1:] != (self.width, 3) or self.rows_written + len(rows) > self.height:
+            raise ValueError(f"Expected rows of shape (n, {self.width}, 3), {self.height} rows in all")
+        self.encode(np.ascontiguousarray(rows, np.uint8))
+        self.rows_written += len(rows)
+
+    def encode(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        """Finish the file
+        :raises ValueError: If not all rows were written
+        """
+        if self.rows_written != self.height:
+            raise ValueError(f"{self.rows_written} of {self.height} rows written")
+        self.finish()
+        self.file.close()
+
+    def finish(self):
+        pass
+
+    def abort(self):
+        """Close and delete the partial file"""
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class PNGWriter(StripWriter):
+    """PNG with the Sub filter, compressed into one IDAT chunk per strip"""
+
+    def __init__(self, path, width, height, metadata=None, compress_level=6):
+        super().__init__(path, width, height)
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self.chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        for key, value in (metadata or {}).items():
+            # International text: keyword, no compression, no language, UTF-8 text
+            self.chunk(b'iTXt', key.encode('latin-1', 'replace')[:79] + b'\0\0\0\0\0' + str(value).encode('utf-8'))
+        self.compressor = zlib.compressobj(compress_level)
+
+    def chunk(self, kind, data):
+        self.file.write(struct.pack('>I', len(data)) + kind + data +
+                        struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    def encode(self, rows):
+        count = len(rows)
+        flat = rows.reshape(count, -1)
+        filtered = np.empty((count, flat.shape[1] + 1), np.uint8)
+        # Sub filter: each byte minus the same channel of the pixel to its left
+        filtered[:, 0] = 1
+        filtered[:, 1:4] = flat[:, :3]
+        np.subtract(flat[:, 3:], flat[:, :-3], out=filtered[:, 4:])
+        data = self.compressor.compress(filtered)
+        if data:
+            self.chunk(b'IDAT', data)
+
+    def finish(self):
+        self.chunk(b'IDAT', self.compressor.flush())
+        self.chunk(b'IEND', b'')
+
+
+class TIFFWriter(StripWriter):
+    """Baseline RGB TIFF with deflate compressed strips and the horizontal predictor
+
+    Strips are written as they are complete, the directory follows them at the
+    end of the file. Classic TIFF, so files are limited to 4 GB.
+    """
+
+    def __init__(self, path, width, height, metadata=None, rows_per_strip=64, compress_level=6):
+        super().__init__(path, width, height)
+        self.metadata = metadata or {}
+        self.rows_per_strip = rows_per_strip
+        self.compress_level = compress_level
+        self.pending = np.empty((0, width, 3), np.uint8)
+        self.strip_offsets = []
+        self.strip_sizes = []
+        self.file.write(b'II*\0\0\0\0\0')  # Directory offset written by finish
+
+    def encode(self, rows):
+        self.pending = np.concatenate((self.pending, rows)) if len(self.pending) else rows
+        while len(self.pending) >= self.rows_per_strip:
+            self.write_strip(self.pending[:self.rows_per_strip])
+            self.pending = self.pending[self.rows_per_strip:]
+
+    def write_strip(self, rows):
+        # Horizontal predictor: each sample minus the same sample of the pixel to its left
+        predicted = rows.copy()
+        np.subtract(rows[:, 1:], rows[:, :-1], out=predicted[:, 1:])
+        data = zlib.compress(predicted, self.compress_level)
+        self.strip_offsets.append(self.file.tell())
+        self.strip_sizes.append(len(data))
+        self.file.write(data)
+        if self.file.tell() >= 1 << 32:
+            raise OSError("TIFF files are limited to 4 GB")
+
+    def finish(self):
+        if len(self.pending):
+            self.write_strip(self.pending)
+        description = '\n'.join(f'{key}: {value}' for key, value in self.metadata.items()).encode('utf-8') + b'\0'
+        count = len(self.strip_offsets)
+        # Tag, type (3 SHORT, 4 LONG, 2 ASCII, 5 RATIONAL), count, value
+        entries = [
+            (256, 4, 1, struct.pack('<I', self.width)),
+            (257, 4, 1, struct.pack('<I', self.height)),
+            (258, 3, 3, struct.pack('<3H', 8, 8, 8)),
+            (259, 3, 1, struct.pack('<H', 8)),  # Deflate
+            (262, 3, 1, struct.pack('<H', 2)),  # RGB
+            (270, 2, len(description), description),
+            (273, 4, count, struct.pack(f'<{count}I', *self.strip_offsets)),
+            (277, 3, 1, struct.pack('<H', 3)),
+            (278, 4, 1, struct.pack('<I', self.rows_per_strip)),
+            (279, 4, count, struct.pack(f'<{count}I', *self.strip_sizes)),
+            (282, 5, 1, struct.pack('<II', 72, 1)),
+            (283, 5, 1, struct.pack('<II', 72, 1)),
+            (284, 3, 1, struct.pack('<H', 1)),  # Chunky
+            (296, 3, 1, struct.pack('<H', 2)),  # Inch
+            (317, 3, 1, struct.pack('<H', 2)),  # Horizontal predictor
+        ]
+        if self.file.tell() % 2:
+            self.file.write(b'\0')
+        directory = self.file.tell()
+        # Values longer than 4 bytes follow the directory
+        data_offset = directory + 2 + len(entries) * 12 + 4
+        table = [struct.pack('<H', len(entries))]
+        data = []
+        for tag, kind, number, value in entries:
+            if len(value) <= 4:
+                table.append(struct.pack('<HHI', tag, kind, number) + value.ljust(4, b'\0'))
+            else:
+                table.append(struct.pack('<HHII', tag, kind, number, data_offset))
+                value += b'\0' * (len(value) % 2)
+                data.append(value)
+                data_offset += len(value)
+        table.append(struct.pack('<I', 0))
+        self.file.write(b''.join(table) + b''.join(data))
+        if self.file.tell() >= 1 << 32:
+            raise OSError("TIFF files are limited to 4 GB")
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', directory))
+
+
+class BMPWriter(StripWriter):
+    """24-bit BMP stored top-down, so rows are written in order"""
+
+    def __init__(self, path, width, height, metadata=None):
+        super().__init__(path, width, height)
+        self.row_size = (width * 3 + 3) // 4 * 4
+        size = 54 + self.row_size * height
+        if size >= 1 << 32:
+            raise OSError("BMP files are limited to 4 GB")
+        self.file.write(struct.pack('<2sIHHI', b'BM', size, 0, 0, 54))
+        # Negative height: top-down rows
+        self.file.write(struct.pack('<IiiHHIIiiII', 40, width, -height, 1, 24, 0,
+                                    self.row_size * height, 2835, 2835, 0, 0))
+
+    def encode(self, rows):
+        padded = np.zeros((len(rows), self.row_size), np.uint8)
+        padded[:, :self.width * 3] = rows[..., ::-1].reshape(len(rows), -1)
+        self.file.write(padded)
+
+
+class BufferedWriter(StripWriter):
+    """Formats Pillow can only encode whole (JPEG, ...): rows are collected and encoded on close"""
+    incremental = False
+
+    def __init__(self, path, format, width, height, metadata=None, quality=90):
+        check_image_size(format, width, height)
+        # The file is only created once the image is complete
+        self.path = path
+        self.format = format
+        self.width = width
+        self.height = height
+        self.metadata = metadata or {}
+        self.quality = quality
+        self.rows_written = 0
+        self.pixels = np.empty((height, width, 3), np.uint8)
+
+    def encode(self, rows):
+        self.pixels[self.rows_written:self.rows_written + len(rows)] = rows
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"{self.rows_written} of {self.height} rows written")
+        comment = '\n'.join(f'{key}: {value}' for key, value in self.metadata.items())
+        Image.fromarray(self.pixels).save(self.path, self.format, quality=self.quality, comment=comment)
+        self.pixels = None
+
+    def abort(self):
+        self.pixels = None
+
+
+WRITERS = {'PNG': PNGWriter, 'TIFF': TIFFWriter, 'TIF': TIFFWriter, 'BMP': BMPWriter}
+
+
+def open_image_writer(path, format, width, height, metadata=None):
+    """
+    Writer for an image file
+    :param format: 'PNG', 'TIFF', 'BMP', or another Pillow format such as 'JPEG'
+    :param metadata: Dictionary of text stored in the file where the format allows
+    :raises OSError: If the file can't be created
+    :raises ValueError: If the format can't hold the image, see check_image_size
+    """
+    writer = WRITERS.get(format.upper())
+    if writer is None:
+        return BufferedWriter(path, format.upper(), width, height, metadata)
+    return writer(path, width, height, metadata)
@@ -0,0 +1,111 @@
+"""
+Level Cache
+Decoded pixels of one slide level in a memory-mapped file, so a level that is
+revisited constantly is decoded once and then read by slicing. The file lives
+in the page cache rather than on the Python heap, and viewer windows, the DZI
+server or other processes opening the same slide level share it.
+
+The cache is a pair of .npy files named after the slide (path, modification
+time and size) and level: the pixels in RGB32 memory order (blue, green, red,
+255) and a flag per cell of the tile grid set once the cell is written.
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+
+class LevelCache:
+    """Memory-mapped decoded pixels of one slide level"""
+
+    def __init__(self, slide_path, level, level_size, cell_size, directory=None):
+        """
+        Open or create the cache of a slide level
+        :param slide_path: Slide file
+        :param level: Slide level
+        :param level_size: (width, height) of the level
+        :param cell_size: (width, height) of the cells filled at once, the viewer tile size
+        :param directory: Cache directory, by default in the temporary directory
+        :raises OSError: If the files can't be created or mapped, or the disk is too full for them
+        """
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'wsi_viewer_levels')
+        os.makedirs(directory, exist_ok=True)
+        stat = os.stat(slide_path)
+        width, height = level_size
+        cell_width, cell_height = cell_size
+        key = (f'{os.path.realpath(slide_path)}|{stat.st_mtime_ns}|{stat.st_size}|{level}|'
+               f'{width}x{height}|{cell_width}x{cell_height}')
+        name = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        self.level = level
+        self.level_size = level_size
+        self.cell_size = cell_size
+        self.pixels_path = os.path.join(directory, f'{name}.pixels.npy')
+        self.filled_path = os.path.join(directory, f'{name}.filled.npy')
+
+        # Each file appears whole or not at all (see create). Cells are only read once
+        # their flag is set, so a pixels file without flags yet is never read
+        grid = (-(-height // cell_height), -(-width // cell_width))
+        # The sparse file would fail with SIGBUS once the disk fills up, refuse up front
+        if not os.path.exists(self.pixels_path) and shutil.disk_usage(directory).free < width * height * 4:
+            raise OSError(f"Not enough disk space in {directory} for {width * height * 4 // (1024 * 1024)} MB")
+        self.create(self.pixels_path, (height, width, 4))
+        self.create(self.filled_path, grid)
+        self.pixels = np.load(self.pixels_path, mmap_mode='r+')
+        self.filled = np.load(self.filled_path, mmap_mode='r+')
+        if self.pixels.shape != (height, width, 4) or self.filled.shape != grid:
+            raise OSError(f"Level cache {self.pixels_path} has a different layout")
+
+    @staticmethod
+    def create(path, shape):
+        """Create a zeroed .npy file unless it exists, other processes may race to create it"""
+        if os.path.exists(path):
+            return
+        temporary = f'{path}.{os.getpid()}.tmp'
+        # Sparse file, disk space is only used as cells are filled
+        np.lib.format.open_memmap(temporary, 'w+', np.uint8, shape).flush()
+        try:
+            # Unlike os.replace, fails if another process created it meanwhile
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+
+    def is_filled(self, column, row):
+        return bool(self.filled[row, column])
+
+    def fraction_filled(self):
+        return float(self.filled.mean()) if self.filled.size else 1.0
+
+    def missing_cells(self):
+        """(column, row) of the cells not filled yet, in reading order"""
+        rows, columns = np.nonzero(self.filled == 0)
+        return list(zip(columns.tolist(), rows.tolist()))
+
+    def view(self, left, top, width, height):
+        """RGB32 pixels of a region (level pixels), a view of the memory map"""
+        return self.pixels[top:top + height, left:left + width]
+
+    def write(self, left, top, rgba, cells):
+        """
+        Store RGBA pixels of a region and mark its cells filled
+        :param left: Region position in level pixels
+        :param rgba: Pixels (height, width, 4) as returned by read_region
+        :param cells: (column, row) of the cells the region covers completely
+        """
+        height, width = rgba.shape[:2]
+        target = self.pixels[top:top + height, left:left + width]
+        target[..., :3] = rgba[..., 2::-1]
+        target[..., 3] = 255
+        # Flags after pixels: a process seeing the flag also sees the pixels through the shared mapping
+        for column, row in cells:
+            self.filled[row, column] = 1
+
+    def close(self):
+        """Drop the mappings, images still viewing the pixels keep them alive"""
+        self.pixels = None
+        self.filled = None
@@ -0,0 +1,315 @@
+"""
+Patch Extraction
+Streaming patch extraction for machine learning pipelines, built on the
+viewer's tile layer. Patches are stitched from cached tiles by a bounded
+pool of threads and yielded in grid order as NumPy arrays, so memory stays
+flat however many patches a slide has.
+
+    from patches import extract_patches
+    for pixels, (x, y) in extract_patches('slide.svs', patch_size=224, mpp=0.5, tissue_mask=True):
+        ...
+"""
+
+import os
+import json
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+
+class PatchGrid:
+    """Positions of a regular grid of patches over a slide"""
+
+    def __init__(self, slide, patch_size=256, level=None, mpp=None, stride=None, tissue_mask=None,
+                 min_tissue=0.5):
+        """
+        Initialize patch grid
+        :param slide: OpenSlide object
+        :param patch_size: Patch width and height in output pixels
+        :param level: Slide level to read, level 0 if neither level nor mpp is given
+        :param mpp: Target resolution in µm per pixel, instead of level. Read from the finest
+            level at least as fine, and resized
+        :param stride: Distance between patches in output pixels, patch_size by default
+        :param tissue_mask: TissueMask to skip patches without tissue, True to compute it, or None
+        :param min_tissue: Fraction of a patch that must be tissue, with a tissue mask
+        :raises ValueError: If mpp is given but the slide has no resolution, or level is invalid
+        """
+        self.patch_size = patch_size
+        self.stride = stride or patch_size
+
+        if mpp is not None:
+            try:
+                base_mpp = float(slide.properties['openslide.mpp-x'])
+            except (KeyError, ValueError):
+                raise ValueError("The slide has no resolution (openslide.mpp-x), use a level instead")
+            downsample = mpp / base_mpp
+            # Finest resolution needed: the coarsest level not coarser than the target
+            level = max((index for index, value in enumerate(slide.level_downsamples)
+                         if value <= downsample * 1.001), default=0)
+        else:
+            level = level or 0
+            if not 0 <= level < slide.level_count:
+                raise ValueError(f"Invalid level {level}")
+            downsample = slide.level_downsamples[level]
+        self.level = level
+        self.mpp = mpp
+        # Level 0 pixels per output pixel, and level pixels read per patch
+        self.downsample = downsample
+        self.read_size = max(1, int(round(patch_size * downsample / slide.level_downsamples[level])))
+
+        # Top left corners in level 0 pixels, full patches only
+        width, height = slide.dimensions
+        extent = patch_size * downsample
+        step = self.stride * downsample
+        xs = np.arange(0, max(0.0, width - extent) + 1e-6, step) if width >= extent else np.zeros(0)
+        ys = np.arange(0, max(0.0, height - extent) + 1e-6, step) if height >= extent else np.zeros(0)
+        positions = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+        positions = np.floor(positions).astype(np.int64)
+
+        if tissue_mask is True:
+            from wsi_viewer import TissueMask
+            tissue_mask = TissueMask.from_slide(slide)
+        if tissue_mask is not None:
+            keep = [tissue_mask.coverage(x, y, extent, extent) >= min_tissue for x, y in positions.tolist()]
+            positions = positions[np.array(keep, bool)] if len(positions) else positions
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def read_patch(tile_manager, grid, x, y):
+    """Pixels (patch_size, patch_size, 3) of the patch at level 0 position (x, y)"""
+    downsample = tile_manager.level_downsamples[grid.level]
+    pixels = tile_manager.read_pixels(grid.level, int(x / downsample), int(y / downsample),
+                                      grid.read_size, grid.read_size)
+    if grid.read_size != grid.patch_size:
+        pixels = np.asarray(Image.fromarray(pixels).resize((grid.patch_size, grid.patch_size), Image.LANCZOS))
+    return pixels
+
+
+def read_patches(tile_manager, grid, indices, workers=4, prefetch=32):
+    """
+    Yield (index, pixels) for patches of a grid, in the order of indices, read
+    by a thread pool at most prefetch patches ahead of the consumer
+    """
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        indices = iter(indices)
+        pending = collections.deque()
+
+        def submit():
+            for index in indices:
+                x, y = grid.positions[index].tolist()
+                pending.append((executor.submit(read_patch, tile_manager, grid, x, y), index))
+                return True
+            return False
+
+        for _ in range(max(1, prefetch)):
+            if not submit():
+                break
+        while pending:
+            future, index = pending.popleft()
+            pixels = future.result()
+            submit()
+            yield index, pixels
+    finally:
+        # Also runs when the consumer stops early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def open_tile_manager(slide, cache_size=64):
+    """TileManager for headless reading, without the compressed cache tier"""
+    from wsi_viewer import TileManager
+    tile_manager = TileManager(cache_size=cache_size, warm_cache_mb=0)
+    tile_manager.set_slide(slide)
+    return tile_manager
+
+
+def extract_patches(slide, patch_size=256, level=None, mpp=None, stride=None, tissue_mask=None,
+                    min_tissue=0.5, workers=4, prefetch=32, tile_manager=None):
+    """
+    Yield (pixels, (x, y)) for the patches of a slide, in grid order
+
+    pixels is a uint8 array (patch_size, patch_size, 3) and (x, y) the top
+    left corner in level 0 pixels. At most prefetch patches are read ahead,
+    so a slow consumer holds the readers back instead of filling memory.
+    :param slide: OpenSlide object or slide file
+    :param workers: Threads reading patches
+    :param prefetch: Patches read ahead of the consumer
+    :param tile_manager: TileManager of the slide to share its tile cache, by default a private one
+    See PatchGrid for the other parameters.
+    """
+    import openslide
+
+    own_slide = not isinstance(slide, openslide.AbstractSlide)
+    if own_slide:
+        slide = openslide.OpenSlide(slide)
+    own_manager = tile_manager is None
+    if own_manager:
+        tile_manager = open_tile_manager(slide)
+    try:
+        grid = PatchGrid(slide, patch_size, level, mpp, stride, tissue_mask, min_tissue)
+        for index, pixels in read_patches(tile_manager, grid, range(len(grid)), workers, prefetch):
+            yield pixels, tuple(grid.positions[index].tolist())
+    finally:
+        if own_manager:
+            tile_manager.close()
+        if own_slide:
+            slide.close()
+
+
+class PatchStore:
+    """
+    Patches exported by export_patch_store, memory mapped for random access
+
+    The store is a directory with index.json, coordinates.npy (n, 2) with the
+    level 0 top left corners, one .npy shard of up to shard_size patches per
+    chunk, and done.npy marking the patches already written.
+
+        store = PatchStore('patches/slide1')
+        pixels, (x, y) = store[n], store.coordinates[n]
+    """
+    INDEX = 'index.json'
+
+    def __init__(self, directory):
+        """
+        Open a store
+        :raises OSError: If the store can't be read
+        :raises ValueError: If the index is invalid
+        """
+        self.directory = directory
+        with open(os.path.join(directory, self.INDEX), encoding='utf-8') as f:
+            self.index = json.load(f)
+        if self.index.get('version') != 1:
+            raise ValueError(f"Unsupported patch store version {self.index.get('version')}")
+        self.shard_size = self.index['shard_size']
+        self.coordinates = np.load(os.path.join(directory, 'coordinates.npy'), mmap_mode='r')
+        self.done = np.load(os.path.join(directory, 'done.npy'), mmap_mode='r')
+        self.shards = [np.load(os.path.join(directory, name), mmap_mode='r') for name in self.index['shards']]
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def __getitem__(self, index):
+        """Pixels (patch_size, patch_size, 3) of patch index, a view of the memory map"""
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        return self.shards[index // self.shard_size][index % self.shard_size]
+
+    @property
+    def complete(self):
+        return bool(self.done.all())
+
+
+def write_json(path, data):
+    """Write a JSON file through a temporary file so readers never see a partial one"""
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(temporary, path)
+
+
+def export_patch_store(slide, directory, patch_size=256, level=None, mpp=None, stride=None, tissue_mask=None,
+                       min_tissue=0.5, shard_size=4096, workers=4, prefetch=64, progress=None,
+                       flush_every=512):
+    """
+    Extract the patches of a slide into a PatchStore
+
+    Running it again with the same settings on an interrupted export only
+    reads the missing patches: written patches are flushed to their shard
+    before they are marked done.
+    :param slide: OpenSlide object or slide file
+    :param directory: Store directory, created if needed
+    :param shard_size: Patches per shard file
+    :param workers: Threads reading patches
+    :param prefetch: Patches read ahead of the writer
+    :param progress: Function called with the fraction of patches written, returning False stops
+    :param flush_every: Patches written between flushes, what an interruption can lose
+    See PatchGrid for the other parameters.
+    :return: PatchStore, or None if stopped
+    :raises ValueError: If the directory holds a store with other settings
+    """
+    import openslide
+
+    own_slide = not isinstance(slide, openslide.AbstractSlide)
+    slide_path = os.path.abspath(slide) if own_slide else None
+    if own_slide:
+        slide = openslide.OpenSlide(slide)
+    tile_manager = None
+    try:
+        grid = PatchGrid(slide, patch_size, level, mpp, stride, tissue_mask, min_tissue)
+        count = len(grid)
+        shard_count = (count + shard_size - 1) // shard_size
+        index = {
+            'version': 1,
+            'slide': slide_path,
+            'patch_size': patch_size,
+            'level': grid.level,
+            'mpp': mpp,
+            'stride': grid.stride,
+            'min_tissue': min_tissue if tissue_mask is not None else None,
+            'count': count,
+            'shard_size': shard_size,
+            'shards': [f'shard_{number:05d}.npy' for number in range(shard_count)],
+        }
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, PatchStore.INDEX)
+        coordinates_path = os.path.join(directory, 'coordinates.npy')
+        done_path = os.path.join(directory, 'done.npy')
+
+        resume = os.path.exists(index_path)
+        if resume:
+            with open(index_path, encoding='utf-8') as f:
+                existing = json.load(f)
+            # The slide may be given by another path or as an OpenSlide object
+            existing['slide'] = slide_path
+            if existing != index or not np.array_equal(np.load(coordinates_path), grid.positions):
+                raise ValueError(f"{directory} holds a patch store with other settings")
+        else:
+            np.save(coordinates_path, grid.positions)
+            np.lib.format.open_memmap(done_path, 'w+', np.uint8, (count,)).flush()
+            for number, name in enumerate(index['shards']):
+                shape = (min(shard_size, count - number * shard_size), patch_size, patch_size, 3)
+                np.lib.format.open_memmap(os.path.join(directory, name), 'w+', np.uint8, shape).flush()
+            # Written last, an export interrupted before this point starts over
+            write_json(index_path, index)
+
+        done = np.lib.format.open_memmap(done_path, 'r+')
+        shards = [np.lib.format.open_memmap(os.path.join(directory, name), 'r+') for name in index['shards']]
+        missing = np.flatnonzero(done == 0)
+        written = count - len(missing)
+        if len(missing):
+            tile_manager = open_tile_manager(slide)
+            unflushed = []
+
+            def flush():
+                for number in {patch // shard_size for patch in unflushed}:
+                    shards[number].flush()
+                done[unflushed] = 1
+                done.flush()
+                unflushed.clear()
+
+            try:
+                for patch, pixels in read_patches(tile_manager, grid, missing.tolist(), workers, prefetch):
+                    shards[patch // shard_size][patch % shard_size] = pixels
+                    unflushed.append(patch)
+                    written += 1
+                    if len(unflushed) >= flush_every:
+                        flush()
+                        if progress is not None and progress(written / count) is False:
+                            return None
+            finally:
+                flush()
+        if progress is not None:
+            progress(1.0)
+        del done, shards
+        return PatchStore(directory)
+    finally:
+        if tile_manager is not None:
+            tile_manager.close()
+        if own_slide:
+            slide.close()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Shared Tile Cache
+Compressed tiles in a memory-mapped file shared by all local processes using
+the tile layer (viewer windows, DZI server, exporters), so a tile decoded by
+one of them is reused by the others.
+
+The file is a set-associative table of fixed-size slots. Readers are lock-free:
+every slot carries a sequence number that is odd while the slot is written, and
+a read is only accepted if the number is even and unchanged after copying the
+data. Writers lock the set they write to with an fcntl byte-range lock.
+"""
+
+import os
+import sys
+import mmap
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class SharedTileCache:
+    """Fixed-size, cross-process tile cache in a memory-mapped file"""
+
+    MAGIC = b'WSITILE1'
+    HEADER = struct.Struct('<8sIII')      # magic, slot count, slot size, ways
+    HEADER_SIZE = 64
+    SLOT = struct.Struct('<QQ16sI')       # sequence, write time, key digest, data length
+    SLOT_HEADER_SIZE = 48
+
+    def __init__(self, path, size_mb=512, slot_size=256 * 1024, ways=8):
+        """
+        Open or create a shared cache
+        :param path: Backing file, shared by every process using the same path
+        :param size_mb: Size of the cache
+        :param slot_size: Bytes per slot, larger entries are not cached
+        :param ways: Slots per set (associativity)
+        :raises OSError: If the platform has no fcntl or the file has another layout
+        """
+        if fcntl is None:
+            raise OSError("The shared tile cache requires fcntl (POSIX)")
+        self.path = path
+        self.slot_size = slot_size
+        self.ways = ways
+        self.set_count = max(1, size_mb * 1024 * 1024 // (slot_size * ways))
+        self.slot_count = self.set_count * ways
+        size = self.HEADER_SIZE + self.slot_count * slot_size
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Byte 0 guards initialization, byte 1 + n guards set n
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, 0)
+        try:
+            if os.fstat(self.fd).st_size == 0:
+                # Sparse file, pages are only allocated once slots are written
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, self.HEADER.pack(self.MAGIC, self.slot_count, slot_size, ways), 0)
+            header = self.HEADER.unpack(os.pread(self.fd, self.HEADER.size, 0))
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, 0)
+        if header != (self.MAGIC, self.slot_count, slot_size, ways) or os.fstat(self.fd).st_size != size:
+            os.close(self.fd)
+            raise OSError(f"Shared tile cache {path} has a different layout")
+
+        self.map = mmap.mmap(self.fd, size)
+        # fcntl locks belong to the process, threads of one process also need this
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_environment(cls):
+        """Shared cache configured by WSI_VIEWER_SHARED_CACHE_MB, or None if disabled"""
+        size_mb = int(os.environ.get('WSI_VIEWER_SHARED_CACHE_MB', 0))
+        if size_mb <= 0:
+            return None
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        path = os.environ.get('WSI_VIEWER_SHARED_CACHE',
+                              os.path.join(directory, f'wsi_viewer_tiles_{size_mb}mb.cache'))
+        try:
+            return cls(path, size_mb)
+        except OSError as e:
+            print(f"Shared tile cache disabled: {e}")
+            return None
+
+    @staticmethod
+    def digest(key):
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+    def slot_offset(self, set_index, way):
+        return self.HEADER_SIZE + (set_index * self.ways + way) * self.slot_size
+
+    def get(self, key):
+        """Compressed tile bytes for key, or None"""
+        digest = self.digest(key)
+        set_index = int.from_bytes(digest[:8], 'little') % self.set_count
+        for way in range(self.ways):
+            offset = self.slot_offset(set_index, way)
+            sequence, _, slot_digest, length = self.SLOT.unpack_from(self.map, offset)
+            if slot_digest != digest or sequence & 1:
+                continue
+            data = self.map[offset + self.SLOT_HEADER_SIZE:offset + self.SLOT_HEADER_SIZE + length]
+            # A writer replaced the slot while it was copied
+            if self.SLOT.unpack_from(self.map, offset)[0] != sequence:
+                break
+            self.hits += 1
+            return data
+        self.misses += 1
+        return None
+
+    def put(self, key, data):
+        """Store compressed tile bytes, replacing the least recently written slot of the set"""
+        if len(data) > self.slot_size - self.SLOT_HEADER_SIZE:
+            return False
+        digest = self.digest(key)
+        set_index = int.from_bytes(digest[:8], 'little') % self.set_count
+
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, 1 + set_index)
+            try:
+                victim = None
+                oldest = None
+                for way in range(self.ways):
+                    offset = self.slot_offset(set_index, way)
+                    _, stamp, slot_digest, _ = self.SLOT.unpack_from(self.map, offset)
+                    if slot_digest == digest:
+                        return True  # Another process stored it already
+                    if oldest is None or stamp < oldest:
+                        victim, oldest = offset, stamp
+
+                # Odd sequence: readers skip the slot until the write is complete. Also
+                # correct for a write interrupted by a process that died meanwhile
+                sequence = self.SLOT.unpack_from(self.map, victim)[0] | 1
+                struct.pack_into('<Q', self.map, victim, sequence)
+                self.map[victim + self.SLOT_HEADER_SIZE:victim + self.SLOT_HEADER_SIZE + len(data)] = data
+                self.SLOT.pack_into(self.map, victim, sequence + 1, time.time_ns(), digest, len(data))
+                return True
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, 1 + set_index)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            os.close(self.fd)
+            self.map = None
+
+
+def main():
+    """Print usage statistics of the shared cache file"""
+    cache = SharedTileCache.from_environment()
+    if cache is None:
+        print("Set WSI_VIEWER_SHARED_CACHE_MB to enable the shared tile cache")
+        return 1
+    used = 0
+    stored = 0
+    for set_index in range(cache.set_count):
+        for way in range(cache.ways):
+            _, stamp, _, length = cache.SLOT.unpack_from(cache.map, cache.slot_offset(set_index, way))
+            if stamp:
+                used += 1
+                stored += length
+    print(f"{cache.path}: {used}/{cache.slot_count} slots used, {stored / (1024 * 1024):.1f} MB of tiles")
+    cache.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
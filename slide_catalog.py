@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Slide Catalog
+Local SQLite database of slide metadata (geometry, resolution, properties and
+associated images), so an archive can be queried without opening each file
+and the viewer can show a slide's metadata before OpenSlide has opened it.
+
+Scans read new and changed slides on a thread pool; a slide is read again only
+when its size or modification time changed.
+
+    python slide_catalog.py scan /archive/slides
+    python slide_catalog.py find --vendor aperio --mpp 0.25 --min-size 80000
+    python slide_catalog.py find --associated macro
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS slides (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    vendor TEXT,
+    width INTEGER,
+    height INTEGER,
+    level_count INTEGER,
+    level_dimensions TEXT,
+    level_downsamples TEXT,
+    mpp_x REAL,
+    mpp_y REAL,
+    error TEXT,
+    scanned REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS properties (
+    path TEXT NOT NULL REFERENCES slides(path) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (path, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS properties_key ON properties(key, value);
+CREATE TABLE IF NOT EXISTS associated_images (
+    path TEXT NOT NULL REFERENCES slides(path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    PRIMARY KEY (path, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS associated_images_name ON associated_images(name);
+CREATE TABLE IF NOT EXISTS viewports (
+    path TEXT PRIMARY KEY,
+    center_x REAL NOT NULL,
+    center_y REAL NOT NULL,
+    scale REAL NOT NULL,
+    level INTEGER,
+    saved REAL NOT NULL
+);
+'''
+
+
+class CatalogRecord:
+    """Metadata of a cataloged slide, with the attributes of an OpenSlide object used to display it"""
+
+    def __init__(self, path, dimensions, level_dimensions, level_downsamples, properties, associated_images):
+        self.path = path
+        self.dimensions = dimensions
+        self.level_count = len(level_dimensions)
+        self.level_dimensions = level_dimensions
+        self.level_downsamples = level_downsamples
+        self.properties = properties
+        # Names only, like the keys of OpenSlide.associated_images
+        self.associated_images = associated_images
+
+
+def read_slide(path, slide=None):
+    """
+    Metadata of a slide file as a dictionary of catalog columns, with
+    'properties' and 'associated_images' ({name: (width, height)})
+    Unreadable slides get an 'error' so rescans skip them until they change.
+    :param slide: OpenSlide object of the file if already open, it is left open
+    """
+    import openslide
+
+    stat = os.stat(path)
+    record = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'error': None,
+              'properties': {}, 'associated_images': {}}
+    own_slide = slide is None
+    if own_slide:
+        try:
+            slide = openslide.OpenSlide(path)
+        except Exception as e:
+            record['error'] = str(e) or type(e).__name__
+            return record
+    try:
+        properties = dict(slide.properties)
+        record.update(
+            vendor=properties.get('openslide.vendor'),
+            width=slide.dimensions[0],
+            height=slide.dimensions[1],
+            level_count=slide.level_count,
+            level_dimensions=json.dumps(slide.level_dimensions),
+            level_downsamples=json.dumps(slide.level_downsamples),
+            mpp_x=to_float(properties.get('openslide.mpp-x')),
+            mpp_y=to_float(properties.get('openslide.mpp-y')),
+            properties=properties)
+        # Sizes from the properties, listing the names doesn't decode the images
+        for name in slide.associated_images:
+            record['associated_images'][name] = (
+                to_int(properties.get(f'openslide.associated.{name}.width')),
+                to_int(properties.get(f'openslide.associated.{name}.height')))
+    finally:
+        if own_slide:
+            slide.close()
+    return record
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SlideCatalog:
+    """SQLite catalog of slide metadata
+
+    A connection belongs to the thread that opened the catalog; other threads
+    open their own. The database uses write-ahead logging, so the viewer can
+    read while a scan writes.
+    """
+
+    def __init__(self, path=None):
+        """
+        Open or create a catalog
+        :param path: Database file, see default_path
+        :raises sqlite3.Error: If the database can't be opened
+        """
+        self.path = path or self.default_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA foreign_keys=ON')
+        self.connection.executescript(SCHEMA)
+
+    @staticmethod
+    def default_path():
+        """WSI_VIEWER_CATALOG, or slide_catalog.sqlite in ~/.wsi_viewer"""
+        return os.environ.get('WSI_VIEWER_CATALOG',
+                              os.path.join(os.path.expanduser('~'), '.wsi_viewer', 'slide_catalog.sqlite'))
+
+    def close(self):
+        self.connection.close()
+
+    def store(self, record):
+        """Insert or replace the record of a slide (see read_slide), committed by the caller"""
+        path = record['path']
+        self.connection.execute('DELETE FROM slides WHERE path = ?', (path,))
+        self.connection.execute(
+            'INSERT INTO slides (path, size, mtime_ns, vendor, width, height, level_count, level_dimensions, '
+            'level_downsamples, mpp_x, mpp_y, error, scanned) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (path, record['size'], record['mtime_ns'], record.get('vendor'), record.get('width'),
+             record.get('height'), record.get('level_count'), record.get('level_dimensions'),
+             record.get('level_downsamples'), record.get('mpp_x'), record.get('mpp_y'), record['error'],
+             time.time()))
+        self.connection.executemany('INSERT INTO properties (path, key, value) VALUES (?, ?, ?)',
+                                    ((path, key, value) for key, value in record['properties'].items()))
+        self.connection.executemany('INSERT INTO associated_images (path, name, width, height) VALUES (?, ?, ?, ?)',
+                                    ((path, name, width, height)
+                                     for name, (width, height) in record['associated_images'].items()))
+
+    def add(self, path, slide=None):
+        """Read a slide into the catalog
+        :param slide: OpenSlide object of the file if already open
+        :raises OSError: If the file can't be accessed
+        """
+        with self.connection:
+            self.store(read_slide(os.path.abspath(path), slide))
+
+    def get(self, path):
+        """CatalogRecord of a slide, or None if it isn't cataloged, changed since, or couldn't be read"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        row = self.connection.execute(
+            'SELECT size, mtime_ns, width, height, level_dimensions, level_downsamples, error '
+            'FROM slides WHERE path = ?', (path,)).fetchone()
+        if row is None or row[:2] != (stat.st_size, stat.st_mtime_ns) or row[6] is not None:
+            return None
+        properties = dict(self.connection.execute('SELECT key, value FROM properties WHERE path = ?', (path,)))
+        associated = tuple(name for name, in self.connection.execute(
+            'SELECT name FROM associated_images WHERE path = ? ORDER BY name', (path,)))
+        return CatalogRecord(path, (row[2], row[3]), tuple(tuple(size) for size in json.loads(row[4])),
+                             tuple(json.loads(row[5])), properties, associated)
+
+    def viewport(self, path):
+        """Last viewport (center_x, center_y, scale, level) of a slide in the viewer, or None
+        Center in level 0 pixels, scale in screen pixels per level 0 pixel.
+        """
+        row = self.connection.execute('SELECT center_x, center_y, scale, level FROM viewports WHERE path = ?',
+                                      (os.path.abspath(path),)).fetchone()
+        return tuple(row) if row else None
+
+    def set_viewport(self, path, center_x, center_y, scale, level):
+        """Remember the viewport of a slide, see viewport"""
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO viewports (path, center_x, center_y, scale, level, saved) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (os.path.abspath(path), center_x, center_y, scale, level, time.time()))
+
+    def scan(self, directories, recursive=True, workers=4, progress=None):
+        """
+        Catalog the slides of directories, reading only new and changed files
+
+        Slides that disappeared from the directories are removed, without recursive only those directly in them.
+        :param directories: Directories to scan
+        :param recursive: Also scan subdirectories
+        :param workers: Threads reading slides
+        :param progress: Function called with (slides read, slides to read), returning False stops
+        :return: Dictionary with the counts of 'added', 'updated', 'removed', 'unchanged' and 'failed' slides
+        """
+        from slide_library import SLIDE_EXTENSIONS
+
+        found = {}  # Path -> (size, mtime_ns)
+        scanned = set()
+        prefixes = []
+        for directory in directories:
+            directory = os.path.abspath(directory)
+            scanned.add(directory)
+            prefixes.append(directory.rstrip(os.sep) + os.sep)
+            for root, subdirectories, files in os.walk(directory):
+                if not recursive:
+                    subdirectories.clear()
+                for name in files:
+                    if name.lower().endswith(SLIDE_EXTENSIONS):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        found[path] = (stat.st_size, stat.st_mtime_ns)
+
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                 self.connection.execute('SELECT path, size, mtime_ns FROM slides')
+                 if (path.startswith(tuple(prefixes)) if recursive else os.path.dirname(path) in scanned)}
+        changed = [path for path, stamp in found.items() if known.get(path) != stamp]
+        removed = [path for path in known if path not in found]
+        counts = {'added': 0, 'updated': 0, 'removed': len(removed),
+                  'unchanged': len(found) - len(changed), 'failed': 0}
+
+        with self.connection:
+            self.connection.executemany('DELETE FROM slides WHERE path = ?', ((path,) for path in removed))
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(read_slide, path) for path in changed]
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    record = future.result()
+                except OSError as e:
+                    print(f"Error reading {e.filename}: {e}")
+                    counts['failed'] += 1
+                    continue
+                # Writes stay on this thread, committed per slide so a stopped scan keeps its work
+                with self.connection:
+                    self.store(record)
+                if record['error']:
+                    counts['failed'] += 1
+                else:
+                    counts['updated' if record['path'] in known else 'added'] += 1
+                if progress is not None and progress(done, len(changed)) is False:
+                    break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return counts
+
+    def find(self, vendor=None, mpp=None, mpp_tolerance=0.02, min_size=None, associated=None, properties=None):
+        """
+        Paths of the readable slides matching all given criteria
+        :param vendor: OpenSlide vendor, e.g. 'aperio'
+        :param mpp: Level 0 resolution in µm per pixel, matched within mpp_tolerance
+        :param min_size: Minimum of the larger side in level 0 pixels
+        :param associated: Name of an associated image the slide must have, e.g. 'macro'
+        :param properties: Dictionary of property values the slide must have
+        """
+        conditions = ['error IS NULL']
+        parameters = []
+        if vendor is not None:
+            conditions.append('vendor = ?')
+            parameters.append(vendor)
+        if mpp is not None:
+            conditions.append('ABS(mpp_x - ?) <= ?')
+            parameters += [mpp, mpp_tolerance]
+        if min_size is not None:
+            conditions.append('MAX(width, height) >= ?')
+            parameters.append(min_size)
+        if associated is not None:
+            conditions.append('EXISTS (SELECT 1 FROM associated_images a WHERE a.path = slides.path AND a.name = ?)')
+            parameters.append(associated)
+        for key, value in (properties or {}).items():
+            conditions.append('EXISTS (SELECT 1 FROM properties p WHERE p.path = slides.path '
+                              'AND p.key = ? AND p.value = ?)')
+            parameters += [key, str(value)]
+        query = f'SELECT path FROM slides WHERE {" AND ".join(conditions)} ORDER BY path'
+        return [path for path, in self.connection.execute(query, parameters)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Catalog slide metadata in a local SQLite database')
+    parser.add_argument('--catalog', help='Database file (default: WSI_VIEWER_CATALOG or ~/.wsi_viewer)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan_parser = commands.add_parser('scan', help='Add new and changed slides of directories')
+    scan_parser.add_argument('directories', nargs='+')
+    scan_parser.add_argument('--workers', type=int, default=4)
+    scan_parser.add_argument('--no-recursive', action='store_true')
+    find_parser = commands.add_parser('find', help='List slides matching all criteria')
+    find_parser.add_argument('--vendor')
+    find_parser.add_argument('--mpp', type=float, help='Level 0 µm per pixel')
+    find_parser.add_argument('--min-size', type=int, help='Minimum larger side in pixels')
+    find_parser.add_argument('--associated', help='Associated image name, e.g. macro')
+    find_parser.add_argument('--property', action='append', default=[], metavar='KEY=VALUE')
+    args = parser.parse_args()
+
+    catalog = SlideCatalog(args.catalog)
+    try:
+        if args.command == 'scan':
+            counts = catalog.scan(args.directories, recursive=not args.no_recursive, workers=args.workers,
+                                  progress=lambda done, total: print(f'\r{done}/{total}', end='', flush=True))
+            print('\n' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+        else:
+            properties = dict(item.split('=', 1) for item in args.property)
+            for path in catalog.find(args.vendor, args.mpp, min_size=args.min_size,
+                                     associated=args.associated, properties=properties):
+                print(path)
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""
+Slide Library
+Browser pane listing the slides of a folder as a thumbnail grid. Thumbnails
+(slide overview next to its label image) are made on a thread pool for the
+cells in view only and kept in a disk cache, so a folder shows at once after
+its first visit.
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+
+from PyQt5.QtCore import (Qt, QSize, QObject, QRunnable, QThreadPool, QAbstractListModel, QModelIndex,
+                          QStandardPaths, pyqtSignal)
+from PyQt5.QtGui import QColor, QImage, QPixmap
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QListView
+
+SLIDE_EXTENSIONS = ('.svs', '.tif', '.tiff', '.ndpi', '.vms', '.vmu', '.scn', '.mrxs', '.svslide')
+
+
+class ThumbnailDiskCache:
+    """Thumbnail JPEG files, keyed by slide path, modification time and size"""
+
+    def __init__(self, directory=None, quality=85):
+        """
+        Initialize cache
+        :param directory: Cache directory, by default in the user's cache location
+        :param quality: JPEG quality of the stored thumbnails
+        """
+        if directory is None:
+            base = QStandardPaths.writableLocation(QStandardPaths.CacheLocation) or \
+                os.path.join(tempfile.gettempdir(), 'wsi_viewer')
+            directory = os.path.join(base, 'thumbnails')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.quality = quality
+
+    def file_for(self, path, size):
+        """Cache file of a slide's thumbnail, a changed slide gets a new one
+        :raises OSError: If the slide can't be accessed
+        """
+        stat = os.stat(path)
+        key = f'{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{size[0]}x{size[1]}'
+        return os.path.join(self.directory, hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest() + '.jpg')
+
+    def load(self, path, size):
+        """Cached thumbnail QImage, or None"""
+        try:
+            image = QImage(self.file_for(path, size))
+        except OSError:
+            return None
+        return None if image.isNull() else image
+
+    def store(self, path, size, image):
+        """Store a PIL thumbnail, written to a temporary file first so readers never see a partial file"""
+        target = self.file_for(path, size)
+        temporary = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        image.save(temporary, 'JPEG', quality=self.quality)
+        os.replace(temporary, target)
+
+
+def make_thumbnail(path, size):
+    """
+    Thumbnail of a slide as a PIL RGB image: the label image on the left and
+    the slide overview, both fitted into size
+    :raises openslide.OpenSlideError: If the slide can't be read
+    """
+    import openslide
+    from PIL import Image
+    from wsi_viewer import read_level_scaled
+
+    width, height = size
+    canvas = Image.new('RGB', size, 'white')
+    slide = openslide.OpenSlide(path)
+    try:
+        # Only the label is decoded, not every associated image
+        label_width = 0
+        if 'label' in slide.associated_images:
+            label = slide.associated_images['label'].convert('RGB')
+            label.thumbnail((width * 3 // 8, height), Image.LANCZOS)
+            canvas.paste(label, (0, (height - label.height) // 2))
+            label_width = label.width + 4
+
+        # The coarsest level, read in strips so slides without small levels stay bounded
+        level = slide.level_count - 1
+        level_width, level_height = slide.level_dimensions[level]
+        scale = min((width - label_width) / level_width, height / level_height)
+        overview = read_level_scaled(slide, level, (max(1, int(level_width * scale)),
+                                                    max(1, int(level_height * scale))))
+        canvas.paste(overview, (label_width + (width - label_width - overview.width) // 2,
+                                (height - overview.height) // 2))
+    finally:
+        slide.close()
+    return canvas
+
+
+class ThumbnailSignals(QObject):
+    thumbnail_ready = pyqtSignal(str, object, str, name='thumbnailReady')  # Path, QImage or None, error message
+
+
+class ThumbnailRunnable(QRunnable):
+    """Makes thumbnails on a thread pool thread until the model has no more requests"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.signals = ThumbnailSignals()
+
+    def run(self):
+        # take_request counts the worker as finished when it returns None
+        while True:
+            path = self.model.take_request()
+            if path is None:
+                return
+            error = ''
+            try:
+                thumbnail = make_thumbnail(path, self.model.thumbnail_size)
+                self.model.disk_cache.store(path, self.model.thumbnail_size, thumbnail)
+                data = thumbnail.tobytes('raw', 'RGB')
+                image = QImage(data, thumbnail.width, thumbnail.height, thumbnail.width * 3,
+                               QImage.Format_RGB888).copy()
+            except Exception as e:
+                # Shown in the slide's tooltip
+                image, error = None, str(e) or type(e).__name__
+            self.signals.thumbnail_ready.emit(path, image, error)
+
+
+class SlideLibraryModel(QAbstractListModel):
+    """Slides of a folder, with thumbnails requested as the view asks for them
+
+    Requests are served newest first, and requests for rows that were
+    scrolled out of view before a worker got to them are dropped.
+    """
+
+    def __init__(self, thumbnail_size=(256, 128), max_workers=4, cache_size=600, disk_cache=None):
+        """
+        Initialize model
+        :param thumbnail_size: (width, height) of the thumbnails
+        :param max_workers: Threads making thumbnails
+        :param cache_size: Thumbnails kept in memory
+        :param disk_cache: ThumbnailDiskCache, by default in the user's cache location
+        """
+        super().__init__()
+        from wsi_viewer import LRUCache
+
+        self.thumbnail_size = thumbnail_size
+        self.disk_cache = disk_cache or ThumbnailDiskCache()
+        self.paths = []
+        self.rows = {}  # Path -> row
+        self.pixmaps = LRUCache(cache_size)  # Path -> QPixmap
+        self.failed = {}  # Path -> error message of its thumbnail
+        self.error = ''  # Error listing the directory
+        self.requested = set()
+        self.pending = []  # Stack of paths waiting for a worker
+        self.visible_rows = (0, -1)
+        self.lock = threading.Lock()
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max_workers)
+        self.active_workers = 0
+
+        self.placeholder = QPixmap(*thumbnail_size)
+        self.placeholder.fill(QColor(230, 230, 230))
+
+    def set_directory(self, directory):
+        """List the slides of a directory"""
+        with self.lock:
+            self.pending.clear()
+            self.requested.clear()
+        self.beginResetModel()
+        self.error = ''
+        try:
+            with os.scandir(directory) as entries:
+                self.paths = sorted((entry.path for entry in entries
+                                     if entry.is_file() and entry.name.lower().endswith(SLIDE_EXTENSIONS)),
+                                    key=lambda path: os.path.basename(path).lower())
+        except OSError as e:
+            self.error = e.strerror or str(e)
+            self.paths = []
+        self.rows = {path: row for row, path in enumerate(self.paths)}
+        self.visible_rows = (0, -1)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self.paths[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.basename(path)
+        if role == Qt.ToolTipRole:
+            error = f'\nNo thumbnail: {self.failed[path]}' if path in self.failed else ''
+            try:
+                return f'{path}\n{os.path.getsize(path) / (1024 * 1024):.0f} MB{error}'
+            except OSError:
+                return path + error
+        if role == Qt.UserRole:
+            return path
+        if role == Qt.DecorationRole:
+            return self.thumbnail(path)
+        return None
+
+    def thumbnail(self, path):
+        """Thumbnail pixmap, the placeholder while it's being made"""
+        try:
+            return self.pixmaps[path]
+        except KeyError:
+            pass
+        if path in self.failed:
+            return self.placeholder
+        # Small JPEG files, reading them here keeps revisited folders instant
+        image = self.disk_cache.load(path, self.thumbnail_size)
+        if image is not None:
+            pixmap = self.pixmaps[path] = QPixmap.fromImage(image)
+            return pixmap
+        self.request(path)
+        return self.placeholder
+
+    def request(self, path):
+        with self.lock:
+            if path in self.requested:
+                return
+            self.requested.add(path)
+            self.pending.append(path)
+            start = self.active_workers < self.thread_pool.maxThreadCount()
+            if start:
+                self.active_workers += 1
+        if start:
+            runnable = ThumbnailRunnable(self)
+            runnable.signals.thumbnail_ready.connect(self.on_thumbnail_ready)
+            self.thread_pool.start(runnable)
+
+    def take_request(self):
+        """Newest requested path still in view, or None (called by workers)
+
+        Returning None ends the calling worker. It stops counting as active
+        under the same lock, so request() starts a new worker for any path
+        queued after this.
+        """
+        with self.lock:
+            first, last = self.visible_rows
+            while self.pending:
+                path = self.pending.pop()
+                if first <= self.rows.get(path, -1) <= last:
+                    return path
+                # Requested again by data() once it's back in view
+                self.requested.discard(path)
+            self.active_workers -= 1
+            return None
+
+    def set_visible_rows(self, first, last):
+        with self.lock:
+            self.visible_rows = (first, last)
+
+    def on_thumbnail_ready(self, path, image, error):
+        with self.lock:
+            self.requested.discard(path)
+        row = self.rows.get(path)
+        if row is None:
+            return  # Another directory meanwhile
+        if image is None:
+            self.failed[path] = error
+        else:
+            self.pixmaps[path] = QPixmap.fromImage(image)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole, Qt.ToolTipRole])
+
+    def shutdown(self):
+        """Drop pending requests and wait for the running ones"""
+        with self.lock:
+            self.pending.clear()
+        self.thread_pool.waitForDone()
+
+
+class SlideLibraryWidget(QWidget):
+    """Thumbnail grid of the slides in a folder"""
+    slide_activated = pyqtSignal(str, name='slideActivated')
+
+    def __init__(self, parent=None, thumbnail_size=(256, 128)):
+        super().__init__(parent)
+        self.model = SlideLibraryModel(thumbnail_size)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(2, 2, 2, 2)
+        self.directory_label = QLabel()
+        self.directory_label.setWordWrap(True)
+        layout.addWidget(self.directory_label)
+
+        self.view = QListView()
+        self.view.setViewMode(QListView.IconMode)
+        self.view.setResizeMode(QListView.Adjust)
+        self.view.setMovement(QListView.Static)
+        self.view.setWordWrap(True)
+        # Uniform items let the view lay out thousands of slides without asking for each
+        self.view.setUniformItemSizes(True)
+        self.view.setIconSize(QSize(*thumbnail_size))
+        self.view.setGridSize(QSize(thumbnail_size[0] + 12, thumbnail_size[1] + 36))
+        self.view.setModel(self.model)
+        self.view.activated.connect(self.on_activated)
+        self.view.verticalScrollBar().valueChanged.connect(self.update_visible_rows)
+        self.model.modelReset.connect(self.update_visible_rows)
+        layout.addWidget(self.view)
+
+    def set_directory(self, directory):
+        self.model.set_directory(directory)
+        self.directory_label.setText(f'{directory}\nError listing slides: {self.model.error}'
+                                     if self.model.error else directory)
+        self.view.scrollToTop()
+
+    def update_visible_rows(self):
+        """Tell the model which rows are in view, plus one page before and after"""
+        # Items sit on a uniform grid, scrolled by pixels
+        grid = self.view.gridSize()
+        viewport = self.view.viewport().size()
+        columns = max(1, viewport.width() // grid.width())
+        lines = viewport.height() // grid.height() + 2
+        first_line = self.view.verticalScrollBar().value() // grid.height()
+        self.model.set_visible_rows(max(0, first_line - lines) * columns, (first_line + 2 * lines) * columns - 1)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_visible_rows()
+
+    def on_activated(self, index):
+        self.slide_activated.emit(self.model.data(index, Qt.UserRole))
+
+    def shutdown(self):
+        self.model.shutdown()
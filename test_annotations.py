@@ -0,0 +1,85 @@
+"""
+Annotation Tests
+Streaming GeoJSON reading with every chunk size, so chunk boundaries fall
+inside the "features" key, inside features and inside multi-byte characters
+"""
+
+import json
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import pytest
+
+from annotations import iter_geojson_features
+
+
+def feature(index):
+    return {'type': 'Feature', 'properties': {'name': f'Région {index}', 'classification': {'name': 'Tumor'}},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[index, 0], [index + 5, 0], [index, 5], [index, 0]]]}}
+
+
+FEATURES = [feature(index) for index in range(5)]
+
+
+def write(tmp_path, text, encoding='utf-8'):
+    path = tmp_path / 'annotations.geojson'
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def read_all(path, chunk_size):
+    return list(iter_geojson_features(path, chunk_size=chunk_size))
+
+
+def all_chunk_sizes(path):
+    return range(1, os.path.getsize(path) + 2)
+
+
+def test_feature_collection_any_chunk_size(tmp_path):
+    # Keys before "features", which must not be taken for features
+    text = json.dumps({'type': 'FeatureCollection', 'name': 'features', 'crs': {'type': 'name'},
+                       'features': FEATURES}, ensure_ascii=False, indent=1)
+    path = write(tmp_path, text)
+    for chunk_size in all_chunk_sizes(path):
+        assert read_all(path, chunk_size) == FEATURES, chunk_size
+
+
+def test_feature_array_with_leading_whitespace(tmp_path):
+    path = write(tmp_path, '\n  \t' + json.dumps(FEATURES, ensure_ascii=False), 'utf-8-sig')
+    for chunk_size in all_chunk_sizes(path):
+        assert read_all(path, chunk_size) == FEATURES, chunk_size
+
+
+def test_single_feature(tmp_path):
+    path = write(tmp_path, json.dumps(FEATURES[0], ensure_ascii=False))
+    for chunk_size in (1, 7, 1 << 20):
+        assert read_all(path, chunk_size) == [FEATURES[0]]
+
+
+def test_empty_feature_collection(tmp_path):
+    path = write(tmp_path, '{"type": "FeatureCollection", "features": [ ]}')
+    for chunk_size in all_chunk_sizes(path):
+        assert read_all(path, chunk_size) == []
+
+
+@pytest.mark.parametrize('text', ['[1, 2]', '"features"', '42', '{"type": "FeatureCollection", "features": [',
+                                  '[{"type": "Feature"}, {"type": ', '[{"type": "Feature"} 7]'])
+def test_invalid_files(tmp_path, text):
+    path = write(tmp_path, text)
+    for chunk_size in (1, 5, 1 << 20):
+        with pytest.raises(ValueError):
+            read_all(path, chunk_size)
+
+
+def test_progress_stops_reading(tmp_path):
+    path = write(tmp_path, json.dumps(FEATURES))
+    fractions = []
+
+    def progress(fraction):
+        fractions.append(fraction)
+        return fraction < 0.5
+
+    features = list(iter_geojson_features(path, chunk_size=64, progress=progress))
+    assert features == FEATURES[:len(features)] and len(features) < len(FEATURES)
+    assert fractions == sorted(fractions) and 0.5 <= fractions[-1] < 1
@@ -0,0 +1,88 @@
+"""
+Image Writer Tests
+Files written strip by strip are read back with Pillow
+"""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_writer import BUFFERED_MAX_BYTES, check_image_size, open_image_writer
+
+
+def random_image(width=301, height=203):
+    # Odd sizes exercise BMP row padding and a last TIFF strip shorter than the others
+    return np.random.default_rng(1).integers(0, 256, (height, width, 3), np.uint8)
+
+
+def write_strips(path, format, pixels, strip=17, metadata=None):
+    height, width = pixels.shape[:2]
+    writer = open_image_writer(str(path), format, width, height, metadata)
+    for top in range(0, height, strip):
+        writer.write(pixels[top:top + strip])
+    writer.close()
+
+
+@pytest.mark.parametrize('format', ['PNG', 'TIFF', 'BMP'])
+def test_round_trip(tmp_path, format):
+    pixels = random_image()
+    path = tmp_path / f'image.{format.lower()}'
+    write_strips(path, format, pixels)
+    with Image.open(path) as image:
+        assert image.format == format and image.size == (301, 203)
+        assert np.array_equal(np.asarray(image.convert('RGB')), pixels)
+
+
+def test_png_metadata(tmp_path):
+    path = tmp_path / 'image.png'
+    write_strips(path, 'PNG', random_image(), metadata={'Level': '2', 'Original File': 'slide µm.svs'})
+    with Image.open(path) as image:
+        assert image.text == {'Level': '2', 'Original File': 'slide µm.svs'}
+
+
+def test_tiff_description_and_strips(tmp_path):
+    path = tmp_path / 'image.tiff'
+    write_strips(path, 'TIFF', random_image(), metadata={'Level': '2'})
+    with Image.open(path) as image:
+        assert image.tag_v2[270] == 'Level: 2'
+        assert image.tag_v2[259] == 8  # Deflate
+        assert len(image.tag_v2[273]) == 4  # 203 rows in strips of 64
+
+
+def test_jpeg_encoded_on_close(tmp_path):
+    pixels = np.full((100, 120, 3), (10, 200, 90), np.uint8)
+    path = tmp_path / 'image.jpg'
+    writer = open_image_writer(str(path), 'JPEG', 120, 100)
+    assert not writer.incremental
+    writer.write(pixels[:60])
+    assert not path.exists()
+    writer.write(pixels[60:])
+    writer.close()
+    with Image.open(path) as image:
+        assert image.size == (120, 100)
+        assert np.abs(np.asarray(image).astype(int) - pixels).max() <= 3
+
+
+def test_wrong_rows_rejected(tmp_path):
+    writer = open_image_writer(str(tmp_path / 'image.png'), 'PNG', 10, 4)
+    with pytest.raises(ValueError):
+        writer.write(np.zeros((2, 11, 3), np.uint8))
+    writer.write(np.zeros((3, 10, 3), np.uint8))
+    with pytest.raises(ValueError):
+        writer.write(np.zeros((2, 10, 3), np.uint8))
+    with pytest.raises(ValueError):
+        writer.close()
+    writer.abort()
+    assert not os.path.exists(tmp_path / 'image.png')
+
+
+def test_check_image_size():
+    check_image_size('PNG', 100000, 100000)
+    check_image_size('JPEG', 4000, 4000)
+    with pytest.raises(ValueError):
+        check_image_size('JPEG', 70000, 10)
+    with pytest.raises(ValueError):
+        check_image_size('JPEG', 20000, 20000)
+    assert 20000 * 20000 * 3 > BUFFERED_MAX_BYTES
@@ -0,0 +1,139 @@
+"""
+Patch Extraction Tests
+PatchGrid positions, extract_patches pixels and resumable PatchStore exports,
+on an in-memory ImageSlide
+"""
+
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import openslide
+import pytest
+from PIL import Image
+
+import patches
+from patches import PatchGrid, PatchStore, extract_patches, export_patch_store
+
+
+class FakeSlide:
+    """Slide geometry without pixels, all PatchGrid reads"""
+
+    def __init__(self, dimensions, downsamples=(1.0,), mpp=None):
+        self.dimensions = dimensions
+        self.level_downsamples = downsamples
+        self.level_count = len(downsamples)
+        self.level_dimensions = [(int(dimensions[0] / value), int(dimensions[1] / value)) for value in downsamples]
+        self.properties = {'openslide.mpp-x': str(mpp)} if mpp else {}
+
+
+def random_slide(width=900, height=700):
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), np.uint8)
+    return openslide.ImageSlide(Image.fromarray(pixels)), pixels
+
+
+def test_grid_positions_full_patches_in_row_order():
+    grid = PatchGrid(FakeSlide((1000, 600)), patch_size=256)
+    assert grid.level == 0 and grid.read_size == 256
+    assert grid.positions.tolist() == [[0, 0], [256, 0], [512, 0], [0, 256], [256, 256], [512, 256]]
+
+
+def test_grid_stride_overlaps_patches():
+    grid = PatchGrid(FakeSlide((512, 256)), patch_size=256, stride=128)
+    assert grid.positions.tolist() == [[0, 0], [128, 0], [256, 0]]
+
+
+def test_grid_level_positions_in_level_0_pixels():
+    grid = PatchGrid(FakeSlide((4096, 2048), (1.0, 4.0)), patch_size=256, level=1)
+    assert grid.read_size == 256
+    assert grid.positions.tolist() == [[0, 0], [1024, 0], [2048, 0], [3072, 0],
+                                       [0, 1024], [1024, 1024], [2048, 1024], [3072, 1024]]
+
+
+def test_grid_mpp_reads_finer_level_and_resizes():
+    # 0.25 µm/pixel slide, 0.5 µm/pixel patches: level 0 read at twice the patch size
+    grid = PatchGrid(FakeSlide((2048, 1024), (1.0, 4.0), mpp=0.25), patch_size=256, mpp=0.5)
+    assert grid.level == 0 and grid.read_size == 512
+    assert grid.positions.tolist() == [[0, 0], [512, 0], [1024, 0], [1536, 0],
+                                       [0, 512], [512, 512], [1024, 512], [1536, 512]]
+
+
+def test_grid_smaller_than_a_patch_is_empty():
+    assert len(PatchGrid(FakeSlide((100, 600)), patch_size=256)) == 0
+
+
+def test_grid_errors():
+    with pytest.raises(ValueError):
+        PatchGrid(FakeSlide((1000, 600)), mpp=0.5)
+    with pytest.raises(ValueError):
+        PatchGrid(FakeSlide((1000, 600)), level=1)
+
+
+def test_extract_patches_pixels():
+    slide, pixels = random_slide()
+    patches = list(extract_patches(slide, patch_size=128, workers=2, prefetch=3))
+    assert len(patches) == 7 * 5
+    for patch, (x, y) in patches:
+        assert np.array_equal(patch, pixels[y:y + 128, x:x + 128])
+
+
+def test_extract_patches_stops_early():
+    slide, pixels = random_slide()
+    stream = extract_patches(slide, patch_size=128, workers=2, prefetch=2)
+    patch, position = next(stream)
+    stream.close()
+    assert position == (0, 0) and np.array_equal(patch, pixels[:128, :128])
+
+
+def test_export_patch_store(tmp_path):
+    slide, pixels = random_slide()
+    store = export_patch_store(slide, str(tmp_path / 'store'), patch_size=128, shard_size=8, workers=2)
+    assert len(store) == 35 and store.complete and len(store.shards) == 5
+    for index in range(len(store)):
+        x, y = store.coordinates[index]
+        assert np.array_equal(store[index], pixels[y:y + 128, x:x + 128])
+    assert np.array_equal(store[-1], store[34])
+    with pytest.raises(IndexError):
+        store[35]
+
+
+def test_export_resumes_from_done(tmp_path, monkeypatch):
+    slide, pixels = random_slide()
+    directory = str(tmp_path / 'store')
+    read = []
+    read_patch = patches.read_patch
+
+    def counting_read_patch(tile_manager, grid, x, y):
+        read.append((x, y))
+        return read_patch(tile_manager, grid, x, y)
+
+    monkeypatch.setattr(patches, 'read_patch', counting_read_patch)
+    # Stopped after the first flush of 10 patches
+    assert export_patch_store(slide, directory, patch_size=128, shard_size=8, workers=1, prefetch=1,
+                              flush_every=10, progress=lambda fraction: False) is None
+    partial = PatchStore(directory)
+    done = int(partial.done.sum())
+    assert 10 <= done < 35 and not partial.complete
+    del partial
+
+    read.clear()
+    store = export_patch_store(slide, directory, patch_size=128, shard_size=8, workers=2)
+    assert store.complete
+    assert len(read) == 35 - done
+    for index in range(len(store)):
+        x, y = store.coordinates[index]
+        assert np.array_equal(store[index], pixels[y:y + 128, x:x + 128])
+
+    # A complete store is reopened without reading
+    read.clear()
+    assert export_patch_store(slide, directory, patch_size=128, shard_size=8).complete
+    assert not read
+
+
+def test_export_refuses_other_settings(tmp_path):
+    slide, _ = random_slide()
+    directory = str(tmp_path / 'store')
+    export_patch_store(slide, directory, patch_size=128, shard_size=8)
+    with pytest.raises(ValueError):
+        export_patch_store(slide, directory, patch_size=256, shard_size=8)
@@ -0,0 +1,97 @@
+"""
+Slide Catalog Tests
+Incremental rescans of small tiled TIFF slides written with tifffile
+"""
+
+import os
+
+import numpy as np
+import pytest
+import tifffile
+
+from slide_catalog import SlideCatalog
+
+
+def write_slide(path, width=768, height=512):
+    tifffile.imwrite(str(path), np.zeros((height, width, 3), np.uint8), tile=(256, 256), photometric='rgb')
+    return str(path)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = SlideCatalog(str(tmp_path / 'catalog.sqlite'))
+    yield catalog
+    catalog.close()
+
+
+@pytest.fixture
+def slides(tmp_path):
+    """Directory with a.tif, and b.tif in a subdirectory"""
+    directory = tmp_path / 'slides'
+    (directory / 'sub').mkdir(parents=True)
+    write_slide(directory / 'a.tif')
+    write_slide(directory / 'sub' / 'b.tif', 1024, 256)
+    return directory
+
+
+def counts(added=0, updated=0, removed=0, unchanged=0, failed=0):
+    return {'added': added, 'updated': updated, 'removed': removed, 'unchanged': unchanged, 'failed': failed}
+
+
+def test_scan_reads_only_new_and_changed_slides(catalog, slides):
+    assert catalog.scan([str(slides)]) == counts(added=2)
+    assert catalog.scan([str(slides)]) == counts(unchanged=2)
+    write_slide(slides / 'a.tif', 512, 512)
+    os.utime(slides / 'a.tif', ns=(1, 1))
+    assert catalog.scan([str(slides)]) == counts(updated=1, unchanged=1)
+    assert catalog.get(str(slides / 'a.tif')).dimensions == (512, 512)
+
+
+def test_scan_removes_deleted_slides(catalog, slides):
+    catalog.scan([str(slides)])
+    os.remove(slides / 'sub' / 'b.tif')
+    assert catalog.scan([str(slides)]) == counts(removed=1, unchanged=1)
+    assert catalog.find() == [str(slides / 'a.tif')]
+
+
+def test_non_recursive_rescan_keeps_subdirectory_slides(catalog, slides):
+    catalog.scan([str(slides)])
+    assert catalog.scan([str(slides)], recursive=False) == counts(unchanged=1)
+    os.remove(slides / 'a.tif')
+    assert catalog.scan([str(slides)], recursive=False) == counts(removed=1)
+    assert catalog.find() == [str(slides / 'sub' / 'b.tif')]
+
+
+def test_scan_leaves_sibling_directories_alone(catalog, tmp_path, slides):
+    # 'slides2' starts with the name of 'slides' but isn't inside it
+    other = tmp_path / 'slides2'
+    other.mkdir()
+    write_slide(other / 'c.tif')
+    catalog.scan([str(slides), str(other)])
+    os.remove(slides / 'a.tif')
+    assert catalog.scan([str(slides)]) == counts(removed=1, unchanged=1)
+    assert str(other / 'c.tif') in catalog.find()
+
+
+def test_unreadable_slide_is_failed_until_it_changes(catalog, slides):
+    (slides / 'broken.svs').write_bytes(b'not a slide')
+    assert catalog.scan([str(slides)]) == counts(added=2, failed=1)
+    assert catalog.scan([str(slides)]) == counts(unchanged=3)
+    assert catalog.get(str(slides / 'broken.svs')) is None
+    assert str(slides / 'broken.svs') not in catalog.find()
+
+
+def test_find_and_get(catalog, slides):
+    catalog.scan([str(slides)])
+    assert catalog.find(vendor='generic-tiff', min_size=1000) == [str(slides / 'sub' / 'b.tif')]
+    assert catalog.find(vendor='aperio') == []
+    record = catalog.get(str(slides / 'sub' / 'b.tif'))
+    assert record.dimensions == (1024, 256) and record.level_count == 1
+    assert record.properties['openslide.vendor'] == 'generic-tiff'
+
+
+def test_viewport(catalog, slides):
+    path = str(slides / 'a.tif')
+    assert catalog.viewport(path) is None
+    catalog.set_viewport(path, 100.0, 50.0, 0.25, 1)
+    assert catalog.viewport(path) == (100.0, 50.0, 0.25, 1)
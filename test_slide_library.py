@@ -0,0 +1,115 @@
+"""
+Slide Library Tests
+Thumbnail worker accounting of SlideLibraryModel, with make_thumbnail stubbed
+so no slide files are needed
+"""
+
+import os
+import time
+import threading
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PIL import Image
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+
+import slide_library
+
+app = QApplication.instance() or QApplication([])
+
+
+def wait_until(condition, timeout=10):
+    """Process events until condition() is true, returns its last value"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    return condition()
+
+
+def make_model(tmp_path, monkeypatch, count=60, max_workers=2):
+    slides = tmp_path / 'slides'
+    slides.mkdir()
+    for index in range(count):
+        (slides / f'slide{index:03}.svs').write_bytes(b'')
+    gate = threading.Event()
+
+    def make_thumbnail(path, size):
+        gate.wait(10)
+        return Image.new('RGB', size, (200, 100, 50))
+
+    monkeypatch.setattr(slide_library, 'make_thumbnail', make_thumbnail)
+    model = slide_library.SlideLibraryModel(thumbnail_size=(32, 16), max_workers=max_workers,
+                                            disk_cache=slide_library.ThumbnailDiskCache(str(tmp_path / 'cache')))
+    model.set_directory(str(slides))
+    return model, gate
+
+
+def show_rows(model, first, last):
+    """What the view does when rows scroll into view"""
+    model.set_visible_rows(first, last)
+    for row in range(first, last + 1):
+        model.data(model.index(row), Qt.DecorationRole)
+
+
+def served(model, first, last):
+    return all(model.paths[row] in model.pixmaps for row in range(first, last + 1))
+
+
+def test_rows_served_after_scrolling_away_and_back(tmp_path, monkeypatch):
+    model, gate = make_model(tmp_path, monkeypatch)
+    try:
+        show_rows(model, 0, 9)
+        # Workers are busy with the first rows while the view moves on and back
+        show_rows(model, 40, 49)
+        show_rows(model, 20, 29)
+        show_rows(model, 0, 9)
+        gate.set()
+        assert wait_until(lambda: served(model, 0, 9))
+        assert wait_until(lambda: model.active_workers == 0)
+        assert not model.pending
+
+        # Workers that ran out of work must not block later requests
+        show_rows(model, 50, 59)
+        assert wait_until(lambda: served(model, 50, 59))
+        assert wait_until(lambda: model.active_workers == 0)
+    finally:
+        gate.set()
+        model.shutdown()
+
+
+def test_request_after_workers_exit_starts_a_worker(tmp_path, monkeypatch):
+    model, gate = make_model(tmp_path, monkeypatch, count=4, max_workers=1)
+    gate.set()
+    try:
+        show_rows(model, 0, 1)
+        # Workers exit without the GUI thread processing their signals
+        model.thread_pool.waitForDone()
+        assert model.active_workers == 0
+        show_rows(model, 0, 3)
+        assert wait_until(lambda: served(model, 0, 3))
+    finally:
+        model.shutdown()
+
+
+def test_failed_thumbnail_error_in_tooltip(tmp_path, monkeypatch):
+    model, gate = make_model(tmp_path, monkeypatch, count=1)
+
+    def make_thumbnail(path, size):
+        raise OSError("Unsupported or missing image file")
+
+    monkeypatch.setattr(slide_library, 'make_thumbnail', make_thumbnail)
+    try:
+        show_rows(model, 0, 0)
+        assert wait_until(lambda: model.paths[0] in model.failed)
+        assert 'Unsupported or missing image file' in model.data(model.index(0), Qt.ToolTipRole)
+    finally:
+        model.shutdown()
+
+
+def test_listing_error(tmp_path):
+    model = slide_library.SlideLibraryModel(disk_cache=slide_library.ThumbnailDiskCache(str(tmp_path / 'cache')))
+    model.set_directory(str(tmp_path / 'missing'))
+    assert model.rowCount() == 0
+    assert model.error
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Viewport Trace Recording and Replay
+Records navigation sessions of the viewer and replays them headlessly
+against the tile layer to measure tile latency and missing tile area
+"""
+
+import sys
+import os
+import json
+import time
+import datetime
+import argparse
+
+
+class ViewportRecorder:
+    """Writes timestamped viewport rects and levels to a JSON Lines file"""
+
+    def __init__(self, path, slide_path, slide_dimensions, viewport_size):
+        """
+        Initialize recorder
+        :param path: Output trace file
+        :param slide_path: Path of the slide being viewed
+        :param slide_dimensions: Level 0 size (width, height)
+        :param viewport_size: Viewport size in screen pixels (width, height)
+        """
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+        self.start = time.monotonic()
+        self.step_count = 0
+        self._last = None
+
+        # First line describes the session
+        header = {
+            'slide': slide_path,
+            'dimensions': list(slide_dimensions),
+            'viewport': list(viewport_size),
+            'recorded': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.file.write(json.dumps(header) + '\n')
+
+    def record(self, rect, scale, level):
+        """Record one viewport
+        :param rect: Visible region in level 0 pixels (QRectF)
+        :param scale: Screen pixels per level 0 pixel
+        :param level: Level displayed by the viewer
+        """
+        if self.file is None:
+            return
+        view = [round(rect.x(), 1), round(rect.y(), 1), round(rect.width(), 1), round(rect.height(), 1)]
+        # Scrollbar and event filter updates often report the same viewport twice
+        if (view, level) == self._last:
+            return
+        self._last = (view, level)
+
+        step = {
+            't': round(time.monotonic() - self.start, 4),
+            'rect': view,
+            'scale': scale,
+            'level': level,
+        }
+        self.file.write(json.dumps(step) + '\n')
+        self.step_count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_trace(path):
+    """Read a trace file, returns (header, steps)"""
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        raise ValueError(f"Empty trace file: {path}")
+    header = json.loads(lines[0])
+    steps = [json.loads(line) for line in lines[1:]]
+    return header, steps
+
+
+def process_bytes_read():
+    """Bytes read by this process from files, where the platform reports it"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def replay_trace(trace_path, slide_path=None, speed=1.0, tile_size=512, cache_size=128,
+                 align_to_native=True, settle_timeout=10.0, backend='threads'):
+    """
+    Replay a recorded trace against the tile layer without a GUI
+    :param trace_path: Trace file written by ViewportRecorder
+    :param slide_path: Slide to replay against, defaults to the recorded one
+    :param speed: Playback speed multiplier
+    :param align_to_native: Align the tile grid to the slide's storage tiles
+    :param settle_timeout: Seconds to wait for outstanding tiles after the last step
+    :param backend: Tile decode backend, 'threads' or 'processes'
+    :return: Report dictionary
+    """
+    from PyQt5.QtCore import QCoreApplication, QRectF
+    import openslide
+    from wsi_viewer import TileManager
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+
+    header, steps = load_trace(trace_path)
+    path = slide_path or header['slide']
+    slide = openslide.OpenSlide(path)
+    manager = TileManager(tile_size=tile_size, cache_size=cache_size, align_to_native=align_to_native)
+    manager.set_decode_backend(backend)
+    # Worker process start-up is not part of the navigation being measured
+    for future in manager.process_pool_ready:
+        future.result()
+    manager.set_slide(slide, path)
+    tile_sizes = [list(size) for size in manager.level_tile_sizes]
+
+    results = []
+    outstanding = {}  # Step index -> tile keys not loaded yet
+
+    def on_tile_ready(level, x, y):
+        now = time.perf_counter()
+        tile_key = (x, y, level)
+        for index in list(outstanding):
+            keys = outstanding[index]
+            keys.discard(tile_key)
+            if not keys:
+                results[index]['latency_ms'] = (now - results[index]['started']) * 1000
+                del outstanding[index]
+
+    manager.tile_ready.connect(on_tile_ready)
+
+    bytes_read_before = manager.bytes_read
+    io_before = process_bytes_read()
+    start = time.perf_counter()
+
+    try:
+        for index, step in enumerate(steps):
+            # Wait for the recorded time of the step, delivering loaded tiles meanwhile
+            due = step['t'] / speed
+            while time.perf_counter() - start < due:
+                app.processEvents()
+                time.sleep(0.001)
+
+            x, y, width, height = step['rect']
+            view_rect = QRectF(x, y, width, height)
+            scale = step['scale']
+
+            # Same sequence as the viewer's update_visible_region
+            manager.update_level_bias(scale, view_rect)
+            level = manager.best_level(scale)
+            level_scale = slide.level_downsamples[level]
+            level_rect = QRectF(x / level_scale, y / level_scale, width / level_scale, height / level_scale)
+            manager.clean_invisible_tiles(level, level_rect)
+
+            # Missing (checkerboard) area at the moment the viewport is shown
+            tiles = manager.get_tile_coordinates(level, level_rect)
+            visible = level_rect.intersected(QRectF(0, 0, *slide.level_dimensions[level]))
+            visible_area = max(1.0, visible.width() * visible.height())
+            missing = set()
+            missing_area = 0.0
+            for tile_x, tile_y in tiles:
+                if (tile_x, tile_y, level) not in manager.cache:
+                    missing.add((tile_x, tile_y, level))
+                    overlap = QRectF(*manager.tile_rect(level, tile_x, tile_y)).intersected(visible)
+                    missing_area += overlap.width() * overlap.height()
+
+            started = time.perf_counter()
+            results.append({
+                'step': index,
+                't': step['t'],
+                'level': level,
+                'tiles': len(tiles),
+                'missing_tiles': len(missing),
+                'checkerboard': missing_area / visible_area,
+                'latency_ms': 0.0 if not missing else None,
+                'started': started,
+            })
+            if missing:
+                outstanding[index] = missing
+                manager.request_region(level, level_rect)
+
+        # Let outstanding tiles of the last steps arrive
+        deadline = time.perf_counter() + settle_timeout
+        while (manager.active_workers or manager.queued) and time.perf_counter() < deadline:
+            app.processEvents()
+            time.sleep(0.001)
+        app.processEvents()
+        elapsed = time.perf_counter() - start
+    finally:
+        manager.close()
+        slide.close()
+
+    io_after = process_bytes_read()
+    latencies = sorted(r['latency_ms'] for r in results if r['latency_ms'] is not None)
+    for r in results:
+        del r['started']
+
+    def percentile(values, fraction):
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+    return {
+        'trace': trace_path,
+        'slide': path,
+        'backend': backend,
+        'steps': results,
+        'summary': {
+            'step_count': len(results),
+            'duration_s': elapsed,
+            'latency_median_ms': percentile(latencies, 0.5),
+            'latency_p95_ms': percentile(latencies, 0.95),
+            'latency_max_ms': latencies[-1] if latencies else None,
+            'steps_never_ready': sum(1 for r in results if r['latency_ms'] is None),
+            'checkerboard_mean': (sum(r['checkerboard'] for r in results) / len(results)) if results else 0.0,
+            'tiles_loaded': manager.tiles_loaded,
+            'native_tile_reads': manager.native_tile_reads,
+            'tile_sizes': tile_sizes,
+            'bytes_decoded': manager.bytes_read - bytes_read_before,
+            'bytes_read_from_disk': (io_after - io_before) if io_before is not None and io_after is not None else None,
+        },
+    }
+
+
+def format_report(report):
+    """Format a replay report as text"""
+    def ms(value):
+        return '-' if value is None else f'{value:.1f}'
+
+    lines = [f"Replay of {os.path.basename(report['trace'])} on {os.path.basename(report['slide'])} "
+             f"({report['backend']} backend)",
+             '',
+             f"{'step':>5} {'t (s)':>8} {'level':>5} {'tiles':>5} {'missing':>7} {'checker':>8} {'ready (ms)':>10}"]
+    for r in report['steps']:
+        lines.append(f"{r['step']:>5} {r['t']:>8.2f} {r['level']:>5} {r['tiles']:>5} {r['missing_tiles']:>7} "
+                     f"{r['checkerboard']:>7.1%} {ms(r['latency_ms']):>10}")
+
+    summary = report['summary']
+    disk = summary['bytes_read_from_disk']
+    lines += [
+        '',
+        f"Steps:              {summary['step_count']} ({summary['duration_s']:.2f} s)",
+        f"Tile-ready latency: median {ms(summary['latency_median_ms'])} ms, "
+        f"p95 {ms(summary['latency_p95_ms'])} ms, max {ms(summary['latency_max_ms'])} ms",
+        f"Never ready:        {summary['steps_never_ready']} steps",
+        f"Checkerboard area:  {summary['checkerboard_mean']:.1%} mean",
+        f"Tiles loaded:       {summary['tiles_loaded']} "
+        f"(tile sizes per level: {', '.join(f'{w}x{h}' for w, h in summary['tile_sizes'])})",
+        f"Native tile reads:  {summary['native_tile_reads']}",
+        f"Bytes decoded:      {summary['bytes_decoded'] / (1024 * 1024):.1f} MB",
+        f"Bytes read:         {'-' if disk is None else f'{disk / (1024 * 1024):.1f} MB'}",
+    ]
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded viewer navigation trace')
+    parser.add_argument('trace', help='Trace file recorded with Tools > Record Navigation')
+    parser.add_argument('--slide', help='Slide to replay against (default: the recorded slide)')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed multiplier')
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--cache-size', type=int, default=128, help='Tile cache capacity in tiles')
+    parser.add_argument('--no-align', action='store_true',
+                        help="Use a fixed tile grid instead of aligning to the slide's storage tiles")
+    parser.add_argument('--compare-alignment', action='store_true',
+                        help='Replay with the fixed and the aligned tile grid and report the decode savings')
+    parser.add_argument('--backend', choices=('threads', 'processes'), default='threads',
+                        help='Decode tiles on threads or in worker processes')
+    parser.add_argument('--compare-backends', action='store_true',
+                        help='Replay with both decode backends and compare tile latency')
+    parser.add_argument('--json', help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    report = replay_trace(args.trace, args.slide, speed=args.speed,
+                          tile_size=args.tile_size, cache_size=args.cache_size,
+                          align_to_native=not args.no_align, backend=args.backend)
+    print(format_report(report))
+
+    if args.compare_alignment:
+        baseline = replay_trace(args.trace, args.slide, speed=args.speed,
+                                tile_size=args.tile_size, cache_size=args.cache_size,
+                                align_to_native=False)
+        report['fixed_grid_summary'] = baseline['summary']
+        aligned_reads = report['summary']['native_tile_reads']
+        fixed_reads = baseline['summary']['native_tile_reads']
+        saving = 1 - aligned_reads / fixed_reads if fixed_reads else 0.0
+        print('')
+        print(f"Native tile reads, fixed {args.tile_size}px grid: {fixed_reads}")
+        print(f"Native tile reads, aligned grid:     {aligned_reads}")
+        print(f"Decode savings:                      {saving:.1%}")
+
+    if args.compare_backends:
+        other = 'processes' if args.backend == 'threads' else 'threads'
+        other_report = replay_trace(args.trace, args.slide, speed=args.speed,
+                                    tile_size=args.tile_size, cache_size=args.cache_size,
+                                    align_to_native=not args.no_align, backend=other)
+        report[f'{other}_summary'] = other_report['summary']
+        print('')
+        for backend, summary in ((args.backend, report['summary']), (other, other_report['summary'])):
+            median = summary['latency_median_ms']
+            p95 = summary['latency_p95_ms']
+            print(f"{backend + ':':<11} median {'-' if median is None else f'{median:.1f}'} ms, "
+                  f"p95 {'-' if p95 is None else f'{p95:.1f}'} ms, "
+                  f"{summary['duration_s']:.2f} s, never ready {summary['steps_never_ready']} steps")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
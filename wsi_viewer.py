@@ -3,10 +3,13 @@ import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QSplitter, QTextEdit, QLabel, 
                              QScrollArea, QFrame, QFileDialog, QMenuBar, 
-                             QAction, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem,
-                             QStackedLayout, QSlider, QPushButton, QProgressBar, QToolBar, QMessageBox, QTreeWidget, QTreeWidgetItem, QProgressDialog)
-from PyQt5.QtCore import Qt, QRect, QRectF, QPoint, QTimer, QThread, pyqtSignal, QPointF, QObject, QEvent
+                             QAction, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QGraphicsItem,
+                             QStackedLayout, QSlider, QPushButton, QProgressBar, QToolBar, QMessageBox, QTreeWidget, QTreeWidgetItem, QProgressDialog,
+                             QGroupBox, QFormLayout, QDockWidget, QComboBox, QInputDialog)
+from PyQt5.QtCore import (Qt, QRect, QRectF, QPoint, QTimer, QThread, pyqtSignal, QPointF, QObject, QEvent,
+                          QRunnable, QThreadPool, QVariantAnimation, QAbstractAnimation, QEasingCurve)
 from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor, QImage, QTransform, QIcon
+from PyQt5 import sip
 import openslide
 import numpy as np
 from PIL import Image
@@ -16,34 +19,41 @@ import traceback
 import math
 import collections
 import datetime
+import time
+import struct
+import sqlite3
+import threading
 
 class LRUCache:
     """LRU Cache implementation for tile caching"""
     
-    def __init__(self, capacity):
+    def __init__(self, capacity, max_bytes=None, sizeof=None):
+        """
+        Initialize cache
+        :param capacity: Maximum number of entries
+        :param max_bytes: Optional limit on the total size of the entries
+        :param sizeof: Function returning the size of an entry in bytes
+        """
         self.capacity = capacity
-        self.cache = {}
-        self.order = []
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.nbytes = 0
+        self.cache = OrderedDict()
     
     def __getitem__(self, key):
-        if key in self.cache:
-            # Move to end (most recently used)
-            self.order.remove(key)
-            self.order.append(key)
-            return self.cache[key]
-        raise KeyError(key)
+        value = self.cache[key]
+        # Move to end (most recently used)
+        self.cache.move_to_end(key)
+        return value
     
     def __setitem__(self, key, value):
         if key in self.cache:
             # Update existing key
-            self.order.remove(key)
-        elif len(self.cache) >= self.capacity:
-            # Remove least recently used
-            oldest = self.order.pop(0)
-            del self.cache[oldest]
+            self.nbytes -= self.sizeof(self.cache.pop(key))
         
         self.cache[key] = value
-        self.order.append(key)
+        self.nbytes += self.sizeof(value)
+        self.trim()
     
     def __contains__(self, key):
         return key in self.cache
@@ -51,19 +61,569 @@ class LRUCache:
     def __len__(self):
         return len(self.cache)
     
+    def trim(self, max_bytes=None):
+        """Remove least recently used entries until the cache fits its limits"""
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        while self.cache and (len(self.cache) > self.capacity or
+                              (max_bytes is not None and self.nbytes > max_bytes)):
+            _, oldest = self.cache.popitem(last=False)
+            self.nbytes -= self.sizeof(oldest)
+    
     def clear(self):
         self.cache.clear()
-        self.order.clear()
+        self.nbytes = 0
     
     def pop(self, key, default=None):
         if key in self.cache:
-            self.order.remove(key)
-            return self.cache.pop(key)
+            value = self.cache.pop(key)
+            self.nbytes -= self.sizeof(value)
+            return value
         return default
     
     def items(self):
         return self.cache.items()
 
+def encode_tile(pixels, format='PNG', quality=90):
+    """Compress RGB(A) tile pixels (NumPy array) for the warm cache tier"""
+    buffer = io.BytesIO()
+    image = Image.fromarray(np.ascontiguousarray(pixels[..., :3]))
+    if format == 'JPEG':
+        image.save(buffer, format, quality=quality)
+    else:
+        image.save(buffer, format, compress_level=1)
+    return buffer.getvalue()
+
+# Compressed form of a uniform tile: marker, RGB colour and size
+UNIFORM_TILE = struct.Struct('<4sBBBHH')
+UNIFORM_TILE_MAGIC = b'WSIU'
+_uniform_images = LRUCache(256)
+_uniform_images_lock = threading.Lock()
+
+def uniform_color(pixels, tolerance=4):
+    """RGB colour of a tile without visible detail, such as blank glass
+    :param pixels: RGB(A) NumPy array (height, width, channels)
+    :param tolerance: Largest difference between the darkest and brightest value of a channel
+    :return: (red, green, blue), or None if the tile isn't uniform
+    """
+    rgb = pixels[..., :3]
+    # A sparse sample rejects almost every tissue tile before the full pass
+    sample = rgb[::32, ::32]
+    low = sample.min(axis=(0, 1)).astype(np.int32)
+    high = sample.max(axis=(0, 1)).astype(np.int32)
+    if (high - low).max() > tolerance:
+        return None
+    low = rgb.min(axis=(0, 1)).astype(np.int32)
+    high = rgb.max(axis=(0, 1)).astype(np.int32)
+    if (high - low).max() > tolerance:
+        return None
+    return tuple(int(value) for value in (low + high) // 2)
+
+def uniform_tile_image(color, width, height):
+    """Image of a uniform tile, shared by all tiles of the same colour and size
+    
+    The image is a single pixel carrying its colour as uniform_color and the
+    tile size as uniform_size, so it takes no memory to speak of. It is painted
+    as a filled rectangle, and qimage_to_array expands it to the tile size.
+    """
+    key = (color, width, height)
+    with _uniform_images_lock:
+        try:
+            return _uniform_images[key]
+        except KeyError:
+            pass
+        image = QImage(1, 1, QImage.Format_RGB32)
+        image.fill(QColor(*color))
+        image.uniform_color = color
+        image.uniform_size = (width, height)
+        _uniform_images[key] = image
+        return image
+
+def encode_uniform(color, width, height):
+    """Compressed form of a uniform tile for the warm and shared cache tiers"""
+    return UNIFORM_TILE.pack(UNIFORM_TILE_MAGIC, *color, width, height)
+
+def decode_tile(data):
+    """Decode a compressed tile to an RGB32 QImage, a null image if invalid"""
+    if data.startswith(UNIFORM_TILE_MAGIC):
+        _, red, green, blue, width, height = UNIFORM_TILE.unpack_from(data)
+        return uniform_tile_image((red, green, blue), width, height)
+    image = QImage.fromData(data)
+    if image.isNull():
+        return image
+    image = image.convertToFormat(QImage.Format_RGB32)
+    if data.startswith(b'\xff\xd8'):
+        # JPEG: the pixels differ from a fresh read
+        image.lossy = True
+    return image
+
+def tile_from_pixels(pixels, warm_format=None):
+    """RGB32 image and compressed data (or None) of RGBA tile pixels
+    
+    pixels may be a view into a larger region. Uniform tiles become the shared
+    image of their colour and compress to a few bytes.
+    """
+    height, width = pixels.shape[:2]
+    color = uniform_color(pixels)
+    if color is not None:
+        data = encode_uniform(color, width, height) if warm_format else None
+        return uniform_tile_image(color, width, height), data
+    # RGBX ignores alpha like convert('RGB') does. Converting to RGB32 copies
+    # the view into an image owning its pixels, in the native paint format
+    image = QImage(sip.voidptr(pixels.ctypes.data), width, height, pixels.strides[0],
+                   QImage.Format_RGBX8888).convertToFormat(QImage.Format_RGB32)
+    data = encode_tile(pixels, warm_format) if warm_format else None
+    return image, data
+
+def tile_nbytes(image):
+    """Cache memory of a decoded tile, shared uniform tiles and level cache views count as free"""
+    if hasattr(image, 'uniform_color') or hasattr(image, 'mapped'):
+        return 0
+    return image.width() * image.height() * 4
+
+class TieredTileCache:
+    """Two-tier tile cache: decoded images (hot) backed by compressed tiles (warm)
+    
+    Loaders store each tile in both tiers. Tiles evicted from the small hot tier
+    stay in the much larger warm tier and are decoded again on access, which is
+    far cheaper than another read from the slide file.
+    """
+    
+    def __init__(self, capacity, warm_capacity, warm_max_bytes, sizeof=None):
+        """
+        Initialize cache
+        :param capacity: Maximum number of decoded tiles
+        :param warm_capacity: Maximum number of compressed tiles
+        :param warm_max_bytes: Limit on the total size of the compressed tiles
+        :param sizeof: Function returning the size of a decoded tile in bytes
+        """
+        self.hot = LRUCache(capacity, sizeof=sizeof)
+        self.warm = LRUCache(warm_capacity, max_bytes=warm_max_bytes, sizeof=len)
+        self.promotions = 0
+    
+    @property
+    def nbytes(self):
+        return self.hot.nbytes
+    
+    def put(self, key, image, data=None):
+        """Store a decoded tile and, if given, its compressed bytes"""
+        self.hot[key] = image
+        if data is not None:
+            self.warm[key] = data
+    
+    def __getitem__(self, key):
+        if key in self.hot:
+            return self.hot[key]
+        # Promote from the warm tier, raises KeyError like a dictionary if absent
+        image = decode_tile(self.warm[key])
+        if image.isNull():
+            self.warm.pop(key)
+            raise KeyError(key)
+        self.hot[key] = image
+        self.promotions += 1
+        return image
+    
+    def __setitem__(self, key, image):
+        self.put(key, image)
+    
+    def __contains__(self, key):
+        return key in self.hot or key in self.warm
+    
+    def __len__(self):
+        return len(self.hot.cache.keys() | self.warm.cache.keys())
+    
+    def trim(self, max_bytes=None, warm_max_bytes=None):
+        """Trim the hot tier to max_bytes and the warm tier to warm_max_bytes"""
+        self.hot.trim(max_bytes)
+        if warm_max_bytes is not None:
+            self.warm.trim(min(warm_max_bytes, self.warm.max_bytes))
+    
+    def clear(self):
+        self.hot.clear()
+        self.warm.clear()
+    
+    def pop(self, key, default=None):
+        image = self.hot.pop(key)
+        data = self.warm.pop(key)
+        return default if image is None and data is None else image
+    
+    def items(self):
+        return self.hot.items()
+
+def available_system_memory():
+    """Available physical memory in bytes, or None if it cannot be determined"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    
+    # Linux without psutil
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class MemoryGovernor:
+    """Bounds the memory held by decoded pixel data
+    
+    Consumers report their usage per category ('tiles', 'thumbnail', ...).
+    The effective ceiling is the configured one, lowered when the system
+    runs short of available memory. Near the ceiling caches are trimmed
+    and tiles are displayed from coarser levels instead of growing.
+    """
+    
+    def __init__(self, ceiling_bytes=None, reserve_bytes=512 * 1024 * 1024):
+        """
+        Initialize governor
+        :param ceiling_bytes: Maximum pixel memory, defaults to WSI_VIEWER_MEMORY_LIMIT_MB or 1 GB
+        :param reserve_bytes: Memory to leave available to the rest of the system
+        """
+        if ceiling_bytes is None:
+            try:
+                limit_mb = int(os.environ.get('WSI_VIEWER_MEMORY_LIMIT_MB', 1024))
+            except ValueError:
+                print(f"Error reading WSI_VIEWER_MEMORY_LIMIT_MB, using 1024: "
+                      f"{os.environ['WSI_VIEWER_MEMORY_LIMIT_MB']!r}")
+                limit_mb = 1024
+            ceiling_bytes = limit_mb * 1024 * 1024
+        self.ceiling_bytes = ceiling_bytes
+        self.reserve_bytes = reserve_bytes
+        self.usage = {}
+        self.high_water = 0.9   # Start evicting aggressively
+        self.low_water = 0.7    # Evict down to here while under pressure
+        self._under_pressure = False
+        self._available = None
+        self._available_checked = 0.0
+    
+    def set_usage(self, category, nbytes):
+        self.usage[category] = nbytes
+    
+    def total_usage(self):
+        return sum(self.usage.values())
+    
+    def effective_ceiling(self):
+        """Configured ceiling, lowered when the system is short of memory"""
+        # Reading system memory is comparatively slow, refresh at most once a second
+        now = time.monotonic()
+        if now - self._available_checked > 1.0:
+            self._available = available_system_memory()
+            self._available_checked = now
+        
+        ceiling = self.ceiling_bytes
+        if self._available is not None:
+            # Memory we hold plus what is left for us before hitting the reserve
+            ceiling = min(ceiling, self.total_usage() + max(0, self._available - self.reserve_bytes))
+        return ceiling
+    
+    def budget(self, category):
+        """Bytes a category may hold given the usage of all other categories"""
+        others = self.total_usage() - self.usage.get(category, 0)
+        return max(0, self.effective_ceiling() - others)
+    
+    def trim_target(self, category):
+        """Bytes a category should be trimmed to, lower while under pressure"""
+        others = self.total_usage() - self.usage.get(category, 0)
+        ceiling = self.effective_ceiling()
+        if self.under_pressure():
+            ceiling *= self.low_water
+        return max(0, int(ceiling - others))
+    
+    def under_pressure(self):
+        """Whether usage is near the ceiling, with hysteresis between the water marks"""
+        ratio = self.total_usage() / max(1, self.effective_ceiling())
+        if ratio >= self.high_water:
+            self._under_pressure = True
+        elif ratio < self.low_water:
+            self._under_pressure = False
+        return self._under_pressure
+
+def qimage_to_array(image):
+    """Copy the pixels of an RGB32 QImage into an RGB NumPy array (height, width, 3)"""
+    color = getattr(image, 'uniform_color', None)
+    if color is not None:
+        width, height = image.uniform_size
+        return np.full((height, width, 3), color, np.uint8)
+    width, height = image.width(), image.height()
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    # RGB32 is 0xffRRGGBB per pixel, stored as B, G, R, 255 on little endian machines
+    pixels = np.frombuffer(bits, np.uint8).reshape(height, image.bytesPerLine() // 4, 4)
+    return pixels[:, :width, 2::-1].copy()
+
+def rgb32_const_view(image):
+    """Read-only NumPy view (height, width, 4) of an RGB32 QImage, channels in B, G, R, X order
+    
+    Uses constBits, so images shared with other threads are never detached.
+    """
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    pixels = np.frombuffer(bits, np.uint8).reshape(image.height(), image.bytesPerLine() // 4, 4)
+    return pixels[:, :image.width()]
+
+def rgb32_view(image):
+    """Writable NumPy view (height, width, 4) of an RGB32 QImage, channels in B, G, R, X order"""
+    bits = image.bits()
+    bits.setsize(image.sizeInBytes())
+    pixels = np.frombuffer(bits, np.uint8).reshape(image.height(), image.bytesPerLine() // 4, 4)
+    return pixels[:, :image.width()]
+
+class DisplayAdjustment:
+    """Brightness, contrast, gamma and per-channel gains, applied through lookup tables
+    
+    The transform is precomputed for all 256 input values of each channel, so
+    adjusting an image is a single table lookup per pixel.
+    """
+    _tables = LRUCache(64)  # Adjustment key -> lookup table, shared by all instances
+    _tables_lock = threading.Lock()  # Adjusters on thread pool threads share the tables
+    
+    def __init__(self, brightness=0.0, contrast=1.0, gamma=1.0, gains=(1.0, 1.0, 1.0)):
+        """
+        Initialize adjustment
+        :param brightness: Offset added to intensities in 0..1, e.g. -0.5 to 0.5
+        :param contrast: Factor stretching intensities around mid grey
+        :param gamma: Gamma above 1 brightens mid tones, below 1 darkens them
+        :param gains: Red, green and blue colour balance factors
+        """
+        self.brightness = brightness
+        self.contrast = contrast
+        self.gamma = gamma
+        self.gains = tuple(gains)
+    
+    @property
+    def key(self):
+        return (round(self.brightness, 4), round(self.contrast, 4), round(self.gamma, 4),
+                tuple(round(gain, 4) for gain in self.gains))
+    
+    def is_identity(self):
+        return self.key == (0.0, 1.0, 1.0, (1.0, 1.0, 1.0))
+    
+    def table(self):
+        """Lookup table of shape (3, 256) for the red, green and blue channels"""
+        key = self.key
+        with self._tables_lock:
+            try:
+                return self._tables[key]
+            except KeyError:
+                pass
+        values = np.arange(256, dtype=np.float64) / 255.0
+        values = np.clip((values - 0.5) * self.contrast + 0.5 + self.brightness, 0.0, 1.0)
+        values = values ** (1.0 / max(self.gamma, 1e-3))
+        table = np.clip(np.outer(self.gains, values) * 255.0 + 0.5, 0, 255).astype(np.uint8)
+        with self._tables_lock:
+            self._tables[key] = table
+        return table
+    
+    def apply(self, pixels):
+        """Adjust an RGB NumPy array (height, width, 3), returns a new array"""
+        return self.table()[np.arange(3), pixels]
+    
+    def apply_image(self, image):
+        """Adjust an RGB32 QImage, returns a new image"""
+        color = getattr(image, 'uniform_color', None)
+        if color is not None:
+            table = self.table()
+            return uniform_tile_image(tuple(int(table[channel, value]) for channel, value in enumerate(color)),
+                                      *image.uniform_size)
+        result = QImage(image.width(), image.height(), QImage.Format_RGB32)
+        target = rgb32_view(result)
+        # RGB32 stores blue, green, red: look each up in the table of its channel
+        # The source is a cached tile the GUI thread may be painting, only read it
+        target[..., :3] = self.table()[[2, 1, 0], rgb32_const_view(image)[..., :3]]
+        target[..., 3] = 255
+        return result
+
+def read_level_scaled(slide, level, target_size):
+    """Read a whole level scaled to target_size (width, height) as a PIL RGB image
+    
+    The level is read and scaled in strips of at most ~16 MB, so that slides
+    with a large coarsest level never decode the whole level at once.
+    """
+    level_width, level_height = slide.level_dimensions[level]
+    scale = target_size[1] / level_height
+    img = Image.new('RGB', target_size)
+    downsample = slide.level_downsamples[level]
+    strip_height = max(1, (16 * 1024 * 1024) // (level_width * 4))
+    for top in range(0, level_height, strip_height):
+        height = min(strip_height, level_height - top)
+        target_top = int(round(top * scale))
+        target_bottom = min(target_size[1], int(round((top + height) * scale)))
+        if target_bottom <= target_top:
+            continue
+        strip = slide.read_region((0, int(top * downsample)), level, (level_width, height))
+        strip = strip.convert('RGB')  # Convert to RGB mode
+        strip = strip.resize((target_size[0], target_bottom - target_top), Image.Resampling.LANCZOS)
+        img.paste(strip, (0, target_top))
+    return img
+
+def otsu_threshold(values):
+    """Otsu threshold of uint8 values, the level best separating two classes"""
+    histogram = np.bincount(values.ravel(), minlength=256).astype(np.float64)
+    weight_low = np.cumsum(histogram)
+    weight_high = weight_low[-1] - weight_low
+    sums = np.cumsum(histogram * np.arange(256))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_low = sums / weight_low
+        mean_high = (sums[-1] - sums) / weight_high
+        between = weight_low * weight_high * (mean_low - mean_high) ** 2
+    return int(np.argmax(np.nan_to_num(between)))
+
+class TissueMask:
+    """Coarse tissue mask of a slide, from Otsu thresholding of saturation
+    
+    Glass is bright and unsaturated while stained tissue is coloured, so a
+    threshold on HSV saturation separates the two. The mask is computed from
+    the coarsest level with enough detail, scaled to at most max_size pixels.
+    """
+    
+    def __init__(self, mask, dimensions, background_color=(255, 255, 255)):
+        """
+        Initialize tissue mask
+        :param mask: Boolean array, True where there is tissue
+        :param dimensions: Level 0 size (width, height) covered by the mask
+        :param background_color: Typical (r, g, b) of the glass
+        """
+        self.mask = mask
+        self.dimensions = dimensions
+        self.background_color = background_color
+        # Level 0 pixels per mask pixel
+        self.scale_x = dimensions[0] / mask.shape[1]
+        self.scale_y = dimensions[1] / mask.shape[0]
+        # Grown by one mask pixel, so tissue at the edge of a mask pixel is never skipped
+        padded = np.pad(mask, 1)
+        self._grown = np.zeros_like(mask)
+        for dy in range(3):
+            for dx in range(3):
+                self._grown |= padded[dy:dy + mask.shape[0], dx:dx + mask.shape[1]]
+        self._regions = None
+    
+    @classmethod
+    def from_slide(cls, slide, max_size=2048, min_size=1024, min_threshold=20):
+        """
+        Compute the mask of a slide
+        :param max_size: Maximum width and height of the mask
+        :param min_size: Width or height the level the mask is computed from should have
+        :param min_threshold: Lowest saturation threshold, keeps blank slides from
+            turning noise into tissue
+        """
+        level = slide.level_count - 1
+        while level > 0 and max(slide.level_dimensions[level]) < min_size:
+            level -= 1
+        level_width, level_height = slide.level_dimensions[level]
+        scale = min(1.0, max_size / max(level_width, level_height))
+        size = (max(1, int(level_width * scale)), max(1, int(level_height * scale)))
+        pixels = np.asarray(read_level_scaled(slide, level, size))
+        
+        # HSV saturation, (max - min) / max, in 0..255
+        high = pixels.max(axis=2).astype(np.int32)
+        low = pixels.min(axis=2).astype(np.int32)
+        saturation = np.where(high > 0, (high - low) * 255 // np.maximum(high, 1), 0).astype(np.uint8)
+        
+        threshold = max(otsu_threshold(saturation), min_threshold)
+        mask = saturation > threshold
+        background = pixels[~mask]
+        color = tuple(int(c) for c in np.median(background, axis=0)) if len(background) else (255, 255, 255)
+        return cls(mask, slide.dimensions, color)
+    
+    def contains_tissue(self, x, y, width, height):
+        """Whether a level 0 rectangle may contain tissue"""
+        left = max(0, int(x / self.scale_x))
+        top = max(0, int(y / self.scale_y))
+        right = min(self.mask.shape[1], int(math.ceil((x + width) / self.scale_x)))
+        bottom = min(self.mask.shape[0], int(math.ceil((y + height) / self.scale_y)))
+        if right <= left or bottom <= top:
+            return False
+        return bool(self._grown[top:bottom, left:right].any())
+    
+    def tissue_fraction(self):
+        return float(self.mask.mean()) if self.mask.size else 0.0
+    
+    def coverage(self, x, y, width, height):
+        """Fraction of a level 0 rectangle covered by tissue"""
+        left = max(0, int(x / self.scale_x))
+        top = max(0, int(y / self.scale_y))
+        right = min(self.mask.shape[1], max(left + 1, int(round((x + width) / self.scale_x))))
+        bottom = min(self.mask.shape[0], max(top + 1, int(round((y + height) / self.scale_y))))
+        if right <= left or bottom <= top:
+            return 0.0
+        return float(self.mask[top:bottom, left:right].mean())
+    
+    def regions(self, grid=64, min_fraction=0.01):
+        """Bounding rectangles (x, y, width, height) in level 0 pixels of connected
+        tissue regions, in reading order
+        :param grid: Regions are found on a grid of at most grid x grid cells
+        :param min_fraction: Regions smaller than this fraction of all tissue are dropped
+        """
+        if self._regions is not None:
+            return self._regions
+        
+        mask_height, mask_width = self.mask.shape
+        cell = max(1, math.ceil(max(mask_height, mask_width) / grid))
+        rows, columns = math.ceil(mask_height / cell), math.ceil(mask_width / cell)
+        padded = np.zeros((rows * cell, columns * cell), bool)
+        padded[:mask_height, :mask_width] = self.mask
+        cells = padded.reshape(rows, cell, columns, cell).any(axis=(1, 3))
+        
+        # Flood fill over the cells, 8-connected
+        labels = np.zeros(cells.shape, np.int32)
+        components = []
+        for start in zip(*np.nonzero(cells)):
+            if labels[start]:
+                continue
+            label = len(components) + 1
+            labels[start] = label
+            stack = [start]
+            members = []
+            while stack:
+                row, column = stack.pop()
+                members.append((row, column))
+                for dy in (-1, 0, 1):
+                    for dx in (-1, 0, 1):
+                        r, c = row + dy, column + dx
+                        if 0 <= r < rows and 0 <= c < columns and cells[r, c] and not labels[r, c]:
+                            labels[r, c] = label
+                            stack.append((r, c))
+            components.append(np.array(members))
+        
+        total = sum(len(members) for members in components)
+        regions = []
+        for members in components:
+            if len(members) < total * min_fraction:
+                continue
+            (top, left), (bottom, right) = members.min(axis=0), members.max(axis=0) + 1
+            x, y = float(left * cell * self.scale_x), float(top * cell * self.scale_y)
+            regions.append((x, y,
+                            min(self.dimensions[0], float(right * cell * self.scale_x)) - x,
+                            min(self.dimensions[1], float(bottom * cell * self.scale_y)) - y))
+        # Reading order: by rows of regions, then left to right
+        regions.sort(key=lambda r: (round((r[1] + r[3] / 2) / max(1.0, self.dimensions[1] / 8)), r[0]))
+        self._regions = regions
+        return regions
+
+def split_background(tissue_mask, downsample, cells):
+    """
+    Split cells of a level into the area to read and background
+    :param tissue_mask: TissueMask of the slide
+    :param downsample: Downsample of the level
+    :param cells: List of (key, (left, top, width, height)) in level pixels
+    :return: (left, top, right, bottom) bounding the cells that may contain tissue, or None
+        if none may, and the cells outside of it
+    """
+    tissue = [bounds for _, bounds in cells
+              if tissue_mask.contains_tissue(bounds[0] * downsample, bounds[1] * downsample,
+                                             bounds[2] * downsample, bounds[3] * downsample)]
+    if not tissue:
+        return None, list(cells)
+    box = (min(left for left, _, _, _ in tissue), min(top for _, top, _, _ in tissue),
+           max(left + width for left, _, width, _ in tissue), max(top + height for _, top, _, height in tissue))
+    background = [(key, (left, top, width, height)) for key, (left, top, width, height) in cells
+                  if left >= box[2] or top >= box[3] or left + width <= box[0] or top + height <= box[1]]
+    return box, background
+
 class TileLoader(QObject):
     """Tile loading worker"""
     tile_loaded = pyqtSignal(QImage, name='tileLoaded')
@@ -104,18 +664,19 @@ class TileLoader(QObject):
             if not self._is_running:
                 return
                 
-            # Convert to QImage
+            # Convert to QImage. RGB32 is the native paint format and, unlike an image
+            # wrapping the bytes buffer, owns its pixel data when queued across threads
             region_image = QImage(
                 region_data.tobytes('raw', 'RGB'),
                 region_data.width,
                 region_data.height,
                 region_data.width * 3,
                 QImage.Format_RGB888
-            )
-            
+            ).convertToFormat(QImage.Format_RGB32)
+
             if not self._is_running:
                 return
-                
+
             # Emit loaded signal
             self.tile_loaded.emit(region_image)
             
@@ -132,26 +693,821 @@ class TileLoader(QObject):
         """Stop loading"""
         self._is_running = False
 
-class TileManager:
+class RegionLoader(TileLoader):
+    """Loads a block of adjacent tiles with one read_region call"""
+    tiles_loaded = pyqtSignal(list, name='tilesLoaded')
+    
+    def __init__(self, slide, level, region, tiles, warm_format=None):
+        """
+        Initialize region loader
+        :param slide: OpenSlide object
+        :param level: Image level
+        :param region: Tuple (x, y, width, height), location in level 0 and size in level pixels
+        :param tiles: List of (tile_key, (x, y, width, height)) with bounds relative to the region
+        :param warm_format: Image format to compress tiles in for the warm cache tier, or None
+        """
+        super().__init__(slide, level, region)
+        self.tiles = tiles
+        self.warm_format = warm_format
+        self.shared_cache = None  # SharedTileCache to look tiles up in and publish them to
+        self.shared_keys = {}  # Tile key -> key in the shared cache
+        self.shared_hits = set()  # Tile keys taken from the shared cache
+        self.adjustment = None  # DisplayAdjustment to apply to the loaded tiles
+        self.tissue_mask = None  # TissueMask, tiles without tissue are filled instead of read
+        self.background = set()  # Tile keys filled with the background colour
+    
+    def load_shared(self):
+        """Tiles available from the shared cache, as {tile_key: (image, data)}"""
+        found = {}
+        for tile_key, _ in self.tiles:
+            data = self.shared_cache.get(self.shared_keys[tile_key])
+            image = decode_tile(data) if data is not None else QImage()
+            if not image.isNull():
+                found[tile_key] = (image, data)
+        return found
+    
+    def load_tile(self):
+        """Load region in background thread and slice it into tiles"""
+        try:
+            if not self._is_running:
+                return
+            
+            # Tiles decoded by another process don't need to be read at all
+            shared = self.load_shared() if self.shared_cache else {}
+            if len(shared) == len(self.tiles):
+                self.shared_hits = set(shared)
+                results = [(tile_key, image, data) for tile_key, (image, data) in shared.items()]
+            else:
+                results = self.read_tiles()
+                
+                if results is None or not self._is_running:
+                    return
+                
+                if self.shared_cache:
+                    for tile_key, _, data in results:
+                        # Filled tiles stay local, other processes may not skip background
+                        if data is not None and tile_key not in self.background:
+                            self.shared_cache.put(self.shared_keys[tile_key], data)
+            
+            # Adjusted copies are made here once, not on every paint
+            results = [(tile_key, image, data, self.adjustment.apply_image(image) if self.adjustment else None)
+                       for tile_key, image, data in results]
+            
+            # Emit loaded signal
+            self.tiles_loaded.emit(results)
+            
+        except Exception as e:
+            print(f"Error loading region: {e}")
+            
+        finally:
+            if self._is_running:
+                self.finished.emit()
+    
+    def read_tiles(self):
+        """Read the region and slice it into (tile_key, image, compressed data) tuples
+        
+        With a tissue mask, only the part of the region around tiles that may
+        contain tissue is read, the other tiles are filled with the glass colour.
+        :return: List of tiles, or None if the load was stopped
+        """
+        if self.tissue_mask is None:
+            return self.decode_tiles(self.region, self.tiles)
+        
+        downsample = self.slide.level_downsamples[self.level]
+        # Region origin in level pixels, tile bounds are relative to it
+        origin_x, origin_y = int(round(self.region[0] / downsample)), int(round(self.region[1] / downsample))
+        box, background = split_background(self.tissue_mask, downsample,
+                                           [(tile_key, (origin_x + x, origin_y + y, width, height))
+                                            for tile_key, (x, y, width, height) in self.tiles])
+        color = self.tissue_mask.background_color
+        results = []
+        for tile_key, (_, _, width, height) in background:
+            data = encode_uniform(color, width, height) if self.warm_format else None
+            results.append((tile_key, uniform_tile_image(color, width, height), data))
+        self.background = {tile_key for tile_key, _ in background}
+        if box is None:
+            return results
+        
+        left, top, right, bottom = box
+        region = (int(round(left * downsample)), int(round(top * downsample)), right - left, bottom - top)
+        tiles = [(tile_key, (origin_x + x - left, origin_y + y - top, width, height))
+                 for tile_key, (x, y, width, height) in self.tiles if tile_key not in self.background]
+        decoded = self.decode_tiles(region, tiles)
+        return None if decoded is None else results + decoded
+    
+    def decode_tiles(self, region, tiles):
+        """Read a region and slice it into (tile_key, image, compressed data) tuples
+        :param region: (x, y, width, height), location in level 0 and size in level pixels
+        :param tiles: List of (tile_key, (x, y, width, height)) with bounds relative to the region
+        :return: List of tiles, or None if the load was stopped
+        """
+        region_data = self.slide.read_region(
+            (region[0], region[1]),
+            self.level,
+            (region[2], region[3])
+        )
+        
+        if not self._is_running:
+            return None
+        
+        # RGBA pixels of the whole block, tiles are NumPy views into it
+        pixels = np.asarray(region_data)
+        
+        results = []
+        for tile_key, (x, y, width, height) in tiles:
+            # Compressing here keeps the encoding cost off the GUI thread
+            image, data = tile_from_pixels(pixels[y:y + height, x:x + width], self.warm_format)
+            results.append((tile_key, image, data))
+        return results
+
+class SharedRegionBuffer:
+    """Shared memory receiving the pixels of a region decoded in a worker process"""
+    
+    def __init__(self, width, height):
+        from multiprocessing import shared_memory
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, width * height * 4))
+        self.pixels = np.ndarray((height, width, 4), np.uint8, self.memory.buf)
+    
+    def release(self):
+        """Unmap the memory, views of pixels must be gone"""
+        self.pixels = None
+        try:
+            self.memory.close()
+        except BufferError:
+            pass
+    
+    def __del__(self):
+        self.release()
+
+class ProcessRegionLoader(RegionLoader):
+    """Region loader decoding in a worker process
+    
+    The worker writes RGB32 pixels into shared memory, which saves pickling
+    them. Each tile is copied out of the block, so cached tiles own exactly
+    their pixels and the block is released as soon as the region is sliced,
+    instead of one cached tile pinning the whole region. That is one copy per
+    tile, as the thread backend's RGBX to RGB32 conversion is: about 0.12 ms
+    for a 512 pixel tile against 0.19 ms for the conversion and 11-13 ms for
+    reading it.
+    """
+    
+    def __init__(self, slide, level, region, tiles, warm_format, executor, path):
+        """
+        :param executor: ProcessPoolExecutor running decode_workers.decode_region
+        :param path: Slide file, opened by the worker processes
+        """
+        super().__init__(slide, level, region, tiles, warm_format)
+        self.executor = executor
+        self.path = path
+    
+    def decode_tiles(self, region, tiles):
+        from decode_workers import decode_region
+        x, y, width, height = region
+        buffer = SharedRegionBuffer(width, height)
+        try:
+            encoded = self.executor.submit(
+                decode_region, self.path, (x, y), self.level, (width, height), buffer.memory.name,
+                [bounds for _, bounds in tiles], self.warm_format).result()
+        finally:
+            # Mapped memory stays valid, the name is no longer needed
+            buffer.memory.unlink()
+        
+        if not self._is_running:
+            buffer.release()
+            return None
+        
+        results = []
+        for (tile_key, (tile_x, tile_y, tile_width, tile_height)), data in zip(tiles, encoded):
+            view = buffer.pixels[tile_y:tile_y + tile_height, tile_x:tile_x + tile_width]
+            # RGB32 stores blue, green, red
+            color = uniform_color(view[..., 2::-1])
+            if color is not None:
+                results.append((tile_key, uniform_tile_image(color, tile_width, tile_height), data))
+                continue
+            image = QImage(sip.voidptr(view.ctypes.data), tile_width, tile_height, width * 4,
+                           QImage.Format_RGB32).copy()
+            results.append((tile_key, image, data))
+        view = None
+        buffer.release()
+        return results
+
+class TileAdjuster(QObject):
+    """Applies a display adjustment to cached tiles on a thread pool thread"""
+    tiles_adjusted = pyqtSignal(list, name='tilesAdjusted')
+    finished = pyqtSignal()
+    
+    def __init__(self, adjustment, tiles):
+        """
+        Initialize tile adjuster
+        :param adjustment: DisplayAdjustment to apply
+        :param tiles: List of (tile_key, image) with unadjusted images
+        """
+        super().__init__()
+        self.adjustment = adjustment
+        self.tiles = tiles
+        self._is_running = True
+    
+    def load_tile(self):
+        """Adjust tiles in background thread"""
+        try:
+            results = []
+            for tile_key, image in self.tiles:
+                if not self._is_running:
+                    return
+                results.append((tile_key, self.adjustment.apply_image(image)))
+            self.tiles_adjusted.emit(results)
+        except Exception as e:
+            print(f"Error adjusting tiles: {e}")
+        finally:
+            self.finished.emit()
+    
+    def stop(self):
+        self._is_running = False
+
+class AssociatedImageLoader(QObject):
+    """Decodes one associated image (label, macro, ...) of a slide on a thread pool thread"""
+    image_loaded = pyqtSignal(str, str, object, name='imageLoaded')  # Slide path, name, QImage or None
+    
+    def __init__(self, path, name):
+        """
+        Initialize associated image loader
+        :param path: Slide file, opened by the loader so closing the viewer's slide can't interfere
+        :param name: Associated image name
+        """
+        super().__init__()
+        self.path = path
+        self.name = name
+    
+    def load_tile(self):
+        """Decode the image in background thread"""
+        image = None
+        try:
+            slide = openslide.OpenSlide(self.path)
+            try:
+                # Indexing decodes only this image, iterating associated_images.items() decodes all
+                pixels = np.ascontiguousarray(slide.associated_images[self.name].convert('RGB'))
+            finally:
+                slide.close()
+            height, width = pixels.shape[:2]
+            image = QImage(pixels.data, width, height, width * 3, QImage.Format_RGB888).copy()
+        except Exception as e:
+            print(f"Error loading associated image {self.name}: {e}")
+        self.image_loaded.emit(self.path, self.name, image)
+
+class LevelCacheFiller(QObject):
+    """Decodes the missing cells of a LevelCache on a thread pool thread"""
+    cells_filled = pyqtSignal(int, int, name='cellsFilled')  # Filled cells, total cells
+    finished = pyqtSignal()
+    
+    def __init__(self, slide, cache, blocks, downsample, tissue_mask=None):
+        """
+        Initialize level cache filler
+        :param slide: OpenSlide object
+        :param cache: LevelCache to fill
+        :param blocks: List of ((left, top, width, height), cells) in level pixels, one read each
+        :param downsample: Downsample of the cached level
+        :param tissue_mask: TissueMask, cells without tissue are filled with the glass colour instead of read
+        """
+        super().__init__()
+        self.slide = slide
+        self.cache = cache
+        self.blocks = blocks
+        self.downsample = downsample
+        self.tissue_mask = tissue_mask
+        self._is_running = True
+    
+    def load_tile(self):
+        """Fill the cache in background thread"""
+        try:
+            total = self.cache.filled.size
+            filled = total - sum(len(cells) for _, cells in self.blocks)
+            for (left, top, width, height), cells in self.blocks:
+                if not self._is_running:
+                    return
+                filled += len(cells)
+                if self.tissue_mask is not None:
+                    left, top, width, height, cells = self.fill_background(cells)
+                if cells:
+                    region = self.slide.read_region(
+                        (int(round(left * self.downsample)), int(round(top * self.downsample))),
+                        self.cache.level, (width, height))
+                    self.cache.write(left, top, np.asarray(region), cells)
+                self.cells_filled.emit(filled, total)
+        except Exception as e:
+            print(f"Error filling level cache: {e}")
+        finally:
+            self.finished.emit()
+    
+    def fill_background(self, cells):
+        """Fill the cells of a block without tissue with the glass colour
+        :return: (left, top, width, height, cells) of the rest of the block to read
+        """
+        cell_width, cell_height = self.cache.cell_size
+        level_width, level_height = self.cache.level_size
+        bounds = [((column, row), (column * cell_width, row * cell_height,
+                                   min(cell_width, level_width - column * cell_width),
+                                   min(cell_height, level_height - row * cell_height)))
+                  for column, row in cells]
+        box, background = split_background(self.tissue_mask, self.downsample, bounds)
+        color = np.array((*self.tissue_mask.background_color, 255), np.uint8)
+        for cell, (left, top, width, height) in background:
+            self.cache.write(left, top, np.broadcast_to(color, (height, width, 4)), [cell])
+        if box is None:
+            return 0, 0, 0, 0, []
+        left, top, right, bottom = box
+        read = [cell for cell, _ in bounds if cell not in {cell for cell, _ in background}]
+        return left, top, right - left, bottom - top, read
+    
+    def stop(self):
+        self._is_running = False
+
+class SlideOpener(QObject):
+    """Opens a slide on a thread pool thread"""
+    slide_opened = pyqtSignal(str, object, str, name='slideOpened')  # Path, OpenSlide or None, error
+    
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+    
+    def load_tile(self):
+        """Open the slide in background thread"""
+        try:
+            self.slide_opened.emit(self.path, openslide.OpenSlide(self.path), '')
+        except Exception as e:
+            self.slide_opened.emit(self.path, None, str(e) or type(e).__name__)
+
+class TissueMaskLoader(QObject):
+    """Computes the TissueMask of a slide on a thread pool thread"""
+    mask_ready = pyqtSignal(str, object, name='maskReady')  # Path, TissueMask or None
+    
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+    
+    def load_tile(self):
+        """Compute the mask in background thread, with its own slide handle"""
+        mask = None
+        try:
+            slide = openslide.OpenSlide(self.path)
+            try:
+                mask = TissueMask.from_slide(slide)
+            finally:
+                slide.close()
+        except Exception as e:
+            print(f"Error detecting tissue: {e}")
+        self.mask_ready.emit(self.path, mask)
+
+class CatalogScanner(QObject):
+    """Scans directories into a SlideCatalog on a thread pool thread"""
+    progress = pyqtSignal(int, int)  # Slides read, slides to read
+    finished = pyqtSignal(object)  # Counts of SlideCatalog.scan, or None on error
+    
+    def __init__(self, catalog_path, directories):
+        """
+        :param catalog_path: Catalog database, opened by the scanner as connections belong to one thread
+        :param directories: Directories to scan
+        """
+        super().__init__()
+        self.catalog_path = catalog_path
+        self.directories = directories
+        self._is_running = True
+    
+    def load_tile(self):
+        """Scan in background thread"""
+        from slide_catalog import SlideCatalog
+        counts = None
+        try:
+            catalog = SlideCatalog(self.catalog_path)
+            try:
+                counts = catalog.scan(self.directories, progress=self.report)
+            finally:
+                catalog.close()
+        except Exception as e:
+            print(f"Error scanning slides: {e}")
+        self.finished.emit(counts)
+    
+    def report(self, done, total):
+        self.progress.emit(done, total)
+        return self._is_running
+    
+    def stop(self):
+        self._is_running = False
+
+class SlideLevelSource:
+    """Strips of a whole slide level for ImageSaver, blocks without tissue are filled with the glass colour"""
+    
+    def __init__(self, path, level, tissue_mask=None, block_size=2048, strip_height=512):
+        """
+        :param path: Slide file, opened by the saver so closing the viewer's slide can't interfere
+        :param level: Level to save
+        :param tissue_mask: TissueMask of the slide, computed when the saver starts if None
+        :param block_size: Width of the blocks read at once
+        :param strip_height: Rows per strip
+        """
+        self.path = path
+        self.level = level
+        self.tissue_mask = tissue_mask
+        self.block_size = block_size
+        self.strip_height = strip_height
+        self.slide = None
+        self.width = self.height = 0
+        self.blocks = 0
+        self.skipped = 0
+    
+    def open(self):
+        self.slide = openslide.OpenSlide(self.path)
+        self.width, self.height = self.slide.level_dimensions[self.level]
+        if self.tissue_mask is None:
+            self.tissue_mask = TissueMask.from_slide(self.slide)
+    
+    def strips(self):
+        """(top, height) of the strips in order"""
+        return [(top, min(self.strip_height, self.height - top)) for top in range(0, self.height, self.strip_height)]
+    
+    def read(self, top, height):
+        """RGB pixels (height, width, 3) of a strip"""
+        strip = np.empty((height, self.width, 3), np.uint8)
+        strip[:] = self.tissue_mask.background_color
+        downsample = self.slide.level_downsamples[self.level]
+        for left in range(0, self.width, self.block_size):
+            width = min(self.block_size, self.width - left)
+            self.blocks += 1
+            if not self.tissue_mask.contains_tissue(left * downsample, top * downsample,
+                                                    width * downsample, height * downsample):
+                self.skipped += 1
+                continue
+            block = self.slide.read_region((int(left * downsample), int(top * downsample)), self.level, (width, height))
+            strip[:, left:left + width] = np.asarray(block)[..., :3]
+        return strip
+    
+    def close(self):
+        if self.slide:
+            self.slide.close()
+            self.slide = None
+
+class ViewportSource:
+    """Strips of a slide region at any resolution for ImageSaver, stitched from tiles
+    
+    Tiles are read by a private TileManager on the saver's thread, with its own
+    slide handle, so exports at level 0 neither block nor depend on the viewer.
+    Tiles the viewer has decoded already are reused instead of read again.
+    """
+    
+    def __init__(self, path, rect, level, downsample, viewer_tiles=None, adjustment=None, strip_height=256):
+        """
+        :param path: Slide file
+        :param rect: Region (x, y, width, height) in level 0 pixels
+        :param level: Level read, at least as fine as downsample
+        :param downsample: Level 0 pixels per output pixel, the level is resized when it differs from the
+            level's downsample
+        :param viewer_tiles: TileManager of the viewer whose cached tiles are reused, or None
+        :param adjustment: DisplayAdjustment applied to the pixels, or None
+        :param strip_height: Output rows per strip
+        """
+        self.path = path
+        self.rect = rect
+        self.level = level
+        self.downsample = downsample
+        self.viewer_tiles = viewer_tiles
+        self.adjustment = adjustment if adjustment is not None and not adjustment.is_identity() else None
+        self.strip_height = strip_height
+        self.width = max(1, round(rect[2] / downsample))
+        self.height = max(1, round(rect[3] / downsample))
+        self.slide = None
+        self.tile_manager = None
+        self.tiles_reused = set()  # Keys of the tiles taken from the viewer's cache
+        self.tiles_read = set()
+    
+    def open(self):
+        self.slide = openslide.OpenSlide(self.path)
+        # Same tile grid as the viewer, so its tile keys can be looked up
+        nominal, align = (self.viewer_tiles.tile_size, self.viewer_tiles.align_to_native) \
+            if self.viewer_tiles else (512, True)
+        self.tile_manager = TileManager(tile_size=nominal, align_to_native=align, warm_cache_mb=0)
+        self.tile_manager.set_slide(self.slide)
+        # Tiles across the region for the rows a strip spans plus one, so a strip doesn't
+        # evict tiles the next strip needs, and memory stays bounded by the region width
+        tile_width, tile_height = self.tile_manager.level_tile_sizes[self.level]
+        columns = math.ceil(self.rect[2] / self.slide.level_downsamples[self.level] / tile_width) + 1
+        rows = math.ceil(self.strip_height * self.scale / tile_height) + 2
+        self.tile_manager.cache.hot.capacity = columns * rows
+        if abs(self.scale - 1) < 1e-6:
+            # Read without resizing, rounding must not step past the level edge
+            level_width, level_height = self.slide.level_dimensions[self.level]
+            self.width = min(self.width, level_width)
+            self.height = min(self.height, level_height)
+    
+    @property
+    def scale(self):
+        """Level pixels per output pixel"""
+        return self.downsample / (self.slide or self.viewer_tiles).level_downsamples[self.level]
+    
+    def strips(self):
+        return [(top, min(self.strip_height, self.height - top)) for top in range(0, self.height, self.strip_height)]
+    
+    def read_tile(self, level, x, y):
+        tile_key = (x, y, level)
+        image = self.viewer_tiles.cached_tile(self.path, tile_key) if self.viewer_tiles else None
+        if image is not None:
+            self.tiles_reused.add(tile_key)
+            return image
+        self.tiles_read.add(tile_key)
+        return self.tile_manager.read_tile(level, x, y)
+    
+    def read_pixels(self, left, top, width, height):
+        return self.tile_manager.read_pixels(self.level, left, top, width, height, self.read_tile)
+    
+    def read(self, top, height):
+        """RGB pixels (height, width, 3) of a strip"""
+        level_downsample = self.slide.level_downsamples[self.level]
+        scale = self.scale
+        # Region in level pixels
+        x = self.rect[0] / level_downsample
+        y = self.rect[1] / level_downsample + top * scale
+        if abs(scale - 1) < 1e-6:
+            level_width, level_height = self.slide.level_dimensions[self.level]
+            left = min(int(round(x)), level_width - self.width)
+            upper = min(int(round(self.rect[1] / level_downsample)), level_height - self.height) + top
+            pixels = self.read_pixels(left, upper, self.width, height)
+        else:
+            # Read a margin around the strip for the filter, so strips join without seams
+            margin = math.ceil(3 * scale) + 1
+            level_width, level_height = self.slide.level_dimensions[self.level]
+            left = max(0, int(x) - margin)
+            upper = max(0, int(y) - margin)
+            right = min(level_width, math.ceil(x + self.width * scale) + margin)
+            lower = min(level_height, math.ceil(y + height * scale) + margin)
+            region = Image.fromarray(self.read_pixels(left, upper, right - left, lower - upper))
+            box = (x - left, y - upper, min(right - left, x - left + self.width * scale),
+                   min(lower - upper, y - upper + height * scale))
+            pixels = np.asarray(region.resize((self.width, height), Image.LANCZOS, box=box))
+        if self.adjustment is not None:
+            pixels = self.adjustment.apply(pixels)
+        return pixels
+    
+    def close(self):
+        if self.tile_manager:
+            self.tile_manager.close()
+            self.tile_manager = None
+        if self.slide:
+            self.slide.close()
+            self.slide = None
+
+class ImageSaver(QObject):
+    """Reads an image strip by strip and encodes it into a file on a thread pool thread
+    
+    Reading, conversion and encoding all happen per strip, so memory is bounded
+    by a strip (except for formats encoded whole, see image_writer) and stop()
+    takes effect within one strip.
+    """
+    progress = pyqtSignal(int, int)  # Steps done, steps in all
+    finished = pyqtSignal(bool, str)  # Saved, error message (empty when saved or stopped)
+    
+    def __init__(self, source, path, format, metadata=None):
+        """
+        Initialize image saver
+        :param source: Object with open(), strips() returning (top, height) in order, read(top, height)
+            returning RGB pixels, close(), and width and height once opened
+        :param path: Output file
+        :param format: Image format, see image_writer.open_image_writer
+        :param metadata: Dictionary of text stored in the file
+        """
+        super().__init__()
+        self.source = source
+        self.path = path
+        self.format = format
+        self.metadata = metadata or {}
+        self._is_running = True
+    
+    def load_tile(self):
+        """Save the image in background thread"""
+        from image_writer import open_image_writer
+        writer = None
+        saved = False
+        error = ''
+        try:
+            self.source.open()
+            writer = open_image_writer(self.path, self.format, self.source.width, self.source.height,
+                                       self.metadata)
+            strips = self.source.strips()
+            # Formats encoded whole take one more step at the end
+            total = len(strips) + (0 if writer.incremental else 1)
+            for index, (top, height) in enumerate(strips):
+                if not self._is_running:
+                    return
+                writer.write(self.source.read(top, height))
+                self.progress.emit(index + 1, total)
+            if not self._is_running:
+                return
+            writer.close()
+            saved = True
+            self.progress.emit(total, total)
+        except Exception as e:
+            print(f"Error saving image: {e}")
+            error = str(e)
+        finally:
+            if writer is not None and not saved:
+                writer.abort()
+            self.source.close()
+            self.finished.emit(saved, error)
+    
+    def stop(self):
+        self._is_running = False
+
+class TileLoadRunnable(QRunnable):
+    """Runs a TileLoader on a thread pool thread"""
+
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def run(self):
+        self.loader.load_tile()
+
+class TileManager(QObject):
     """Manages tile loading and caching"""
+    tile_ready = pyqtSignal(int, int, int, name='tileReady')
     
-    def __init__(self, tile_size=512, cache_size=500, max_concurrent_loads=8):
-        self.tile_size = tile_size
-        self.cache = LRUCache(cache_size)
+    def __init__(self, tile_size=512, cache_size=128, max_concurrent_loads=8, governor=None,
+                 align_to_native=True, warm_cache_mb=256, warm_format='PNG', shared_cache=None):
+        """
+        Initialize tile manager
+        :param tile_size: Nominal tile size in pixels
+        :param cache_size: Maximum number of decoded tiles, kept small as the warm tier holds many more
+        :param governor: MemoryGovernor bounding the decoded tiles
+        :param align_to_native: Align the tile grid to the slide's storage tiles
+        :param warm_cache_mb: Size of the compressed (warm) tile tier, 0 to disable it
+        :param warm_format: 'PNG' for a lossless warm tier, or 'JPEG' for a smaller lossy one
+        :param shared_cache: Optional SharedTileCache for compressed tiles shared between processes,
+            used with the warm tier for slides attached with their path
+        """
+        super().__init__()
+        self.tile_size = tile_size  # Nominal size, actual tile sizes per level are in level_tile_sizes
+        self.align_to_native = align_to_native
+        self.level_tile_sizes = []
+        self.native_tile_sizes = []
+        self.governor = governor or MemoryGovernor()
+        self.warm_format = warm_format if warm_cache_mb > 0 else None
+        # Shared uniform tiles and level cache views count as free
+        self.cache = TieredTileCache(cache_size, cache_size * 20, warm_cache_mb * 1024 * 1024,
+                                     sizeof=tile_nbytes)
+        self.shared_cache = shared_cache
+        self.slide_id = None  # Identifies the slide file in shared cache keys
+        self.shared_hits = 0
+        self.decode_backend = 'threads'  # Or 'processes', see set_decode_backend
+        self.process_pool = None
+        self.process_pool_ready = []  # Futures completing once the worker processes have started
+        self.slide_path = None
+        self.level_bias = 0  # Levels to coarsen by when the visible tiles don't fit in memory
+        self.cached_only = False  # Paint from cached tiles without queueing loads (animated zoom)
+        self.tiles_loaded = 0
+        self.bytes_read = 0  # Decoded RGBA bytes returned by read_region
+        self.native_tile_reads = 0  # Native storage tiles touched by those reads
         self.max_concurrent_loads = max_concurrent_loads
-        self.active_threads = []
-        self.active_workers = []
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max_concurrent_loads)
+        self.active_workers = {}  # Tile key -> RegionLoader reading it
+        self.queued = set()  # Tile keys waiting to be coalesced into region reads
+        self._flush_scheduled = False
+        self.max_batch_size = 2048  # Maximum width and height of one region read in pixels
+        self.adjustment = DisplayAdjustment()
+        self.adjusted = LRUCache(cache_size, sizeof=tile_nbytes)
+        self.latest_adjustment = {}  # Tile key -> adjustment key of its newest adjusted copy
+        self.adjusting = {}  # Tile key -> TileAdjuster working on it, None while queued
+        self.adjust_queue = []  # (tile_key, image) waiting to be adjusted
+        self._adjust_scheduled = False
+        self.slide = None
+        self.level_dimensions = ()
+        self.level_downsamples = ()
+        # Synchronous reads (read_tile) and cached_tile may come from several threads at once,
+        # every cache change holds the lock. Reentrant, read_tile trims the cache while holding it
+        self.cache_lock = threading.RLock()
+        self._reading = {}  # Tile key -> Event set once a synchronous read finished
+        self.level_cache = None  # LevelCache of one level, see enable_level_cache
+        self.tissue_mask = None  # TissueMask of the slide, background is filled instead of read
+        self.level_cache_filler = None
+    
+    def set_slide(self, slide, path=None):
+        """Attach a slide, dropping tiles of the previous one
+        :param slide: OpenSlide object or None
+        :param path: Slide file, required to share its tiles with other processes
+        """
+        self.clear()
+        self.slide = slide
+        self.slide_path = path if slide else None
+        self.tissue_mask = None
+        self.slide_id = None
+        if slide and path and self.shared_cache and self.warm_format:
+            stat = os.stat(path)
+            self.slide_id = f'{os.path.realpath(path)}|{stat.st_mtime_ns}|{stat.st_size}'
+        self.level_dimensions = slide.level_dimensions if slide else ()
+        self.level_downsamples = slide.level_downsamples if slide else ()
+        self.native_tile_sizes = [self.native_tile_size(level) for level in range(len(self.level_dimensions))]
+        self.level_tile_sizes = [self.viewer_tile_size(native) for native in self.native_tile_sizes]
+    
+    def set_tissue_mask(self, tissue_mask):
+        """Fill tiles without tissue with the glass colour instead of reading them, from now on
+        :param tissue_mask: TissueMask of the attached slide, or None to read every tile
+        """
+        self.tissue_mask = tissue_mask
+    
+    def set_decode_backend(self, backend):
+        """Decode tiles on thread pool threads ('threads') or in worker processes ('processes')
+        
+        Worker processes avoid contention on the GIL with many cores. They open the
+        slide by its path, so slides attached without a path are always read on threads.
+        """
+        if backend not in ('threads', 'processes'):
+            raise ValueError(f"Unknown decode backend: {backend}")
+        if backend == self.decode_backend:
+            return
+        # Running loads finish on the backend that started them
+        self.thread_pool.waitForDone()
+        if backend == 'processes':
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            # Forking a process running Qt threads is unsafe, always start fresh interpreters
+            from decode_workers import warm_up
+            self.process_pool = ProcessPoolExecutor(max_workers=self.max_concurrent_loads,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            # Start all workers now rather than on the first tiles
+            self.process_pool_ready = [self.process_pool.submit(warm_up)
+                                       for _ in range(self.max_concurrent_loads)]
+        elif self.process_pool:
+            self.process_pool.shutdown()
+            self.process_pool = None
+            self.process_pool_ready = []
+        self.decode_backend = backend
+    
+    def close(self):
+        """Detach the slide and stop worker processes"""
+        self.set_slide(None)
+        self.set_decode_backend('threads')
+    
+    def native_tile_size(self, level):
+        """Storage tile size (width, height) of a level, or None if the format doesn't report it"""
+        properties = self.slide.properties
+        try:
+            return (int(properties[f'openslide.level[{level}].tile-width']),
+                    int(properties[f'openslide.level[{level}].tile-height']))
+        except (KeyError, ValueError):
+            return None
+    
+    def viewer_tile_size(self, native_size):
+        """Viewer tile size for a level: the multiple of the native tile closest to the
+        nominal tile size, so that every read covers whole storage tiles only"""
+        if not self.align_to_native or not native_size:
+            return (self.tile_size, self.tile_size)
+        native_width, native_height = native_size
+        return (native_width * max(1, round(self.tile_size / native_width)),
+                native_height * max(1, round(self.tile_size / native_height)))
+    
+    def best_level(self, scale):
+        """Coarsest level that still has at least one pixel per screen pixel
+        :param scale: Screen pixels per level 0 pixel
+        """
+        target_downsample = 1.0 / scale if scale > 0 else float('inf')
+        best = 0
+        for level, downsample in enumerate(self.level_downsamples):
+            # Small tolerance for downsamples such as 3.99 or 16.01
+            if downsample <= target_downsample * 1.01:
+                best = level
+        return min(best + self.level_bias, max(0, len(self.level_downsamples) - 1))
     
-    def get_tile_coordinates(self, level_size, view_rect):
-        """Calculate tile coordinates for visible region"""
+    def update_level_bias(self, scale, view_rect):
+        """Fall back to coarser levels when the visible tiles would exceed the memory budget
+        :param scale: Screen pixels per level 0 pixel
+        :param view_rect: Visible region in level 0 pixels
+        """
+        self.level_bias = 0
+        if not self.level_downsamples:
+            return
+        
+        budget = self.governor.budget('tiles') * self.governor.high_water
+        level = self.best_level(scale)
+        while level + self.level_bias < len(self.level_downsamples) - 1:
+            tile_level = level + self.level_bias
+            level_scale = self.level_downsamples[tile_level]
+            level_rect = QRectF(view_rect.x() / level_scale, view_rect.y() / level_scale,
+                                view_rect.width() / level_scale, view_rect.height() / level_scale)
+            tiles = self.get_tile_coordinates(tile_level, level_rect)
+            tile_width, tile_height = self.level_tile_sizes[tile_level]
+            # 4 bytes per RGB32 pixel
+            if len(tiles) * tile_width * tile_height * 4 <= budget:
+                break
+            self.level_bias += 1
+    
+    def get_tile_coordinates(self, level, view_rect):
+        """Calculate tile coordinates for visible region (level pixels)"""
         tiles = []
-        tile_size = self.tile_size
+        level_size = self.level_dimensions[level]
+        tile_width, tile_height = self.level_tile_sizes[level]
         
-        # Calculate tile boundaries
-        start_x = max(0, int(view_rect.x() // tile_size))
-        start_y = max(0, int(view_rect.y() // tile_size))
-        end_x = min(level_size[0] // tile_size, int((view_rect.x() + view_rect.width()) // tile_size) + 1)
-        end_y = min(level_size[1] // tile_size, int((view_rect.y() + view_rect.height()) // tile_size) + 1)
+        # Calculate tile boundaries (partial tiles at the right and bottom edges included)
+        start_x = max(0, int(view_rect.x() // tile_width))
+        start_y = max(0, int(view_rect.y() // tile_height))
+        end_x = min(math.ceil(level_size[0] / tile_width), math.ceil((view_rect.x() + view_rect.width()) / tile_width))
+        end_y = min(math.ceil(level_size[1] / tile_height), math.ceil((view_rect.y() + view_rect.height()) / tile_height))
         
         for y in range(start_y, end_y):
             for x in range(start_x, end_x):
@@ -159,27 +1515,525 @@ class TileManager:
         
         return tiles
     
+    def tile_rect(self, level, x, y):
+        """Tile bounds (x, y, width, height) in level pixels, clipped to the level size"""
+        level_width, level_height = self.level_dimensions[level]
+        tile_width, tile_height = self.level_tile_sizes[level]
+        left = x * tile_width
+        top = y * tile_height
+        return (left, top,
+                min(tile_width, level_width - left),
+                min(tile_height, level_height - top))
+    
+    def count_native_tiles(self, tile_key):
+        """Number of native storage tiles a viewer tile read touches"""
+        x, y, level = tile_key
+        native_size = self.native_tile_sizes[level]
+        if not native_size:
+            return 1
+        left, top, width, height = self.tile_rect(level, x, y)
+        native_width, native_height = native_size
+        columns = (left + width - 1) // native_width - left // native_width + 1
+        rows = (top + height - 1) // native_height - top // native_height + 1
+        return columns * rows
+    
+    def get_tile(self, level, x, y):
+        """Return cached tile image or None"""
+        tile_key = (x, y, level)
+        with self.cache_lock:
+            image = None
+            if tile_key in self.cache:
+                promotions = self.cache.promotions
+                image = self.cache[tile_key]
+                if self.cache.promotions != promotions:
+                    # Decoded again from the warm tier, account for it like a loaded tile
+                    self.enforce_memory_limit()
+        if image is None:
+            image = self.level_cache_tile(tile_key)
+            if image is None:
+                return None
+            with self.cache_lock:
+                self.cache.put(tile_key, image)
+        return self.adjusted_tile(tile_key, image)
+    
+    def enable_level_cache(self, level, directory=None):
+        """Decode a level once into a memory-mapped LevelCache, filled in the background
+        
+        Tiles of the level are then views of the mapped file. The cache file is
+        shared with other windows and processes caching the same slide level.
+        :return: LevelCacheFiller filling the missing cells, or None if the level is complete
+        :raises ValueError: If the slide was attached without its path
+        :raises OSError: If the cache files can't be created
+        """
+        from level_cache import LevelCache
+        self.disable_level_cache()
+        if not self.slide_path:
+            raise ValueError("The level cache requires the slide file")
+        cache = LevelCache(self.slide_path, level, self.level_dimensions[level],
+                           self.level_tile_sizes[level], directory)
+        self.level_cache = cache
+        missing = cache.missing_cells()
+        if not missing:
+            return None
+        
+        blocks = []
+        for x, y, columns, rows in self.coalesce_tiles(level, missing):
+            left, top, _, _ = self.tile_rect(level, x, y)
+            right, bottom, last_width, last_height = self.tile_rect(level, x + columns - 1, y + rows - 1)
+            cells = [(column, row) for row in range(y, y + rows) for column in range(x, x + columns)]
+            blocks.append(((left, top, right + last_width - left, bottom + last_height - top), cells))
+        self.level_cache_filler = LevelCacheFiller(self.slide, cache, blocks, self.level_downsamples[level],
+                                                   self.tissue_mask)
+        self.thread_pool.start(TileLoadRunnable(self.level_cache_filler))
+        return self.level_cache_filler
+    
+    def disable_level_cache(self):
+        """Stop filling the level cache and detach it, its files stay for later use"""
+        if self.level_cache_filler:
+            self.level_cache_filler.stop()
+            # The filler writes into the mapping until its current read is done
+            self.thread_pool.waitForDone()
+            self.level_cache_filler = None
+        if self.level_cache:
+            self.level_cache.close()
+            self.level_cache = None
+    
+    def level_cache_tile(self, tile_key):
+        """Tile viewing the level cache, or None if the level cache doesn't have it"""
+        x, y, level = tile_key
+        cache = self.level_cache
+        if cache is None or level != cache.level or not cache.is_filled(x, y):
+            return None
+        left, top, width, height = self.tile_rect(level, x, y)
+        view = cache.view(left, top, width, height)
+        image = QImage(sip.voidptr(view.ctypes.data), width, height, view.strides[0], QImage.Format_RGB32)
+        image.mapped = cache.pixels  # Keeps the mapping alive as long as the image
+        return image
+    
+    def adjusted_tile(self, tile_key, image):
+        """Tile with the current display adjustment, queueing it if not made yet
+        
+        Until the adjusted copy is ready the tile's previous adjusted copy, or
+        the unadjusted tile, is shown.
+        """
+        if self.adjustment.is_identity():
+            return image
+        adjustment_key = self.adjustment.key
+        if (tile_key, adjustment_key) in self.adjusted:
+            return self.adjusted[(tile_key, adjustment_key)]
+        self.queue_adjustment(tile_key, image)
+        previous = (tile_key, self.latest_adjustment.get(tile_key))
+        return self.adjusted[previous] if previous in self.adjusted else image
+    
+    def set_adjustment(self, adjustment):
+        """Change the display adjustment, tiles are adjusted again as they get painted"""
+        self.adjustment = adjustment
+        for adjuster in set(self.adjusting.values()):
+            if adjuster:
+                adjuster.stop()
+        self.adjusting.clear()
+        self.adjust_queue.clear()
+    
+    def queue_adjustment(self, tile_key, image):
+        if tile_key in self.adjusting:
+            return
+        self.adjusting[tile_key] = None
+        self.adjust_queue.append((tile_key, image))
+        if not self._adjust_scheduled:
+            self._adjust_scheduled = True
+            QTimer.singleShot(0, self.flush_adjustments)
+    
+    def flush_adjustments(self):
+        """Adjust queued tiles on the thread pool, a few tiles per task"""
+        self._adjust_scheduled = False
+        queue, self.adjust_queue = self.adjust_queue, []
+        for start in range(0, len(queue), 4):
+            adjuster = TileAdjuster(self.adjustment, queue[start:start + 4])
+            adjuster.tiles_adjusted.connect(
+                lambda results, worker=adjuster: self.on_tiles_adjusted(worker, results))
+            adjuster.finished.connect(
+                lambda worker=adjuster: self.on_adjuster_finished(worker))
+            for tile_key, _ in adjuster.tiles:
+                self.adjusting[tile_key] = adjuster
+            self.thread_pool.start(TileLoadRunnable(adjuster))
+    
+    def store_adjusted(self, tile_key, adjustment_key, image):
+        self.adjusted[(tile_key, adjustment_key)] = image
+        self.latest_adjustment[tile_key] = adjustment_key
+    
+    def on_tiles_adjusted(self, adjuster, results):
+        for tile_key, image in results:
+            if self.adjusting.get(tile_key) is not adjuster:
+                continue
+            self.store_adjusted(tile_key, adjuster.adjustment.key, image)
+            x, y, level = tile_key
+            self.tile_ready.emit(level, x, y)
+        self.enforce_memory_limit()
+    
+    def on_adjuster_finished(self, adjuster):
+        for tile_key, _ in adjuster.tiles:
+            if self.adjusting.get(tile_key) is adjuster:
+                del self.adjusting[tile_key]
+    
+    def shared_key(self, tile_key):
+        """Key of a tile in the shared cache, independent of this manager's tile grid"""
+        x, y, level = tile_key
+        left, top, width, height = self.tile_rect(level, x, y)
+        return f'{self.slide_id}|{self.warm_format}|{level}|{left},{top},{width},{height}'
+    
+    def read_tile(self, level, x, y):
+        """Return a tile, reading it on the calling thread if it is not cached
+        
+        Thread-safe; concurrent requests for the same tile wait for a single read.
+        Used by headless consumers such as the DZI server, which have no event loop
+        to deliver tile_ready.
+        """
+        tile_key = (x, y, level)
+        while True:
+            with self.cache_lock:
+                if tile_key in self.cache:
+                    return self.cache[tile_key]
+                pending = self._reading.get(tile_key)
+                if pending is None:
+                    pending = self._reading[tile_key] = threading.Event()
+                    break
+            # Another thread is reading the tile, use its result
+            pending.wait()
+        
+        try:
+            image = self.level_cache_tile(tile_key)
+            if image is not None:
+                with self.cache_lock:
+                    self.cache.put(tile_key, image)
+                return image
+            
+            if self.slide_id:
+                data = self.shared_cache.get(self.shared_key(tile_key))
+                image = decode_tile(data) if data is not None else QImage()
+                if not image.isNull():
+                    with self.cache_lock:
+                        self.cache.put(tile_key, image, data)
+                        self.shared_hits += 1
+                        self.enforce_memory_limit()
+                    return image
+            
+            left, top, width, height = self.tile_rect(level, x, y)
+            downsample = self.level_downsamples[level]
+            region_data = self.slide.read_region(
+                (int(round(left * downsample)), int(round(top * downsample))), level, (width, height))
+            image, data = tile_from_pixels(np.asarray(region_data), self.warm_format)
+            if self.slide_id:
+                self.shared_cache.put(self.shared_key(tile_key), data)
+            with self.cache_lock:
+                self.cache.put(tile_key, image, data)
+                self.tiles_loaded += 1
+                self.bytes_read += width * height * 4
+                self.native_tile_reads += self.count_native_tiles(tile_key)
+                self.enforce_memory_limit()
+            return image
+        finally:
+            with self.cache_lock:
+                del self._reading[tile_key]
+            pending.set()
+    
+    def read_pixels(self, level, left, top, width, height, read_tile=None):
+        """Stitch a region of a level from tiles (read_tile), as an RGB NumPy array
+        :param left: Region position in level pixels
+        :param read_tile: Function (level, x, y) returning a tile, instead of read_tile
+        """
+        read_tile = read_tile or self.read_tile
+        canvas = np.empty((height, width, 3), np.uint8)
+        right, bottom = left + width, top + height
+        for x, y in self.get_tile_coordinates(level, QRectF(left, top, width, height)):
+            tile_left, tile_top, tile_width, tile_height = self.tile_rect(level, x, y)
+            pixels = qimage_to_array(read_tile(level, x, y))
+            # Overlap of the tile with the region
+            x0, y0 = max(left, tile_left), max(top, tile_top)
+            x1, y1 = min(right, tile_left + tile_width), min(bottom, tile_top + tile_height)
+            canvas[y0 - top:y1 - top, x0 - left:x1 - left] = \
+                pixels[y0 - tile_top:y1 - tile_top, x0 - tile_left:x1 - tile_left]
+        return canvas
+    
+    def cached_tile(self, slide_path, tile_key):
+        """Decoded tile of a slide file if it is in the hot cache tier, or None
+        
+        Thread-safe, and doesn't touch the cache order or the warm tier, so other
+        threads can reuse the viewer's tiles without disturbing it. Tiles decoded
+        from a lossy warm tier or shared cache are left out, they differ from a read.
+        """
+        with self.cache_lock:
+            if slide_path != self.slide_path:
+                return None
+            image = self.cache.hot.cache.get(tile_key)
+        return None if getattr(image, 'lossy', False) else image
+    
+    def is_region_cached(self, level, rect):
+        """Check whether every tile of a level covering rect (level pixels) is cached"""
+        for x, y in self.get_tile_coordinates(level, rect):
+            if (x, y, level) not in self.cache:
+                return False
+        return True
+    
     def clear(self):
-        """Clear all tiles and stop active threads"""
-        for thread in self.active_threads:
-            if thread.isRunning():
-                thread.quit()
-                thread.wait()
-        self.active_threads.clear()
+        """Clear all tiles and stop active loads"""
+        self.disable_level_cache()
+        for worker in self.active_workers.values():
+            worker.stop()
+        self.queued.clear()
+        self.thread_pool.clear()
+        # Reads must finish before the slide handle can be closed
+        self.thread_pool.waitForDone()
         self.active_workers.clear()
-        self.cache.clear()
+        with self.cache_lock:
+            self.cache.clear()
+        self.adjusted.clear()
+        self.latest_adjustment.clear()
+        self.adjusting.clear()
+        self.adjust_queue.clear()
+        self.governor.set_usage('tiles', 0)
+        self.governor.set_usage('compressed tiles', 0)
+        self.governor.set_usage('adjusted tiles', 0)
     
     def add_tile_to_queue(self, x, y, level):
         """Add tile to loading queue"""
         tile_key = (x, y, level)
-        if tile_key not in self.cache:
-            # Add to loading queue
-            pass
+        if (not self.slide or tile_key in self.cache or tile_key in self.active_workers
+                or tile_key in self.queued):
+            return
+        
+        # Tiles queued during one paint or viewport change are read together
+        self.queued.add(tile_key)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            QTimer.singleShot(0, self.flush_queue)
     
-    def clean_invisible_tiles(self, visible_rect):
-        """Remove tiles that are no longer visible"""
-        # Implementation for cleaning invisible tiles
-        pass
+    def request_region(self, level, rect):
+        """Queue all tiles of a level covering rect (level pixels)"""
+        for x, y in self.get_tile_coordinates(level, rect):
+            self.add_tile_to_queue(x, y, level)
+    
+    def flush_queue(self):
+        """Start coalesced region reads for all queued tiles"""
+        self._flush_scheduled = False
+        if not self.slide:
+            self.queued.clear()
+            return
+        
+        tiles_by_level = {}
+        for x, y, level in self.queued:
+            tiles_by_level.setdefault(level, []).append((x, y))
+        self.queued.clear()
+        
+        for level, tiles in tiles_by_level.items():
+            for block in self.coalesce_tiles(level, tiles):
+                self.start_region_load(level, block)
+    
+    def coalesce_tiles(self, level, tiles):
+        """Group tile coordinates into rectangles (x, y, columns, rows) of adjacent tiles
+        
+        Rows of tiles are extended to the right first, then downwards while the
+        whole row span is wanted. Blocks are capped at max_batch_size pixels per
+        side to bound the memory of a single read.
+        """
+        tile_width, tile_height = self.level_tile_sizes[level]
+        max_columns = max(1, self.max_batch_size // tile_width)
+        max_rows = max(1, self.max_batch_size // tile_height)
+        
+        remaining = set(tiles)
+        blocks = []
+        for x, y in sorted(tiles, key=lambda tile: (tile[1], tile[0])):
+            if (x, y) not in remaining:
+                continue
+            columns = 1
+            while columns < max_columns and (x + columns, y) in remaining:
+                columns += 1
+            rows = 1
+            while rows < max_rows and all((x + i, y + rows) in remaining for i in range(columns)):
+                rows += 1
+            for row in range(y, y + rows):
+                for column in range(x, x + columns):
+                    remaining.discard((column, row))
+            blocks.append((x, y, columns, rows))
+        return blocks
+    
+    def start_region_load(self, level, block):
+        """Read a block of tiles with a single read_region call"""
+        x, y, columns, rows = block
+        left, top, _, _ = self.tile_rect(level, x, y)
+        right, bottom, last_width, last_height = self.tile_rect(level, x + columns - 1, y + rows - 1)
+        
+        # read_region takes the location in level 0 coordinates
+        downsample = self.level_downsamples[level]
+        region = (int(round(left * downsample)), int(round(top * downsample)),
+                  right + last_width - left, bottom + last_height - top)
+        
+        # Tile bounds relative to the block
+        tiles = []
+        for row in range(y, y + rows):
+            for column in range(x, x + columns):
+                tile_left, tile_top, width, height = self.tile_rect(level, column, row)
+                tiles.append(((column, row, level), (tile_left - left, tile_top - top, width, height)))
+        
+        if self.process_pool and self.slide_path:
+            loader = ProcessRegionLoader(self.slide, level, region, tiles, self.warm_format,
+                                         self.process_pool, self.slide_path)
+        else:
+            loader = RegionLoader(self.slide, level, region, tiles, self.warm_format)
+        if self.slide_id:
+            loader.shared_cache = self.shared_cache
+            loader.shared_keys = {tile_key: self.shared_key(tile_key) for tile_key, _ in tiles}
+        if not self.adjustment.is_identity():
+            loader.adjustment = self.adjustment
+        loader.tissue_mask = self.tissue_mask
+        loader.tiles_loaded.connect(
+            lambda results, worker=loader: self.on_tiles_loaded(worker, results))
+        loader.finished.connect(
+            lambda worker=loader: self.on_tile_finished(worker))
+        for tile_key, _ in tiles:
+            self.active_workers[tile_key] = loader
+        self.thread_pool.start(TileLoadRunnable(loader))
+    
+    def on_tiles_loaded(self, loader, results):
+        """Store loaded tiles and notify listeners"""
+        for tile_key, image, data, adjusted in results:
+            # Ignore results of loads that were cancelled in the meantime
+            if self.active_workers.get(tile_key) is not loader or image.isNull():
+                continue
+            with self.cache_lock:
+                self.cache.put(tile_key, image, data)
+            if adjusted is not None:
+                self.store_adjusted(tile_key, loader.adjustment.key, adjusted)
+            if tile_key in loader.shared_hits:
+                self.shared_hits += 1
+            elif tile_key not in loader.background:
+                self.tiles_loaded += 1
+                x, y, level = tile_key
+                _, _, width, height = self.tile_rect(level, x, y)
+                self.bytes_read += width * height * 4
+                self.native_tile_reads += self.count_native_tiles(tile_key)
+            x, y, level = tile_key
+            self.tile_ready.emit(level, x, y)
+        self.enforce_memory_limit()
+    
+    def enforce_memory_limit(self):
+        """Trim the cache to the governor's budget and report its usage"""
+        with self.cache_lock:
+            self.governor.set_usage('tiles', self.cache.nbytes)
+            self.governor.set_usage('compressed tiles', self.cache.warm.nbytes)
+            self.cache.trim(self.governor.trim_target('tiles'), self.governor.trim_target('compressed tiles'))
+            self.governor.set_usage('tiles', self.cache.nbytes)
+            self.governor.set_usage('compressed tiles', self.cache.warm.nbytes)
+        self.governor.set_usage('adjusted tiles', self.adjusted.nbytes)
+        self.adjusted.trim(self.governor.trim_target('adjusted tiles'))
+        self.governor.set_usage('adjusted tiles', self.adjusted.nbytes)
+    
+    def on_tile_finished(self, loader):
+        for tile_key, _ in loader.tiles:
+            if self.active_workers.get(tile_key) is loader:
+                del self.active_workers[tile_key]
+    
+    def clean_invisible_tiles(self, level, visible_rect):
+        """Cancel pending loads that are no longer visible
+        :param level: Level currently being displayed
+        :param visible_rect: Visible region in level pixels
+        """
+        visible = set(self.get_tile_coordinates(level, visible_rect))
+        
+        def invisible(tile_key):
+            x, y, tile_level = tile_key
+            # Loads of coarser levels are kept, they are cheap and serve as fallback
+            return tile_level < level or (tile_level == level and (x, y) not in visible)
+        
+        self.queued = {tile_key for tile_key in self.queued if not invisible(tile_key)}
+        
+        affected = []
+        for tile_key, worker in list(self.active_workers.items()):
+            if invisible(tile_key):
+                del self.active_workers[tile_key]
+                affected.append(worker)
+        
+        # A block read is only stopped once none of its tiles are wanted any more
+        for worker in affected:
+            if not any(self.active_workers.get(tile_key) is worker for tile_key, _ in worker.tiles):
+                worker.stop()
+
+class TileLayerItem(QGraphicsItem):
+    """Graphics item painting one slide level straight from the tile cache
+    
+    The scene holds one item per level instead of one item per tile. Item
+    coordinates are level pixels; the item is scaled by the level downsample
+    so that scene coordinates are level 0 pixels.
+    """
+    
+    def __init__(self, tile_manager, level):
+        super().__init__()
+        self.tile_manager = tile_manager
+        self.level = level
+        level_width, level_height = tile_manager.level_dimensions[level]
+        self._bounds = QRectF(0, 0, level_width, level_height)
+        self.setScale(tile_manager.level_downsamples[level])
+        # Request exposedRect so only the visible tiles get painted
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        # Finer levels are stacked on top of coarser ones
+        self.setZValue(-level)
+    
+    def boundingRect(self):
+        return self._bounds
+    
+    def paint(self, painter, option, widget=None):
+        manager = self.tile_manager
+        level_scale = manager.level_downsamples[self.level]
+        
+        # Screen pixels per level 0 pixel
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        best_level = manager.best_level(lod / level_scale)
+        
+        # Finer levels than needed stay invisible, except that while an animated
+        # zoom is running the finer neighbour keeps showing its cached tiles
+        if self.level < best_level and not (manager.cached_only and self.level == best_level - 1):
+            return
+        
+        exposed = option.exposedRect.intersected(self._bounds)
+        if exposed.isEmpty():
+            return
+        
+        best_scale = manager.level_downsamples[best_level] / level_scale
+        
+        # Draw in device pixels with tile rects snapped outward to whole pixels,
+        # fractional edges would otherwise leave seams between adjacent tiles
+        world = painter.worldTransform()
+        painter.resetTransform()
+        
+        for x, y in manager.get_tile_coordinates(self.level, exposed):
+            left, top, width, height = manager.tile_rect(self.level, x, y)
+            target = QRectF(left, top, width, height)
+            
+            if self.level <= best_level:
+                image = manager.get_tile(self.level, x, y)
+                if image is None:
+                    if self.level == best_level and not manager.cached_only:
+                        manager.add_tile_to_queue(x, y, self.level)
+                    continue
+            else:
+                # Coarser level only fills in where the displayed level has no tiles yet.
+                # Checked first, so covered tiles aren't decoded from the warm tier for nothing
+                visible = target.intersected(exposed)
+                best_rect = QRectF(visible.x() / best_scale, visible.y() / best_scale,
+                                   visible.width() / best_scale, visible.height() / best_scale)
+                if manager.is_region_cached(best_level, best_rect):
+                    continue
+                image = manager.get_tile(self.level, x, y)
+                if image is None:
+                    continue
+            
+            rect = QRectF(world.mapRect(target).toAlignedRect())
+            color = getattr(image, 'uniform_color', None)
+            if color is not None:
+                painter.fillRect(rect, QColor(*color))
+            else:
+                painter.drawImage(rect, image)
+        
+        painter.setWorldTransform(world)
 
 class WSIImageViewer(QMainWindow):
     def __init__(self):
@@ -204,6 +2058,34 @@ class WSIImageViewer(QMainWindow):
         self.current_level = None  # Will be set when loading image
         self.zoom_factor = 1.0
         self._is_closing = False
+        self.memory_governor = MemoryGovernor()
+        from shared_tile_cache import SharedTileCache
+        self.tile_manager = TileManager(governor=self.memory_governor,
+                                        shared_cache=SharedTileCache.from_environment())
+        self.tile_manager.set_decode_backend(os.environ.get('WSI_VIEWER_DECODE_BACKEND', 'threads'))
+        self.tile_manager.tile_ready.connect(self.on_tile_ready)
+        self.tile_layers = []
+        self.viewport_recorder = None
+        self.thumbnail_pixels = None
+        self.slide_adjustments = {}  # Slide path -> display adjustment slider values
+        self.tissue_masks = LRUCache(8)  # Slide path -> TissueMask
+        self.tissue_mask_loaders = {}  # Slide path -> TissueMaskLoader running
+        self.pending_tissue_jump = 0  # Step of a tissue region jump waiting for the mask
+        self.associated_images = LRUCache(16, max_bytes=128 * 1024 * 1024,
+                                          sizeof=lambda image: image.sizeInBytes())  # (Slide path, name) -> QImage
+        self.associated_loaders = {}  # (Slide path, name) -> AssociatedImageLoader running
+        self.tissue_region_index = -1
+        self.slide_annotations = {}  # Slide path -> AnnotationStore
+        self.slide_point_clouds = {}  # Slide path -> PointCloud of detected cells
+        self.annotation_layers = []
+        self.slide_library = None
+        self.slide_catalog = None  # SlideCatalog, opened on first use
+        self.slide_opener = None  # SlideOpener of the slide being opened
+        self.restored_viewport = None  # (center_x, center_y, scale, level) to reopen the slide at
+        self.fitted_scale = None  # View scale of the last fit to the window, see fit_view
+        self.catalog_scanner = None
+        self.image_saver = None  # ImageSaver running
+        self.save_progress = None
         self.progress_bar = QProgressBar()
         self.progress_bar.setMaximumWidth(150)
         self.progress_bar.hide()
@@ -255,16 +2137,35 @@ class WSIImageViewer(QMainWindow):
         open_action.triggered.connect(self.open_wsi_file)
         file_menu.addAction(open_action)
         
+        browse_action = QAction('&Browse Folder...', self)
+        browse_action.setShortcut('Ctrl+Shift+O')
+        browse_action.triggered.connect(self.browse_slide_folder)
+        file_menu.addAction(browse_action)
+        
         save_action = QAction('&Save L3 Image...', self)
         save_action.setShortcut('Ctrl+S')
         save_action.triggered.connect(self.save_thumbnail)
         file_menu.addAction(save_action)
         
+        export_view_action = QAction('&Export Current View...', self)
+        export_view_action.setShortcut('Ctrl+E')
+        export_view_action.triggered.connect(self.export_current_view)
+        file_menu.addAction(export_view_action)
+        
         save_meta_action = QAction('Save &Metadata...', self)
         save_meta_action.setShortcut('Ctrl+M')
         save_meta_action.triggered.connect(self.save_metadata)
         file_menu.addAction(save_meta_action)
         
+        import_annotations_action = QAction('Import &Annotations...', self)
+        import_annotations_action.setShortcut('Ctrl+Shift+A')
+        import_annotations_action.triggered.connect(self.import_annotations)
+        file_menu.addAction(import_annotations_action)
+        
+        import_detections_action = QAction('Import Cell &Detections...', self)
+        import_detections_action.triggered.connect(self.import_detections)
+        file_menu.addAction(import_detections_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction('E&xit', self)
@@ -272,6 +2173,47 @@ class WSIImageViewer(QMainWindow):
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
         
+        # Tools menu
+        tools_menu = menubar.addMenu('&Tools')
+        
+        self.record_action = QAction('&Record Navigation...', self)
+        self.record_action.setCheckable(True)
+        self.record_action.triggered.connect(self.toggle_navigation_recording)
+        tools_menu.addAction(self.record_action)
+        
+        next_tissue_action = QAction('&Next Tissue Region', self)
+        next_tissue_action.setShortcut('N')
+        next_tissue_action.triggered.connect(lambda: self.jump_to_tissue_region(1))
+        tools_menu.addAction(next_tissue_action)
+        
+        previous_tissue_action = QAction('Pre&vious Tissue Region', self)
+        previous_tissue_action.setShortcut('Shift+N')
+        previous_tissue_action.triggered.connect(lambda: self.jump_to_tissue_region(-1))
+        tools_menu.addAction(previous_tissue_action)
+        
+        self.show_annotations_action = QAction('Show &Annotations', self)
+        self.show_annotations_action.setShortcut('A')
+        self.show_annotations_action.setCheckable(True)
+        self.show_annotations_action.setChecked(True)
+        self.show_annotations_action.toggled.connect(self.toggle_annotations)
+        tools_menu.addAction(self.show_annotations_action)
+        
+        tools_menu.addSeparator()
+        
+        self.process_decode_action = QAction('Decode in Worker &Processes', self)
+        self.process_decode_action.setCheckable(True)
+        self.process_decode_action.setChecked(self.tile_manager.decode_backend == 'processes')
+        self.process_decode_action.toggled.connect(self.toggle_process_decoding)
+        tools_menu.addAction(self.process_decode_action)
+        
+        cache_level_action = QAction('Cache &Level on Disk...', self)
+        cache_level_action.triggered.connect(self.choose_cached_level)
+        tools_menu.addAction(cache_level_action)
+        
+        scan_catalog_action = QAction('Add Folder to Slide &Catalog...', self)
+        scan_catalog_action.triggered.connect(self.scan_slide_folder)
+        tools_menu.addAction(scan_catalog_action)
+        
     def create_metadata_panel(self):
         panel = QFrame()
         panel.setFrameStyle(QFrame.Box)
@@ -320,10 +2262,149 @@ class WSIImageViewer(QMainWindow):
                 color: black;
             }
         """)
+        self.metadata_tree.itemClicked.connect(self.on_metadata_item_clicked)
         layout.addWidget(self.metadata_tree)
         
+        layout.addWidget(self.create_associated_panel())
+        layout.addWidget(self.create_adjustment_panel())
+        
         return panel
 
+    # Display adjustment sliders: name, label, range and neutral value
+    ADJUSTMENT_SLIDERS = (
+        ('brightness', 'Brightness', -100, 100, 0),
+        ('contrast', 'Contrast', -100, 100, 0),
+        ('gamma', 'Gamma', -100, 100, 0),
+        ('red', 'Red', 0, 200, 100),
+        ('green', 'Green', 0, 200, 100),
+        ('blue', 'Blue', 0, 200, 100),
+    )
+
+    def create_associated_panel(self):
+        """Viewer for the label, macro and other associated images, decoded when selected"""
+        self.associated_group = QGroupBox('Associated Images')
+        layout = QVBoxLayout(self.associated_group)
+        layout.setContentsMargins(5, 5, 5, 5)
+        
+        self.associated_combo = QComboBox()
+        self.associated_combo.activated[str].connect(self.show_associated_image)
+        layout.addWidget(self.associated_combo)
+        
+        self.associated_label = QLabel()
+        self.associated_label.setAlignment(Qt.AlignCenter)
+        self.associated_label.setFixedHeight(160)
+        layout.addWidget(self.associated_label)
+        
+        self.associated_group.hide()
+        return self.associated_group
+
+    def update_associated_panel(self):
+        """List the associated images of the current slide without decoding any"""
+        names = list(self.slide.associated_images) if self.slide else []
+        self.associated_combo.clear()
+        self.associated_combo.addItems(names)
+        self.associated_combo.setCurrentIndex(-1)
+        self.associated_label.clear()
+        self.associated_label.setText('Select an image')
+        self.associated_group.setVisible(bool(names))
+
+    def show_associated_image(self, name):
+        """Show an associated image, decoding it on the thread pool on first use"""
+        if not self.slide or self._is_closing:
+            return
+        
+        key = (self.current_file_path, name)
+        if self.associated_combo.currentText() != name:
+            self.associated_combo.setCurrentText(name)
+        if key in self.associated_images:
+            self.display_associated_image(self.associated_images[key])
+            return
+        
+        self.associated_label.clear()
+        self.associated_label.setText(f'Loading {name}...')
+        if key not in self.associated_loaders:
+            loader = AssociatedImageLoader(self.current_file_path, name)
+            loader.image_loaded.connect(self.on_associated_image_loaded)
+            self.associated_loaders[key] = loader
+            self.tile_manager.thread_pool.start(TileLoadRunnable(loader))
+
+    def on_associated_image_loaded(self, path, name, image):
+        self.associated_loaders.pop((path, name), None)
+        if self._is_closing:
+            return
+        if image is not None:
+            self.associated_images[(path, name)] = image
+        # The user may have moved on to another image or slide meanwhile
+        if path == self.current_file_path and self.associated_combo.currentText() == name:
+            if image is None:
+                self.associated_label.setText(f'Could not load {name}')
+            else:
+                self.display_associated_image(image)
+
+    def display_associated_image(self, image):
+        pixmap = QPixmap.fromImage(image).scaled(
+            self.associated_label.width(), self.associated_label.height(),
+            Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.associated_label.setPixmap(pixmap)
+        self.associated_label.setToolTip(f'{self.associated_combo.currentText()}: '
+                                         f'{image.width()} x {image.height()}')
+
+    def on_metadata_item_clicked(self, item, column):
+        name = item.data(0, Qt.UserRole)
+        if name:
+            self.show_associated_image(name)
+
+    def create_adjustment_panel(self):
+        """Sliders for brightness, contrast, gamma and colour balance of the displayed slide"""
+        group = QGroupBox('Display Adjustments')
+        form = QFormLayout(group)
+        form.setContentsMargins(5, 5, 5, 5)
+        
+        self.adjustment_sliders = {}
+        for name, label, minimum, maximum, neutral in self.ADJUSTMENT_SLIDERS:
+            slider = QSlider(Qt.Horizontal)
+            slider.setRange(minimum, maximum)
+            slider.setValue(neutral)
+            slider.valueChanged.connect(self.on_adjustment_changed)
+            form.addRow(label, slider)
+            self.adjustment_sliders[name] = slider
+        
+        reset_button = QPushButton('Reset')
+        reset_button.clicked.connect(self.reset_adjustment)
+        form.addRow(reset_button)
+        return group
+
+    def adjustment_from_sliders(self):
+        """DisplayAdjustment for the current slider positions"""
+        values = {name: slider.value() for name, slider in self.adjustment_sliders.items()}
+        return DisplayAdjustment(
+            brightness=values['brightness'] / 200.0,
+            # Contrast and gamma range from 1/4 to 4 with 1 in the middle
+            contrast=2 ** (values['contrast'] / 50.0),
+            gamma=2 ** (values['gamma'] / 50.0),
+            gains=(values['red'] / 100.0, values['green'] / 100.0, values['blue'] / 100.0))
+
+    def set_adjustment_sliders(self, values):
+        """Move the sliders without applying every intermediate value"""
+        for name, slider in self.adjustment_sliders.items():
+            slider.blockSignals(True)
+            slider.setValue(values[name])
+            slider.blockSignals(False)
+        self.on_adjustment_changed()
+
+    def reset_adjustment(self):
+        self.set_adjustment_sliders({name: neutral for name, _, _, _, neutral in self.ADJUSTMENT_SLIDERS})
+
+    def on_adjustment_changed(self, *args):
+        """Apply the slider values, only the tiles being painted are adjusted again"""
+        if self.current_file_path:
+            self.slide_adjustments[self.current_file_path] = {
+                name: slider.value() for name, slider in self.adjustment_sliders.items()}
+        self.tile_manager.set_adjustment(self.adjustment_from_sliders())
+        for layer in self.tile_layers:
+            layer.update()
+        self.show_thumbnail()
+
     def add_tree_item(self, parent, text, full_text=None):
         """Helper function to add items to the tree with tooltips"""
         item = QTreeWidgetItem(parent, [text])
@@ -331,22 +2412,24 @@ class WSIImageViewer(QMainWindow):
             item.setToolTip(0, full_text)
         return item
 
-    def display_metadata(self):
-        if not self.slide:
+    def display_metadata(self, slide=None):
+        """Show the metadata of the slide, or of a CatalogRecord while the slide opens"""
+        slide = slide or self.slide
+        if not slide:
             return
             
         # Clear existing items
         self.metadata_tree.clear()
         
         # Get basic information
-        dimensions = self.slide.dimensions
-        level_count = self.slide.level_count
-        level_dimensions = self.slide.level_dimensions
-        level_downsamples = self.slide.level_downsamples
+        dimensions = slide.dimensions
+        level_count = slide.level_count
+        level_dimensions = slide.level_dimensions
+        level_downsamples = slide.level_downsamples
         
         # Get pixel size information
-        mpp_x = self.slide.properties.get('openslide.mpp-x', 'Unknown')
-        mpp_y = self.slide.properties.get('openslide.mpp-y', 'Unknown')
+        mpp_x = slide.properties.get('openslide.mpp-x', 'Unknown')
+        mpp_y = slide.properties.get('openslide.mpp-y', 'Unknown')
         
         # File information
         file_item = QTreeWidgetItem(["File Information"])
@@ -405,7 +2488,7 @@ class WSIImageViewer(QMainWindow):
         
         # Group properties by vendor
         vendor_props = {}
-        for key, value in self.slide.properties.items():
+        for key, value in slide.properties.items():
             vendor = key.split('.')[0] if '.' in key else 'Other'
             if vendor not in vendor_props:
                 vendor_props[vendor] = []
@@ -420,14 +2503,17 @@ class WSIImageViewer(QMainWindow):
                 self.add_tree_item(vendor_item, prop_text, f"{key}:\n{value}")
         
         # Associated images
-        if self.slide.associated_images:
+        if slide.associated_images:
             assoc_item = QTreeWidgetItem(["Associated Images"])
             assoc_item.setExpanded(False)
             self.metadata_tree.addTopLevelItem(assoc_item)
-            for name, img in self.slide.associated_images.items():
-                image_text = f"{name}: {img.size[0]} x {img.size[1]}"
-                self.add_tree_item(assoc_item, image_text,
-                    f"Name: {name}\nWidth: {img.size[0]} pixels\nHeight: {img.size[1]} pixels")
+            # Sizes come from the properties, the images are only decoded when selected
+            for name in slide.associated_images:
+                width = slide.properties.get(f'openslide.associated.{name}.width', '?')
+                height = slide.properties.get(f'openslide.associated.{name}.height', '?')
+                image_item = self.add_tree_item(assoc_item, f"{name}: {width} x {height}",
+                    f"Name: {name}\nWidth: {width} pixels\nHeight: {height} pixels\nClick to view")
+                image_item.setData(0, Qt.UserRole, name)
 
     def create_wsi_panel(self):
         panel = QFrame()
@@ -445,6 +2531,8 @@ class WSIImageViewer(QMainWindow):
         # WSI display area
         self.graphics_view = QGraphicsView()
         self.graphics_scene = QGraphicsScene()
+        # The scene only holds one tile layer per level, no spatial index needed
+        self.graphics_scene.setItemIndexMethod(QGraphicsScene.NoIndex)
         self.graphics_view.setScene(self.graphics_scene)
         self.graphics_view.setRenderHint(QPainter.Antialiasing)
         self.graphics_view.setRenderHint(QPainter.SmoothPixmapTransform)
@@ -456,9 +2544,34 @@ class WSIImageViewer(QMainWindow):
         self.graphics_view.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.graphics_view.setResizeAnchor(QGraphicsView.AnchorViewCenter)
         self.graphics_view.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
-        
+
+        # Render quality switches to fast mode while the user is dragging or
+        # zooming and back to smooth mode once input has been idle for a moment
+        self._interacting = False
+        self.interaction_timer = QTimer(self)
+        self.interaction_timer.setSingleShot(True)
+        self.interaction_timer.setInterval(250)  # Idle time before the high quality repaint
+        self.interaction_timer.timeout.connect(self.end_interaction)
+
+        # Animated zoom, intermediate frames are painted from cached tiles only
+        self.zoom_animation = QVariantAnimation(self)
+        self.zoom_animation.setDuration(200)
+        self.zoom_animation.setEasingCurve(QEasingCurve.OutCubic)
+        self.zoom_animation.setStartValue(0.0)
+        self.zoom_animation.setEndValue(1.0)
+        self.zoom_animation.valueChanged.connect(self.on_zoom_animation_step)
+        self.zoom_animation.finished.connect(self.on_zoom_animation_finished)
+        self._zoom_start = 1.0
+        self._zoom_target = 1.0
+        self._zoom_anchor_scene = QPointF()
+        self._zoom_anchor_view = QPoint()
+
         # Connect viewport change signals
         self.graphics_view.viewport().installEventFilter(self)
+        self.graphics_view.horizontalScrollBar().valueChanged.connect(self.begin_interaction)
+        self.graphics_view.verticalScrollBar().valueChanged.connect(self.begin_interaction)
+        self.graphics_view.horizontalScrollBar().valueChanged.connect(self.update_visible_region)
+        self.graphics_view.verticalScrollBar().valueChanged.connect(self.update_visible_region)
 
         # Create thumbnail
         self.thumbnail_widget = QWidget(container)
@@ -584,62 +2697,98 @@ class WSIImageViewer(QMainWindow):
         )
         
         if file_path:
-            try:
-                self.load_wsi_file(file_path)
-            except Exception as e:
-                self.metadata_tree.clear()
-                self.metadata_tree.addTopLevelItem(QTreeWidgetItem(["Error"]))
-                self.metadata_tree.topLevelItem(0).setText(0, str(e))
+            self.open_slide(file_path)
+    
+    def open_slide(self, file_path):
+        try:
+            self.load_wsi_file(file_path)
+        except Exception as e:
+            self.metadata_tree.clear()
+            self.metadata_tree.addTopLevelItem(QTreeWidgetItem(["Error"]))
+            self.metadata_tree.topLevelItem(0).setText(0, str(e))
+    
+    def browse_slide_folder(self):
+        """Show the slides of a folder as thumbnails in the slide library pane"""
+        directory = QFileDialog.getExistingDirectory(
+            self, 'Select Slide Folder',
+            os.path.dirname(self.current_file_path) if self.current_file_path else '')
+        if not directory:
+            return
+        
+        if self.slide_library is None:
+            from slide_library import SlideLibraryWidget
+            self.slide_library = SlideLibraryWidget()
+            self.slide_library.slide_activated.connect(self.open_slide)
+            dock = QDockWidget('Slide Library', self)
+            dock.setObjectName('slide_library')
+            dock.setWidget(self.slide_library)
+            self.addDockWidget(Qt.LeftDockWidgetArea, dock)
+        self.slide_library.parentWidget().show()
+        self.slide_library.set_directory(directory)
                 
     def load_wsi_file(self, file_path):
+        """Open a slide, shown at once from the slide catalog if it has a current record
+        
+        With a catalog record the metadata and slide geometry are displayed while
+        the slide opens on a thread pool thread; otherwise the slide is opened
+        here and added to the catalog.
+        """
         try:
             if self._is_closing:
                 return
                 
             self.statusBar().showMessage('Loading WSI file...')
             
-            # Close previous slide
+            # A trace belongs to one slide
+            self.stop_navigation_recording()
+            self.remember_viewport()
+            
+            # Stop tile loads before closing previous slide
+            self.tile_manager.set_slide(None)
             if self.slide:
                 self.slide.close()
+                self.slide = None
+            self.slide_opener = None
             
-            # Save file path
-            self.current_file_path = file_path
-                
-            # Open new slide
-            self.slide = openslide.OpenSlide(file_path)
-            
-            # Choose initial level based on image size
-            dimensions = self.slide.dimensions
-            target_size = 1024 * 1024  # Target: ~1 million pixels
-            actual_size = dimensions[0] * dimensions[1]
-            
-            # Calculate ideal level
-            ideal_downsample = (actual_size / target_size) ** 0.5
-            
-            # Find the closest level
-            downsamples = self.slide.level_downsamples
-            closest_level = min(range(len(downsamples)), 
-                              key=lambda i: abs(downsamples[i] - ideal_downsample))
-            
-            # Set current level
-            self.current_level = closest_level
-            
-            # Display metadata
-            self.display_metadata()
-            
-            # Display WSI image
-            self.display_wsi_image()
+            # Save file path
+            self.current_file_path = file_path
             
-            # Update thumbnail
-            self.update_thumbnail()
+            catalog = self.open_slide_catalog()
+            record = None
+            self.restored_viewport = None
+            if catalog:
+                try:
+                    record = catalog.get(file_path)
+                    self.restored_viewport = catalog.viewport(file_path)
+                except sqlite3.Error as e:
+                    print(f"Error reading slide catalog: {e}")
+            
+            if record is None:
+                slide = openslide.OpenSlide(file_path)
+                if catalog:
+                    try:
+                        catalog.add(file_path, slide)
+                    except (OSError, sqlite3.Error) as e:
+                        print(f"Error adding {file_path} to the slide catalog: {e}")
+                self.show_slide(file_path, slide)
+                return
             
-            # Update status bar
-            filename = os.path.basename(file_path)
-            level_size = self.slide.level_dimensions[self.current_level]
-            self.statusBar().showMessage(
-                f'Loaded: {filename} - Original Size: {dimensions[0]}x{dimensions[1]} - '
-                f'Display Level: {self.current_level} ({level_size[0]}x{level_size[1]})'
-            )
+            # Geometry and properties from the catalog until the slide is open
+            self.display_metadata(record)
+            self.graphics_scene.clear()
+            self.tile_layers = []
+            self.annotation_layers = []
+            width, height = record.dimensions
+            self.graphics_scene.setSceneRect(QRectF(0, 0, width, height))
+            self.fit_view()
+            if self.restored_viewport:
+                self.apply_viewport(self.restored_viewport)
+            self.statusBar().showMessage(f'Opening {os.path.basename(file_path)} ({width}x{height})...')
+            
+            opener = self.slide_opener = SlideOpener(file_path)
+            opener.slide_opened.connect(
+                lambda path, slide, error, worker=opener: self.on_slide_opened(worker, slide, error))
+            QThreadPool.globalInstance().start(TileLoadRunnable(opener))
             
         except Exception as e:
             self.statusBar().showMessage(f'Error: {str(e)}')
@@ -647,6 +2796,170 @@ class WSIImageViewer(QMainWindow):
             self.metadata_tree.addTopLevelItem(QTreeWidgetItem(["Error"]))
             self.metadata_tree.topLevelItem(0).setText(0, str(e))
             raise
+    
+    def on_slide_opened(self, opener, slide, error):
+        if opener is not self.slide_opener or self._is_closing:
+            # Another slide was opened meanwhile
+            if slide:
+                slide.close()
+            return
+        self.slide_opener = None
+        try:
+            if slide is None:
+                raise openslide.OpenSlideError(error)
+            self.show_slide(opener.path, slide)
+        except Exception as e:
+            self.statusBar().showMessage(f'Error: {str(e)}')
+            self.metadata_tree.clear()
+            self.metadata_tree.addTopLevelItem(QTreeWidgetItem(["Error"]))
+            self.metadata_tree.topLevelItem(0).setText(0, str(e))
+    
+    def show_slide(self, file_path, slide):
+        """Display an opened slide"""
+        self.slide = slide
+        self.tile_manager.set_slide(self.slide, file_path)
+        # Background tiles are filled instead of read once the mask is known
+        self.pending_tissue_jump = 0
+        self.tile_manager.set_tissue_mask(self.tissue_mask())
+        
+        # Tiles of the view the slide reopens at load while the rest is set up
+        if self.restored_viewport:
+            self.prefetch_viewport(self.restored_viewport)
+        
+        # Each slide keeps its own display adjustment
+        self.thumbnail_pixels = None
+        self.tissue_region_index = -1
+        self.set_adjustment_sliders(self.slide_adjustments.get(
+            file_path, {name: neutral for name, _, _, _, neutral in self.ADJUSTMENT_SLIDERS}))
+        
+        # Start at the coarsest level, the displayed level follows the zoom
+        dimensions = self.slide.dimensions
+        self.current_level = self.slide.level_count - 1
+        
+        # Display metadata
+        self.display_metadata()
+        self.update_associated_panel()
+        
+        # Display WSI image
+        self.display_wsi_image()
+        
+        # Update thumbnail
+        self.update_thumbnail()
+        
+        # Update status bar
+        filename = os.path.basename(file_path)
+        level_size = self.slide.level_dimensions[self.current_level]
+        self.statusBar().showMessage(
+            f'Loaded: {filename} - Original Size: {dimensions[0]}x{dimensions[1]} - '
+            f'Display Level: {self.current_level} ({level_size[0]}x{level_size[1]})'
+        )
+        self.restored_viewport = None
+    
+    def remember_viewport(self):
+        """Save the current viewport of the slide in the slide catalog, to reopen it there"""
+        if not self.slide or not self.current_file_path or not self.tile_layers:
+            return
+        catalog = self.open_slide_catalog()
+        if catalog is None:
+            return
+        center = self.graphics_view.mapToScene(self.graphics_view.viewport().rect().center())
+        try:
+            catalog.set_viewport(self.current_file_path, center.x(), center.y(), self.zoom_factor,
+                                 self.current_level)
+        except sqlite3.Error as e:
+            print(f"Error saving viewport: {e}")
+    
+    def fit_view(self):
+        """Show the whole slide, the view is kept fitted as the window resizes until zoomed"""
+        self.graphics_view.fitInView(self.graphics_scene.sceneRect(), Qt.KeepAspectRatio)
+        self.fitted_scale = self.graphics_view.transform().m11()
+    
+    def is_view_fitted(self):
+        """Check whether the view is still at the scale of the last fit_view"""
+        return (self.fitted_scale is not None and
+                abs(self.graphics_view.transform().m11() / self.fitted_scale - 1) < 1e-6)
+    
+    def apply_viewport(self, viewport):
+        """Show a viewport (center_x, center_y, scale, level) saved by remember_viewport"""
+        self.fitted_scale = None
+        center_x, center_y, scale, _ = viewport
+        if self.slide:
+            scale = self.clamp_zoom(scale)
+        transform = QTransform()
+        transform.scale(scale, scale)
+        self.graphics_view.setTransform(transform)
+        self.graphics_view.centerOn(center_x, center_y)
+    
+    def prefetch_viewport(self, viewport):
+        """Queue the tiles of a saved viewport, and the coarsest level to paint until they arrive"""
+        center_x, center_y, scale, _ = viewport
+        scale = self.clamp_zoom(scale)
+        size = self.graphics_view.viewport().rect()
+        width, height = size.width() / scale, size.height() / scale
+        self.request_view_tiles(scale, QRectF(center_x - width / 2, center_y - height / 2, width, height))
+        # Reads start now rather than once show_slide returns, the view tiles ahead of the coarsest level
+        self.tile_manager.flush_queue()
+        coarsest = self.slide.level_count - 1
+        self.tile_manager.request_region(coarsest, QRectF(0, 0, *self.slide.level_dimensions[coarsest]))
+        self.tile_manager.flush_queue()
+    
+    def request_view_tiles(self, scale, scene_rect):
+        """Queue the tiles of the level a view at scale would show, before the view gets there
+        :param scene_rect: Region in level 0 pixels
+        """
+        self.tile_manager.update_level_bias(scale, scene_rect)
+        level = self.tile_manager.best_level(scale)
+        level_scale = self.slide.level_downsamples[level]
+        self.tile_manager.request_region(level, QRectF(
+            scene_rect.x() / level_scale, scene_rect.y() / level_scale,
+            scene_rect.width() / level_scale, scene_rect.height() / level_scale))
+    
+    def open_slide_catalog(self):
+        """The slide catalog, or None if it can't be opened"""
+        if self.slide_catalog is None:
+            from slide_catalog import SlideCatalog
+            try:
+                self.slide_catalog = SlideCatalog()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Slide catalog disabled: {e}")
+                self.slide_catalog = False
+        return self.slide_catalog or None
+    
+    def scan_slide_folder(self):
+        """Add the slides of a folder and its subfolders to the slide catalog in the background"""
+        catalog = self.open_slide_catalog()
+        if catalog is None:
+            QMessageBox.warning(self, "Warning", "The slide catalog could not be opened")
+            return
+        if self.catalog_scanner is not None:
+            QMessageBox.information(self, "Slide Catalog", "A folder is being scanned already")
+            return
+        directory = QFileDialog.getExistingDirectory(
+            self, 'Add Folder to Slide Catalog',
+            os.path.dirname(self.current_file_path) if self.current_file_path else '')
+        if not directory:
+            return
+        
+        scanner = self.catalog_scanner = CatalogScanner(catalog.path, [directory])
+        scanner.progress.connect(self.on_catalog_progress)
+        scanner.finished.connect(self.on_catalog_scanned)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.statusBar().showMessage(f'Scanning {directory}...')
+        QThreadPool.globalInstance().start(TileLoadRunnable(scanner))
+    
+    def on_catalog_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+    
+    def on_catalog_scanned(self, counts):
+        self.catalog_scanner = None
+        self.progress_bar.hide()
+        if counts is None:
+            self.statusBar().showMessage('Scanning slides failed')
+            return
+        self.statusBar().showMessage('Slide catalog: ' + ', '.join(
+            f'{count} {name}' for name, count in counts.items() if count))
 
     def display_wsi_image(self):
         """Display WSI image"""
@@ -656,59 +2969,37 @@ class WSIImageViewer(QMainWindow):
         try:
             # Clear previous scene
             self.graphics_scene.clear()
+            self.tile_layers = []
+            self.annotation_layers = []
             
-            # Get current level dimensions
-            level_width, level_height = self.slide.level_dimensions[self.current_level]
-            
-            # Load full image directly
-            self.load_full_image()
+            # Create tile layers for all levels
+            self.load_tile_layers()
+            self.add_annotation_layers()
             
         except Exception as e:
             print(f"Error displaying WSI image: {e}")
             self.statusBar().showMessage(f'Error displaying image: {str(e)}')
 
-    def load_full_image(self):
-        """Load full image"""
+    def load_tile_layers(self):
+        """Add one tile layer per level and fit the slide to the window"""
         if not self.slide or self._is_closing:
             return
             
         try:
-            # Get current level dimensions
-            level_width, level_height = self.slide.level_dimensions[self.current_level]
-            
-            # Show progress bar
-            self.progress_bar.setValue(0)
-            self.progress_bar.show()
-            
-            # Read entire image
-            image_data = self.slide.read_region(
-                (0, 0),
-                self.current_level,
-                (level_width, level_height)
-            )
-            
-            # Convert to RGB mode
-            image_data = image_data.convert('RGB')
-            
-            # Convert to QImage
-            qimage = QImage(
-                image_data.tobytes('raw', 'RGB'),
-                image_data.width,
-                image_data.height,
-                image_data.width * 3,
-                QImage.Format_RGB888
-            )
+            # One graphics item per level, tiles are painted from the cache
+            for level in range(self.slide.level_count):
+                layer = TileLayerItem(self.tile_manager, level)
+                self.graphics_scene.addItem(layer)
+                self.tile_layers.append(layer)
             
-            # Create graphics item and add to scene
-            pixmap = QPixmap.fromImage(qimage)
-            item = QGraphicsPixmapItem(pixmap)
-            self.graphics_scene.addItem(item)
+            # Scene coordinates are level 0 pixels
+            width, height = self.slide.dimensions
+            self.graphics_scene.setSceneRect(QRectF(0, 0, width, height))
             
-            # Set scene rectangle
-            self.graphics_scene.setSceneRect(item.boundingRect())
-            
-            # Adjust view to show full image (fill main view)
-            self.graphics_view.fitInView(item, Qt.KeepAspectRatio)
+            # Adjust view to show full image (fill main view), or where the slide was left
+            self.fit_view()
+            if self.restored_viewport:
+                self.apply_viewport(self.restored_viewport)
             
             # Get actual zoom factor
             transform = self.graphics_view.transform()
@@ -717,33 +3008,308 @@ class WSIImageViewer(QMainWindow):
             # Update zoom display
             self.update_zoom_display()
             
-            # Update status bar
-            self.update_status_info()
-            
-            # Hide progress bar
-            self.progress_bar.hide()
+            # Update displayed level, thumbnail box and status bar
+            self.update_visible_region()
             
         except Exception as e:
-            print(f"Error loading full image: {e}")
-            self.progress_bar.hide()
+            print(f"Error loading tile layers: {e}")
             self.statusBar().showMessage(f'Error loading image: {str(e)}')
 
-    def update_visible_region(self):
-        """Update visible region - simplified version, no longer using tile loading"""
+    def update_visible_region(self, *args):
+        """Update displayed level and cancel loads of tiles that scrolled out of view"""
         if not self.slide or self._is_closing:
             return
         
-        # Simplified version: only update thumbnail and status info
         try:
+            # Level the tile layers currently paint from, coarser if memory is short
+            scale = self.graphics_view.transform().m11()
+            view_rect = self.graphics_view.mapToScene(self.graphics_view.viewport().rect()).boundingRect()
+            # Destination tiles queued by an animated zoom must survive its intermediate frames
+            if not self.tile_manager.cached_only:
+                self.tile_manager.update_level_bias(scale, view_rect)
+            self.current_level = self.tile_manager.best_level(scale)
+            
+            # Visible region in current level pixels
+            if not self.tile_manager.cached_only:
+                level_scale = self.slide.level_downsamples[self.current_level]
+                level_rect = QRectF(view_rect.x() / level_scale, view_rect.y() / level_scale,
+                                    view_rect.width() / level_scale, view_rect.height() / level_scale)
+                self.tile_manager.clean_invisible_tiles(self.current_level, level_rect)
+            
+            if self.viewport_recorder:
+                self.viewport_recorder.record(view_rect, scale, self.current_level)
+            
             self.update_thumbnail_box()
             self.update_status_info()
         except Exception as e:
             print(f"Error updating visible region: {e}")
 
-    def on_region_loaded(self, image, pos_x, pos_y):
-        """Handle loaded region - simplified version"""
-        # This method is no longer used, but kept to avoid errors
-        pass
+    def toggle_navigation_recording(self, checked):
+        """Start or stop recording the viewport trajectory to a trace file"""
+        if not checked:
+            self.stop_navigation_recording()
+            return
+        
+        if not self.slide:
+            QMessageBox.warning(self, "Warning", "No image loaded")
+            self.record_action.setChecked(False)
+            return
+        
+        base_name = os.path.splitext(os.path.basename(self.current_file_path))[0]
+        file_path, _ = QFileDialog.getSaveFileName(
+            self,
+            'Record Navigation',
+            f"{base_name}_trace.jsonl",
+            'Trace Files (*.jsonl);;All Files (*)'
+        )
+        if not file_path:
+            self.record_action.setChecked(False)
+            return
+        
+        try:
+            from viewport_trace import ViewportRecorder
+            viewport = self.graphics_view.viewport().rect()
+            self.viewport_recorder = ViewportRecorder(
+                file_path, self.current_file_path, self.slide.dimensions,
+                (viewport.width(), viewport.height()))
+            self.update_visible_region()
+            self.statusBar().showMessage(f'Recording navigation to {os.path.basename(file_path)}')
+        except Exception as e:
+            print(f"Error starting navigation recording: {e}")
+            self.record_action.setChecked(False)
+            QMessageBox.critical(self, "Error", "Failed to start recording")
+
+    def tissue_mask(self):
+        """Tissue mask of the current slide, or None while it is computed in the background"""
+        if not self.slide:
+            return None
+        path = self.current_file_path
+        if path in self.tissue_masks:
+            return self.tissue_masks[path]
+        if path not in self.tissue_mask_loaders:
+            loader = TissueMaskLoader(path)
+            loader.mask_ready.connect(self.on_tissue_mask_ready)
+            self.tissue_mask_loaders[path] = loader
+            QThreadPool.globalInstance().start(TileLoadRunnable(loader))
+        return None
+    
+    def on_tissue_mask_ready(self, path, mask):
+        self.tissue_mask_loaders.pop(path, None)
+        if self._is_closing:
+            return
+        if mask is not None:
+            self.tissue_masks[path] = mask
+        if path != self.current_file_path or not self.slide:
+            return
+        self.tile_manager.set_tissue_mask(mask)
+        step, self.pending_tissue_jump = self.pending_tissue_jump, 0
+        if step:
+            if mask is None:
+                self.statusBar().showMessage('Tissue detection failed')
+            else:
+                self.jump_to_tissue_region(step)
+
+    def import_annotations(self):
+        """Load a GeoJSON annotation file (e.g. a QuPath export) onto the current slide"""
+        if not self.slide or self._is_closing:
+            QMessageBox.warning(self, "Warning", "No image loaded")
+            return
+        
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, 'Import Annotations', os.path.dirname(self.current_file_path),
+            'GeoJSON Files (*.geojson *.json);;All Files (*)')
+        if not file_path:
+            return
+        
+        from annotations import AnnotationStore
+        progress = QProgressDialog("Loading annotations...", "Cancel", 0, 100, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        
+        def report(fraction):
+            progress.setValue(int(fraction * 100))
+            return not progress.wasCanceled()
+        
+        try:
+            store = AnnotationStore.from_geojson(file_path, progress=report)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Could not load annotations:\n{e}")
+            return
+        finally:
+            progress.close()
+        if store is None:
+            return
+        
+        self.slide_annotations[self.current_file_path] = store
+        self.add_annotation_layers()
+        self.show_annotations_action.setChecked(True)
+        self.statusBar().showMessage(
+            f'Loaded {len(store)} annotations from {os.path.basename(file_path)}')
+
+    def import_detections(self):
+        """Load detected cells (points) of the current slide, shown as a density heatmap"""
+        if not self.slide or self._is_closing:
+            QMessageBox.warning(self, "Warning", "No image loaded")
+            return
+        
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, 'Import Cell Detections', os.path.dirname(self.current_file_path),
+            'Point Files (*.npy *.npz *.csv *.tsv *.geojson *.json);;All Files (*)')
+        if not file_path:
+            return
+        
+        from annotations import PointCloud
+        self.statusBar().showMessage('Loading cell detections...')
+        try:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                cloud = PointCloud.from_file(file_path)
+            finally:
+                QApplication.restoreOverrideCursor()
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Could not load cell detections:\n{e}")
+            return
+        
+        self.slide_point_clouds[self.current_file_path] = cloud
+        self.add_annotation_layers()
+        self.show_annotations_action.setChecked(True)
+        self.statusBar().showMessage(
+            f'Loaded {len(cloud)} cells from {os.path.basename(file_path)}')
+
+    def add_annotation_layers(self):
+        """Show the annotations and detected cells of the current slide, replacing previous layers"""
+        for layer in self.annotation_layers:
+            self.graphics_scene.removeItem(layer)
+        self.annotation_layers = []
+        if not self.slide:
+            return
+        
+        from annotations import AnnotationLayerItem, PointCloudLayerItem
+        width, height = self.slide.dimensions
+        bounds = QRectF(0, 0, width, height)
+        cloud = self.slide_point_clouds.get(self.current_file_path)
+        if cloud is not None:
+            self.annotation_layers.append(PointCloudLayerItem(cloud, bounds))
+        store = self.slide_annotations.get(self.current_file_path)
+        if store is not None:
+            self.annotation_layers.append(AnnotationLayerItem(store, bounds))
+        for layer in self.annotation_layers:
+            layer.setVisible(self.show_annotations_action.isChecked())
+            self.graphics_scene.addItem(layer)
+
+    def toggle_annotations(self, checked):
+        for layer in self.annotation_layers:
+            layer.setVisible(checked)
+
+    def jump_to_tissue_region(self, step):
+        """Fit the next (step 1) or previous (step -1) tissue region in the view"""
+        if not self.slide or self._is_closing or not self.tile_layers:
+            return
+        
+        try:
+            mask = self.tissue_mask()
+            if mask is None:
+                # Jumps once the mask computed in the background is ready
+                self.pending_tissue_jump = step
+                self.statusBar().showMessage('Detecting tissue...')
+                return
+            regions = mask.regions()
+            if not regions:
+                self.statusBar().showMessage('No tissue detected')
+                return
+            
+            self.tissue_region_index = (self.tissue_region_index + step) % len(regions)
+            x, y, width, height = regions[self.tissue_region_index]
+            # Leave a margin around the region
+            margin = 0.05 * max(width, height)
+            self.graphics_view.fitInView(QRectF(x - margin, y - margin, width + 2 * margin, height + 2 * margin),
+                                         Qt.KeepAspectRatio)
+            self.zoom_factor = self.graphics_view.transform().m11()
+            self.update_zoom_display()
+            self.update_visible_region()
+            self.statusBar().showMessage(f'Tissue region {self.tissue_region_index + 1} of {len(regions)}')
+        except Exception as e:
+            print(f"Error jumping to tissue region: {e}")
+
+    def toggle_process_decoding(self, checked):
+        """Switch tile decoding between thread pool threads and worker processes"""
+        try:
+            self.tile_manager.set_decode_backend('processes' if checked else 'threads')
+            self.statusBar().showMessage(
+                'Decoding tiles in worker processes' if checked else 'Decoding tiles on threads')
+        except Exception as e:
+            print(f"Error switching decode backend: {e}")
+            QMessageBox.critical(self, "Error", "Failed to switch the decode backend")
+
+    def choose_cached_level(self):
+        """Let the user pick a level to decode once into a memory-mapped file"""
+        if not self.slide or not self.current_file_path:
+            return
+        items = ['None']
+        default = 0
+        for level, (width, height) in enumerate(self.slide.level_dimensions):
+            size_mb = width * height * 4 / (1024 * 1024)
+            items.append(f'Level {level}: {width} x {height} ({size_mb:.0f} MB)')
+            # Suggest the finest level of a reasonable size, mid levels are revisited the most
+            if not default and size_mb <= 512:
+                default = level + 1
+        cache = self.tile_manager.level_cache
+        current = cache.level + 1 if cache else default
+        item, ok = QInputDialog.getItem(self, 'Cache Level on Disk',
+                                        'Decode a level once into a memory-mapped file:', items, current, False)
+        if not ok:
+            return
+        
+        self.progress_bar.hide()
+        level = items.index(item) - 1
+        if level < 0:
+            self.tile_manager.disable_level_cache()
+            self.statusBar().showMessage('Level cache off')
+            return
+        try:
+            filler = self.tile_manager.enable_level_cache(level)
+        except (OSError, ValueError) as e:
+            print(f"Error creating level cache: {e}")
+            QMessageBox.warning(self, "Warning", f"Could not cache level {level}: {e}")
+            return
+        if filler is None:
+            self.statusBar().showMessage(f'Level {level} read from the level cache')
+            return
+        filler.cells_filled.connect(self.on_level_cache_progress)
+        filler.finished.connect(lambda worker=filler: self.on_level_cache_finished(worker))
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.statusBar().showMessage(f'Caching level {level}...')
+    
+    def on_level_cache_progress(self, filled, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(filled)
+    
+    def on_level_cache_finished(self, filler):
+        current = self.tile_manager.level_cache_filler
+        if current is not None and current is not filler:
+            return  # Replaced by another level meanwhile
+        self.progress_bar.hide()
+        cache = self.tile_manager.level_cache
+        if cache and cache.fraction_filled() == 1.0:
+            self.statusBar().showMessage(f'Level {cache.level} cached')
+    
+    def stop_navigation_recording(self):
+        if not self.viewport_recorder:
+            return
+        recorder = self.viewport_recorder
+        self.viewport_recorder = None
+        recorder.close()
+        self.record_action.setChecked(False)
+        self.statusBar().showMessage(
+            f'Recorded {recorder.step_count} steps to {os.path.basename(recorder.path)}')
+
+    def on_tile_ready(self, level, x, y):
+        """Repaint the area of a freshly loaded tile"""
+        if self._is_closing or level >= len(self.tile_layers):
+            return
+        left, top, width, height = self.tile_manager.tile_rect(level, x, y)
+        self.tile_layers[level].update(QRectF(left, top, width, height))
 
     def update_thumbnail(self):
         if not self.slide or self._is_closing:
@@ -764,31 +3330,44 @@ class WSIImageViewer(QMainWindow):
                 scale = (1000000 / (thumb_size[0] * thumb_size[1])) ** 0.5
                 target_size = (int(thumb_size[0] * scale), int(thumb_size[1] * scale))
             
-            # Read image
-            img = self.slide.read_region((0, 0), level, self.slide.level_dimensions[level])
-            img = img.convert('RGB')  # Convert to RGB mode
-            
-            # Scale image
-            img = img.resize(target_size, Image.Resampling.LANCZOS)
-            
-            # Convert to QPixmap
-            img_data = img.tobytes('raw', 'RGB')
-            qimg = QImage(img_data, img.width, img.height, img.width * 3, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qimg)
+            img = read_level_scaled(self.slide, level, target_size)
             
-            # Save original thumbnail
-            self.thumbnail_pixmap = pixmap.copy()
-            
-            # Set thumbnail
-            self.thumbnail_label.setPixmap(pixmap)
-            
-            # Initial update of thumbnail box
-            self.update_thumbnail_box()
+            # Unadjusted pixels, display adjustments are applied on top
+            self.thumbnail_pixels = np.asarray(img)
+            self.show_thumbnail()
             
         except Exception as e:
             print(f"Error updating thumbnail: {str(e)}")
             self.statusBar().showMessage(f"Error updating thumbnail: {str(e)}")
 
+    def show_thumbnail(self):
+        """Display the thumbnail with the current display adjustment"""
+        if self.thumbnail_pixels is None or self._is_closing:
+            return
+        
+        pixels = self.thumbnail_pixels
+        adjustment = self.tile_manager.adjustment
+        if not adjustment.is_identity():
+            pixels = adjustment.apply(pixels)
+        
+        # Convert to QPixmap
+        height, width = pixels.shape[:2]
+        qimg = QImage(np.ascontiguousarray(pixels).tobytes(), width, height, width * 3, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(qimg)
+        
+        # Save original thumbnail
+        self.thumbnail_pixmap = pixmap.copy()
+        
+        # Original plus the copy with the view box drawn on it, and the unadjusted pixels
+        self.memory_governor.set_usage(
+            'thumbnail', 2 * pixmap.width() * pixmap.height() * pixmap.depth() // 8 + self.thumbnail_pixels.nbytes)
+        
+        # Set thumbnail
+        self.thumbnail_label.setPixmap(pixmap)
+        
+        # Initial update of thumbnail box
+        self.update_thumbnail_box()
+
     def update_thumbnail_box(self):
         if not self.slide or not hasattr(self, 'thumbnail_pixmap') or self._is_closing:
             return
@@ -808,17 +3387,12 @@ class WSIImageViewer(QMainWindow):
             thumb_height = pixmap.height()
             original_width, original_height = self.slide.dimensions
             
-            # Get current view region position in scene coordinates
+            # Get current view region position in scene (level 0) coordinates
             view_rect = self.graphics_view.mapToScene(self.graphics_view.viewport().rect()).boundingRect()
-            
-            # Get current level downsample ratio
-            level_scale = self.slide.level_downsamples[self.current_level]
-            
-            # Calculate current view position in level 0
-            view_x = view_rect.x() * level_scale
-            view_y = view_rect.y() * level_scale
-            view_width = view_rect.width() * level_scale
-            view_height = view_rect.height() * level_scale
+            view_x = view_rect.x()
+            view_y = view_rect.y()
+            view_width = view_rect.width()
+            view_height = view_rect.height()
             
             # Calculate thumbnail scale ratio (relative to original image)
             thumb_scale_x = thumb_width / original_width
@@ -867,14 +3441,8 @@ class WSIImageViewer(QMainWindow):
         if not self.slide or self._is_closing:
             return
             
-        # Get current level downsample ratio
-        level_scale = self.slide.level_downsamples[self.current_level]
-        
-        # Calculate actual zoom ratio (considering level downsample)
-        effective_zoom = self.zoom_factor / level_scale
-        
-        # Convert to percentage display
-        zoom_percentage = effective_zoom * 100
+        # Scene coordinates are level 0 pixels, so the view scale is the actual zoom ratio
+        zoom_percentage = self.zoom_factor * 100
         
         # Update zoom display
         self.zoom_value_label.setText(f'{zoom_percentage:.1f}%')
@@ -890,20 +3458,17 @@ class WSIImageViewer(QMainWindow):
         # Get current level downsample ratio
         level_scale = self.slide.level_downsamples[self.current_level]
         
-        # Calculate actual zoom ratio (considering level downsample)
-        effective_zoom = zoom_level / level_scale
-        
-        # Convert to percentage
-        zoom_percentage = effective_zoom * 100
+        # Scene coordinates are level 0 pixels, so the view scale is the actual zoom ratio
+        zoom_percentage = zoom_level * 100
         
         # Get current view region
         view_rect = self.graphics_view.mapToScene(self.graphics_view.viewport().rect()).boundingRect()
         
-        # Calculate actual position and size in level 0
-        x_level_0 = int(view_rect.x() * level_scale)
-        y_level_0 = int(view_rect.y() * level_scale)
-        width_level_0 = int(view_rect.width() * level_scale)
-        height_level_0 = int(view_rect.height() * level_scale)
+        # Position and size in level 0
+        x_level_0 = int(view_rect.x())
+        y_level_0 = int(view_rect.y())
+        width_level_0 = int(view_rect.width())
+        height_level_0 = int(view_rect.height())
         
         # Update status bar
         status_text = (f'Level: {self.current_level} | '
@@ -916,32 +3481,71 @@ class WSIImageViewer(QMainWindow):
     def eventFilter(self, obj, event):
         """Event filter, handle viewport changes"""
         if obj == self.graphics_view.viewport() and not self._is_closing:
+            # Drag and wheel gestures render in fast mode until input stops
+            if event.type() in [QEvent.MouseButtonPress, QEvent.MouseButtonRelease, QEvent.Wheel]:
+                self.begin_interaction()
+
+            # Mouse wheel zooms toward the cursor, 20% per notch
+            if event.type() == QEvent.Wheel and self.slide:
+                notches = event.angleDelta().y() / 120
+                if notches:
+                    self.animate_zoom(1.2 ** notches, event.pos())
+                return True
+            elif event.type() == QEvent.MouseMove and event.buttons() != Qt.NoButton:
+                self.begin_interaction()
+
             if event.type() in [QEvent.Resize, QEvent.MouseMove, QEvent.Wheel]:
-                # Update thumbnail box and status info
-                self.update_thumbnail_box()
-                self.update_status_info()
+                # Update displayed level, thumbnail box and status info
+                self.update_visible_region()
         return super().eventFilter(obj, event)
 
+    def begin_interaction(self, *args):
+        """Switch the view to fast rendering while the user is interacting"""
+        if self._is_closing:
+            return
+
+        if not self._interacting:
+            self._interacting = True
+            # Nearest-neighbour transforms and scroll-based partial updates
+            self.graphics_view.setRenderHint(QPainter.Antialiasing, False)
+            self.graphics_view.setRenderHint(QPainter.SmoothPixmapTransform, False)
+            self.graphics_view.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
+
+        # Restart idle countdown
+        self.interaction_timer.start()
+
+    def end_interaction(self):
+        """Restore smooth rendering and repaint once after input stops"""
+        if not self._interacting or self._is_closing:
+            return
+
+        self._interacting = False
+        self.graphics_view.setRenderHint(QPainter.Antialiasing, True)
+        self.graphics_view.setRenderHint(QPainter.SmoothPixmapTransform, True)
+        self.graphics_view.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+
+        # Single high quality repaint of the whole viewport
+        self.graphics_view.viewport().update()
+
     def zoom_in(self):
         """Zoom in"""
         if self._is_closing:
             return
         # Zoom in by 20%
-        self.set_zoom(self.zoom_factor * 1.2)
+        self.animate_zoom(1.2)
 
     def zoom_out(self):
         """Zoom out"""
         if self._is_closing:
             return
         # Zoom out to 83.33% of original (i.e., reduce by 16.67%)
-        self.set_zoom(self.zoom_factor / 1.2)
+        self.animate_zoom(1 / 1.2)
 
     def set_zoom(self, factor):
         if not self.slide or self._is_closing:
             return
             
-        # Limit zoom range (1% to 1000%)
-        factor = max(0.01, min(10.0, factor))
+        factor = self.clamp_zoom(factor)
         
         # Save current view center
         center = self.graphics_view.mapToScene(self.graphics_view.viewport().rect().center())
@@ -957,36 +3561,91 @@ class WSIImageViewer(QMainWindow):
         # Update zoom display
         self.update_zoom_display()
         
-        # Update status bar and thumbnail
-        self.update_status_info()
-        self.update_thumbnail_box()
+        # Update displayed level, status bar and thumbnail
+        self.update_visible_region()
         
         # Force view update
         self.graphics_view.viewport().update()
 
+    def clamp_zoom(self, factor):
+        """Limit zoom range (1% or fit to window, whichever is smaller, to 1000%)"""
+        return max(min(0.01, self.fit_zoom_factor()), min(10.0, factor))
+
+    def animate_zoom(self, step, anchor=None):
+        """Animate zoom by step, keeping the scene point under anchor (viewport position) fixed"""
+        if not self.slide or self._is_closing:
+            return
+        
+        # Consecutive wheel notches accumulate onto the running animation's target
+        running = self.zoom_animation.state() == QAbstractAnimation.Running
+        target = self.clamp_zoom((self._zoom_target if running else self.zoom_factor) * step)
+        self.zoom_animation.stop()
+        
+        if anchor is None:
+            anchor = self.graphics_view.viewport().rect().center()
+        self._zoom_anchor_view = QPoint(anchor)
+        self._zoom_anchor_scene = self.graphics_view.mapToScene(anchor)
+        self._zoom_start = self.zoom_factor
+        self._zoom_target = target
+        
+        # Issue the fetches for the destination view once, then paint intermediate
+        # frames from cached tiles of neighbouring levels without queueing loads
+        viewport = self.graphics_view.viewport().rect()
+        dest_rect = QRectF(self._zoom_anchor_scene.x() - anchor.x() / target,
+                           self._zoom_anchor_scene.y() - anchor.y() / target,
+                           viewport.width() / target, viewport.height() / target)
+        self.request_view_tiles(target, dest_rect)
+        self.tile_manager.cached_only = True
+        
+        self.begin_interaction()
+        self.zoom_animation.start()
+
+    def on_zoom_animation_step(self, progress):
+        """Apply an intermediate zoom factor (geometric interpolation)"""
+        if not self.slide or self._is_closing:
+            return
+        factor = self._zoom_start * (self._zoom_target / self._zoom_start) ** progress
+        
+        transform = QTransform()
+        transform.scale(factor, factor)
+        self.graphics_view.setTransform(transform)
+        
+        # Scroll so that the anchor scene point stays under the anchor position
+        offset = self.graphics_view.mapToScene(self._zoom_anchor_view) - self._zoom_anchor_scene
+        center = self.graphics_view.mapToScene(self.graphics_view.viewport().rect().center())
+        self.graphics_view.centerOn(center - offset)
+        
+        self.zoom_factor = factor
+        self.update_zoom_display()
+        self.update_visible_region()
+
+    def on_zoom_animation_finished(self):
+        """Resume normal tile loading at the destination scale"""
+        self.tile_manager.cached_only = False
+        if not self.slide or self._is_closing:
+            return
+        self.update_visible_region()
+        self.graphics_view.viewport().update()
+
+    def fit_zoom_factor(self):
+        """Zoom factor at which the whole slide fits the view"""
+        if not self.slide:
+            return 1.0
+        viewport = self.graphics_view.viewport().rect()
+        width, height = self.slide.dimensions
+        return min(viewport.width() / width, viewport.height() / height)
+
     def reset_zoom(self):
         """Reset to initial zoom level"""
         if not self.slide or self._is_closing or not self.graphics_scene:
             return
             
         try:
-            # Get image item from scene
-            items = self.graphics_scene.items()
-            if not items:
-                return
-                
-            # Find image item
-            image_item = None
-            for item in items:
-                if isinstance(item, QGraphicsPixmapItem):
-                    image_item = item
-                    break
-                    
-            if not image_item:
+            if not self.tile_layers:
                 return
                 
             # Re-fit to window size (return to initial state)
-            self.graphics_view.fitInView(image_item, Qt.KeepAspectRatio)
+            self.fit_view()
             
             # Get actual zoom factor
             transform = self.graphics_view.transform()
@@ -995,9 +3654,8 @@ class WSIImageViewer(QMainWindow):
             # Update zoom display
             self.update_zoom_display()
             
-            # Update status bar and thumbnail
-            self.update_status_info()
-            self.update_thumbnail_box()
+            # Update displayed level, status bar and thumbnail
+            self.update_visible_region()
             
             # Force view update
             self.graphics_view.viewport().update()
@@ -1018,23 +3676,34 @@ class WSIImageViewer(QMainWindow):
                 150                       # Thumbnail height
             )
             
-            # If scene is created, ensure image is fully displayed
+            # A view fitted to the window stays fitted, any other view keeps its
+            # centre (the resize anchor) and zoom
             if self.graphics_scene and self.graphics_scene.sceneRect().width() > 0:
-                # Re-fit to new window size
-                self.graphics_view.fitInView(self.graphics_scene.sceneRect(), Qt.KeepAspectRatio)
-                # Get actual zoom factor
-                transform = self.graphics_view.transform()
-                self.zoom_factor = transform.m11()
-                self.update_zoom_display()
-                self.update_thumbnail_box()
-                self.update_status_info()
+                if self.is_view_fitted():
+                    self.fit_view()
+                    # Get actual zoom factor
+                    transform = self.graphics_view.transform()
+                    self.zoom_factor = transform.m11()
+                    self.update_zoom_display()
+                self.update_visible_region()
 
     def closeEvent(self, event):
         """Close event handler"""
         try:
             self._is_closing = True
-            
-            # Close image
+            self.interaction_timer.stop()
+            self.zoom_animation.stop()
+            self.stop_navigation_recording()
+            self.remember_viewport()
+
+            # Stop tile loads and worker processes, then close image
+            if self.slide_library is not None:
+                self.slide_library.shutdown()
+            if self.catalog_scanner is not None:
+                self.catalog_scanner.stop()
+            if self.image_saver is not None:
+                self.image_saver.stop()
+            self.tile_manager.close()
             if self.slide:
                 self.slide.close()
                 self.slide = None
@@ -1047,10 +3716,13 @@ class WSIImageViewer(QMainWindow):
             event.accept()
 
     def save_thumbnail(self):
-        """Save WSI image at appropriate resolution"""
+        """Save WSI image at appropriate resolution, in the background"""
         if not self.slide or self._is_closing:
             QMessageBox.warning(self, "Warning", "No image loaded")
             return
+        if self.image_saver is not None:
+            QMessageBox.information(self, "Save Image", "An image is being saved already")
+            return
             
         try:
             # Calculate target level based on full image size
@@ -1069,100 +3741,179 @@ class WSIImageViewer(QMainWindow):
             # Get target dimensions
             target_width, target_height = self.slide.level_dimensions[target_level]
             
-            # Show progress dialog
-            progress = QProgressDialog("Saving image...", "Cancel", 0, 100, self)
-            progress.setWindowModality(Qt.WindowModal)
-            progress.setMinimumDuration(0)
-            progress.setValue(0)
+            # Get suggested filename
+            base_name = os.path.splitext(os.path.basename(self.current_file_path))[0]
+            suggested_name = f"{base_name}_full_L{target_level}_{target_width}x{target_height}"
             
-            try:
-                # Read the entire image at target level
-                region = self.slide.read_region(
-                    (0, 0),  # Start from top-left
-                    target_level,
-                    (target_width, target_height)
-                )
-                progress.setValue(50)
-                
-                if progress.wasCanceled():
-                    return
-                
-                # Convert to RGB
-                region = region.convert('RGB')
-                progress.setValue(70)
-                
-                if progress.wasCanceled():
-                    return
-                
-                # Convert PIL image to QImage
-                img_data = region.tobytes('raw', 'RGB')
-                img = QImage(
-                    img_data,
-                    region.width,
-                    region.height,
-                    region.width * 3,
-                    QImage.Format_RGB888
-                )
-                progress.setValue(80)
-                
-                if progress.wasCanceled():
-                    return
-                
-                # Add metadata to image
-                img.setText("Level", str(target_level))
-                img.setText("Downsample", f"{self.slide.level_downsamples[target_level]:.2f}x")
-                img.setText("Original Size", f"{dimensions[0]}x{dimensions[1]}")
-                img.setText("Original File", self.current_file_path)
-                img.setText("Image Size", f"{target_width}x{target_height}")
-                
-                # Get suggested filename
-                base_name = os.path.splitext(os.path.basename(self.current_file_path))[0]
-                suggested_name = f"{base_name}_full_L{target_level}_{target_width}x{target_height}"
-                
-                # Show save dialog with multiple format options
-                file_path, selected_filter = QFileDialog.getSaveFileName(
-                    self,
-                    'Save Full Image', 
-                    suggested_name,
-                    'PNG Files (*.png);;JPEG Files (*.jpg);;BMP Files (*.bmp);;TIFF Files (*.tiff);;All Files (*)'
-                )
-                
-                if file_path:
-                    # Determine format based on selected filter
-                    if 'PNG' in selected_filter:
-                        format = 'PNG'
-                    elif 'JPEG' in selected_filter:
-                        format = 'JPEG'
-                    elif 'BMP' in selected_filter:
-                        format = 'BMP'
-                    elif 'TIFF' in selected_filter:
-                        format = 'TIFF'
-                    else:
-                        format = 'PNG'  # Default to PNG
-                    
-                    progress.setValue(90)
-                    
-                    if progress.wasCanceled():
-                        return
-                    
-                    # Save image
-                    success = img.save(file_path, format)
-                    progress.setValue(100)
-                    
-                    if success:
-                        self.statusBar().showMessage(
-                            f'Saved full image: {os.path.basename(file_path)} '
-                            f'(Level {target_level}, {target_width}x{target_height})'
-                        )
-                    else:
-                        QMessageBox.critical(self, "Error", "Failed to save image")
+            file_path, format = self.ask_image_file('Save Full Image', suggested_name)
+            if not file_path or not self.check_image_size(format, target_width, target_height):
+                return
             
-            finally:
-                progress.close()
+            # Image metadata
+            metadata = {
+                "Level": str(target_level),
+                "Downsample": f"{self.slide.level_downsamples[target_level]:.2f}x",
+                "Original Size": f"{dimensions[0]}x{dimensions[1]}",
+                "Original File": self.current_file_path,
+                "Image Size": f"{target_width}x{target_height}",
+            }
+            
+            # Blocks without tissue are filled with the glass colour instead of being read.
+            # A mask not computed yet is computed by the saver
+            mask = self.tissue_masks[self.current_file_path] if self.current_file_path in self.tissue_masks else None
+            source = SlideLevelSource(self.current_file_path, target_level, mask)
+            self.start_image_saver(ImageSaver(source, file_path, format, metadata), "Saving image...")
             
         except Exception as e:
             print(f"Error saving image: {e}")
             QMessageBox.critical(self, "Error", "Failed to save image")
+    
+    def ask_image_file(self, title, suggested_name):
+        """Ask for an image file to save, returns (file path, format) or (None, None)"""
+        # Show save dialog with multiple format options
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self,
+            title,
+            suggested_name,
+            'PNG Files (*.png);;JPEG Files (*.jpg);;BMP Files (*.bmp);;TIFF Files (*.tiff);;All Files (*)'
+        )
+        if not file_path:
+            return None, None
+        
+        # Determine format based on selected filter
+        if 'PNG' in selected_filter:
+            format = 'PNG'
+        elif 'JPEG' in selected_filter:
+            format = 'JPEG'
+        elif 'BMP' in selected_filter:
+            format = 'BMP'
+        elif 'TIFF' in selected_filter:
+            format = 'TIFF'
+        else:
+            format = 'PNG'  # Default to PNG
+        return file_path, format
+    
+    def check_image_size(self, format, width, height):
+        """Warn and return False if an image can't be saved in a format, before any of it is read"""
+        from image_writer import check_image_size
+        try:
+            check_image_size(format, width, height)
+        except ValueError as e:
+            QMessageBox.warning(self, "Warning", str(e))
+            return False
+        return True
+    
+    def export_current_view(self):
+        """Save the visible region at a level or resolution of the user's choice, in the background"""
+        if not self.slide or self._is_closing or not self.tile_layers:
+            QMessageBox.warning(self, "Warning", "No image loaded")
+            return
+        if self.image_saver is not None:
+            QMessageBox.information(self, "Save Image", "An image is being saved already")
+            return
+        
+        # Visible region in level 0 pixels, clipped to the slide
+        view_rect = self.graphics_view.mapToScene(self.graphics_view.viewport().rect()).boundingRect()
+        slide_width, slide_height = self.slide.dimensions
+        view_rect = view_rect.intersected(QRectF(0, 0, slide_width, slide_height))
+        if view_rect.isEmpty():
+            return
+        left, top = int(view_rect.left()), int(view_rect.top())
+        rect = (left, top, min(slide_width, math.ceil(view_rect.right())) - left,
+                min(slide_height, math.ceil(view_rect.bottom())) - top)
+        
+        try:
+            mpp = float(self.slide.properties['openslide.mpp-x'])
+        except (KeyError, ValueError):
+            mpp = None
+        downsamples = self.slide.level_downsamples
+        items = []
+        for level, downsample in enumerate(downsamples):
+            width, height = round(rect[2] / downsample), round(rect[3] / downsample)
+            resolution = f', {mpp * downsample:.3f} µm/pixel' if mpp else ''
+            items.append(f'Level {level}: {width} x {height}{resolution} ({width * height * 3 / (1024 * 1024):.0f} MB)')
+        if mpp:
+            items.append('Other resolution (µm/pixel)...')
+        item, ok = QInputDialog.getItem(self, 'Export Current View', 'Resolution of the exported view:',
+                                        items, self.current_level, False)
+        if not ok:
+            return
+        choice = items.index(item)
+        if choice < len(downsamples):
+            level, downsample = choice, downsamples[choice]
+        else:
+            target_mpp, ok = QInputDialog.getDouble(self, 'Export Current View', 'Resolution in µm/pixel:',
+                                                    mpp * downsamples[self.current_level], mpp, mpp * 1024, 3)
+            if not ok:
+                return
+            downsample = target_mpp / mpp
+            # Read the coarsest level not coarser than the target and resize
+            level = max((index for index, value in enumerate(downsamples) if value <= downsample * 1.001),
+                        default=0)
+        
+        width, height = max(1, round(rect[2] / downsample)), max(1, round(rect[3] / downsample))
+        base_name = os.path.splitext(os.path.basename(self.current_file_path))[0]
+        suggested_name = f"{base_name}_view_{rect[0]}_{rect[1]}_{width}x{height}"
+        file_path, format = self.ask_image_file('Export Current View', suggested_name)
+        if not file_path or not self.check_image_size(format, width, height):
+            return
+        
+        metadata = {
+            "Level": str(level),
+            "Downsample": f"{downsample:.2f}x",
+            "Region": f"{rect[0]},{rect[1]} {rect[2]}x{rect[3]}",
+            "Original Size": f"{slide_width}x{slide_height}",
+            "Original File": self.current_file_path,
+            "Image Size": f"{width}x{height}",
+        }
+        if mpp:
+            metadata["Microns Per Pixel"] = f"{mpp * downsample:.4f}"
+        # The current display adjustment, as the view shows it
+        source = ViewportSource(self.current_file_path, rect, level, downsample, self.tile_manager,
+                                self.tile_manager.adjustment)
+        self.start_image_saver(ImageSaver(source, file_path, format, metadata), "Exporting view...")
+    
+    def start_image_saver(self, saver, label):
+        """Run an ImageSaver with a progress dialog that leaves the viewer usable"""
+        progress = QProgressDialog(label, "Cancel", 0, 100, self)
+        progress.setWindowModality(Qt.NonModal)
+        progress.setMinimumDuration(0)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.setValue(0)
+        progress.canceled.connect(saver.stop)
+        saver.progress.connect(self.on_save_progress)
+        saver.finished.connect(lambda saved, error, worker=saver: self.on_image_saved(worker, saved, error))
+        self.image_saver = saver
+        self.save_progress = progress
+        QThreadPool.globalInstance().start(TileLoadRunnable(saver))
+    
+    def on_save_progress(self, done, total):
+        if self.save_progress is not None:
+            self.save_progress.setMaximum(total)
+            self.save_progress.setValue(done)
+    
+    def on_image_saved(self, saver, saved, error):
+        self.image_saver = None
+        if self.save_progress is not None:
+            self.save_progress.close()
+            self.save_progress = None
+        if self._is_closing:
+            return
+        file_name = os.path.basename(saver.path)
+        if saved:
+            source = saver.source
+            message = f'Saved image: {file_name} ({source.width}x{source.height}'
+            if isinstance(source, SlideLevelSource):
+                message += f', level {source.level}, {source.skipped} of {source.blocks} background blocks skipped'
+            elif isinstance(source, ViewportSource):
+                message += f', level {source.level}, {len(source.tiles_reused)} of ' \
+                           f'{len(source.tiles_reused | source.tiles_read)} tiles reused from the view'
+            self.statusBar().showMessage(message + ')')
+        elif error:
+            QMessageBox.critical(self, "Error", f"Failed to save image: {error}")
+        else:
+            self.statusBar().showMessage(f'Saving {file_name} cancelled')
 
     def generate_metadata_text(self):
         """Generate formatted metadata text"""
@@ -1226,8 +3977,11 @@ Level {level}:
         # Add associated images
         if self.slide.associated_images:
             metadata_text += "\nAssociated Images\n----------------\n"
-            for name, img in self.slide.associated_images.items():
-                metadata_text += f"{name}: {img.size[0]} x {img.size[1]} pixels\n"
+            # Sizes come from the properties, as in display_metadata
+            for name in self.slide.associated_images:
+                width = self.slide.properties.get(f'openslide.associated.{name}.width', '?')
+                height = self.slide.properties.get(f'openslide.associated.{name}.height', '?')
+                metadata_text += f"{name}: {width} x {height} pixels\n"
         
         # Add export information
         metadata_text += f"\nExport Information\n-----------------\n"
@@ -1271,6 +4025,16 @@ Level {level}:
 def main():
     """Main function"""
     import sys
+    import multiprocessing
+    
+    # Worker processes of the process decode backend in frozen builds
+    multiprocessing.freeze_support()
+    
+    # Headless Deep Zoom tile server: wsi_viewer --serve slide.svs [...]
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        from dzi_server import main as serve_main
+        serve_main(sys.argv[2:])
+        return
     
     app = QApplication(sys.argv)
     app.setApplicationName("WSI Viewer")